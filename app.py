@@ -1,4 +1,6 @@
 import streamlit as st
+from utils.governor import GOVERNOR
+from utils.profiler import profiling_enabled
 
 if st.query_params.get("health") == "check":
     st.write("OK")
@@ -26,4 +28,13 @@ pages = {
 
 # Nawigacja
 pg = st.navigation(pages, position="top")
+
+# Zadania wszystkich użytkowników czekające na wspólne zasoby serwera
+queued = GOVERNOR.network.usage()['queued'] + GOVERNOR.workers.usage()['queued']
+if queued:
+    st.sidebar.caption(f"🚦 Serwer jest zajęty - zadań w kolejce: {queued}")
+
+# ?profile=1 - po długich operacjach strony pokazują profil z najdroższymi funkcjami
+if profiling_enabled():
+    st.sidebar.caption("🔬 Profilowanie włączone - wyniki pod raportem operacji")
 pg.run()
\ No newline at end of file
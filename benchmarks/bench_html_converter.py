@@ -0,0 +1,266 @@
+"""Benchmark i korpus wzorcowy konwertera opisów na HTML.
+
+Uruchomienie z katalogu głównego repozytorium:
+
+    python benchmarks/bench_html_converter.py                  # pomiar + porównanie z korpusem
+    python benchmarks/bench_html_converter.py --rows 50000     # większa próbka
+    python benchmarks/bench_html_converter.py --check          # tylko porównanie z korpusem
+    python benchmarks/bench_html_converter.py --update-golden  # zapis nowego korpusu wzorcowego
+
+Korpus wzorcowy zawiera wejścia i oczekiwany HTML dla każdej kombinacji opcji,
+więc przyspieszenie nie może niezauważenie zmienić wyniku.
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.html_converter import DEFAULT_OPTIONS, convert_series, text_to_html  # noqa: E402
+
+GOLDEN_PATH = Path(__file__).resolve().parent / 'golden_html.json'
+GOLDEN_ROWS = 40
+GOLDEN_SEED = 2024
+BENCH_ROWS = 10000
+BENCH_SEED = 7
+BENCH_SCALE = 4  # Korpus wzorcowy używa skali 1, żeby plik pozostał mały
+
+# ============================================
+# GENERATOR OPISÓW
+# ============================================
+
+WORDS = (
+    'książka autor wydanie oprawa miękka twarda strony format ilustracje seria tom opowieść historia '
+    'bohater przygoda powieść kryminał poradnik dzieci młodzież dorośli język polski tłumaczenie '
+    'wydawnictwo premiera nowość bestseller nagroda czytelnik rozdział mapa kolorowe zdjęcia papier '
+    'kredowy wymiary waga produkt zestaw gra planszowa puzzle elementów wiek gracze czas rozgrywki '
+    'instrukcja pudełko jakość wykonanie materiał bezpieczny certyfikat prezent święta urodziny'
+).split()
+COLON_HEADINGS = (
+    'Opis', 'Opis produktu', 'Cechy produktu', 'Dane techniczne', 'Zawartość zestawu',
+    'Dlaczego warto', 'O autorze', 'Spis treści', 'Specyfikacja', 'Wymiary i waga',
+)
+BULLETS = ('- ', '• ', '* ')
+NUMBERED = ('{}. ', '{}) ')
+
+
+def sentence(rng: random.Random, min_words: int = 5, max_words: int = 18, markers: bool = True) -> str:
+    """Zdanie z losowych słów, czasem z pogrubieniem lub kursywą."""
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    if markers and rng.random() < 0.35:
+        index = rng.randrange(len(words))
+        marker = rng.choice(('**', '__', '*', '_'))
+        words[index] = f"{marker}{words[index]}{marker}"
+    text = ' '.join(words)
+    return text[0].upper() + text[1:] + rng.choice(('.', '.', '.', '!', '?'))
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return ' '.join(sentence(rng) for _ in range(sentences))
+
+
+def list_block(rng: random.Random, items: int) -> list[str]:
+    if rng.random() < 0.6:
+        bullet = rng.choice(BULLETS)
+        return [bullet + sentence(rng, 2, 8) for _ in range(items)]
+    pattern = rng.choice(NUMBERED)
+    return [pattern.format(number) + sentence(rng, 2, 8) for number in range(1, items + 1)]
+
+
+def plain_description(rng: random.Random) -> str:
+    """Jeden akapit bez znaczników - najczęstszy przypadek w danych od dostawców."""
+    return ' '.join(sentence(rng, markers=False) for _ in range(rng.randint(1, 6)))
+
+
+def structured_description(rng: random.Random) -> str:
+    """Opis z nagłówkami, listami i formatowaniem."""
+    lines = []
+    for _ in range(rng.randint(1, 5)):
+        if rng.random() < 0.3:
+            lines.append('#' * rng.randint(1, 4) + ' ' + rng.choice(COLON_HEADINGS))
+        else:
+            lines.append(rng.choice(COLON_HEADINGS) + ':')
+        if rng.random() < 0.5:
+            lines.extend(list_block(rng, rng.randint(2, 8)))
+        else:
+            lines.extend(sentence(rng) for _ in range(rng.randint(1, 3)))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def long_description(rng: random.Random, scale: int) -> str:
+    """Bardzo długie akapity (opis wklejony z PDF-a wydawcy)."""
+    return '\n\n'.join(paragraph(rng, rng.randint(3, 6) * scale) for _ in range(rng.randint(2, 4)))
+
+
+PATHOLOGICAL_CASES = (
+    lambda rng, scale: '*' * (50 * scale) + ' tekst ' + '_' * (50 * scale),
+    lambda rng, scale: ' '.join(f"kod_produktu_{number}" for number in range(40 * scale)),
+    lambda rng, scale: '\r\n'.join(list_block(rng, 5)) + '\r\n\r\n' + sentence(rng),
+    lambda rng, scale: '\n'.join(list_block(rng, 100 * scale)),
+    lambda rng, scale: '\n'.join(['', '   ', '\t', '#', '##', '-', '1.', '•', ':'] * scale),
+    lambda rng, scale: 'x' * 58 + ':\n' + 'y' * 59 + ':\n' + 'z' * 60 + ':',
+    lambda rng, scale: '**' + sentence(rng) + '\n' + sentence(rng) + '**',
+    lambda rng, scale: ' '.join(f"*{word}* _{word}_ **{word}** __{word}__" for word in WORDS[:20 * scale]),
+    lambda rng, scale: 'Waga: 2.5 kg\nWymiary: 20 x 30 cm\n2024. Rok wydania\n10) Dziesiąty',
+    lambda rng, scale: '- ' + '\n- '.join('' for _ in range(10)),
+    lambda rng, scale: '####### Za dużo krzyżyków\n#BezSpacji\n- punkt:\n-bez spacji\n•\tpunkt',
+)
+
+
+def pathological_description(rng: random.Random, scale: int) -> str:
+    """Przypadki brzegowe: niesparowane znaczniki, CRLF, ogromne listy, podkreślenia w kodach."""
+    return rng.choice(PATHOLOGICAL_CASES)(rng, scale)
+
+
+def generate_descriptions(count: int, seed: int, scale: int = 1) -> list:
+    """Realistyczna mieszanka opisów; scale wydłuża długie i patologiczne przypadki."""
+    rng = random.Random(seed)
+    kinds = (
+        (0.45, plain_description),
+        (0.35, structured_description),
+        (0.08, lambda r: long_description(r, scale)),
+        (0.07, lambda r: pathological_description(r, scale)),
+    )
+    descriptions = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.05:
+            descriptions.append(rng.choice((None, '', '   ')))
+            continue
+        for weight, generator in kinds:
+            roll -= weight
+            if roll < 0:
+                break
+        descriptions.append(generator(rng))
+    return descriptions
+
+
+def option_combinations() -> list[dict]:
+    """Wszystkie kombinacje opcji (2^5)."""
+    names = list(DEFAULT_OPTIONS)
+    return [dict(zip(names, values)) for values in itertools.product((True, False), repeat=len(names))]
+
+
+def combination_label(options: dict) -> str:
+    """Krótki zapis kombinacji, np. '10110' - kolejność jak w DEFAULT_OPTIONS."""
+    return ''.join('1' if options[name] else '0' for name in DEFAULT_OPTIONS)
+
+
+# ============================================
+# KORPUS WZORCOWY
+# ============================================
+
+def build_golden() -> dict:
+    # Każdy przypadek brzegowy zawsze trafia do korpusu, reszta to losowa mieszanka
+    rng = random.Random(GOLDEN_SEED)
+    texts = [case(rng, 1) for case in PATHOLOGICAL_CASES] + generate_descriptions(GOLDEN_ROWS, GOLDEN_SEED)
+    cases = []
+    for text in texts:
+        # Wyniki bywają identyczne dla wielu kombinacji - zapis raz, kombinacje wskazują indeks
+        outputs: list[str] = []
+        combinations = {}
+        for options in option_combinations():
+            html = text_to_html(text, options)
+            if html not in outputs:
+                outputs.append(html)
+            combinations[combination_label(options)] = outputs.index(html)
+        cases.append({'text': text, 'outputs': outputs, 'combinations': combinations})
+    return {'seed': GOLDEN_SEED, 'options': list(DEFAULT_OPTIONS), 'cases': cases}
+
+
+def check_golden() -> int:
+    """Porównuje bieżący wynik z korpusem; zwraca liczbę rozbieżności."""
+    if not GOLDEN_PATH.exists():
+        print(f"❌ Brak korpusu wzorcowego {GOLDEN_PATH} - uruchom z --update-golden")
+        return 1
+    
+    golden = json.loads(GOLDEN_PATH.read_text(encoding='utf-8'))
+    texts = [case['text'] for case in golden['cases']]
+    mismatches = 0
+    for options in option_combinations():
+        # Pełny potok (ze ścieżką szybką dla zwykłych akapitów) musi dawać to samo co text_to_html
+        pipeline = convert_series(texts, options, workers=1)
+        for number, case in enumerate(golden['cases']):
+            expected = case['outputs'][case['combinations'][combination_label(options)]]
+            actual = text_to_html(case['text'], options)
+            if pipeline[number] != actual:
+                actual = f"{pipeline[number]!r} (potok) / {actual!r} (text_to_html)"
+            if actual != expected:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"❌ Przypadek {number}, opcje {combination_label(options)} ({options})")
+                    print(f"   wejście:   {case['text']!r:.200}")
+                    print(f"   oczekiwano: {expected!r:.200}")
+                    print(f"   otrzymano:  {actual!r:.200}")
+    
+    total = len(texts) * len(option_combinations())
+    if mismatches:
+        print(f"❌ Korpus wzorcowy: {mismatches}/{total} rozbieżności")
+    else:
+        print(f"✅ Korpus wzorcowy: {total} porównań zgodnych")
+    return mismatches
+
+
+# ============================================
+# POMIAR
+# ============================================
+
+def benchmark(rows: int, repeat: int) -> None:
+    texts = generate_descriptions(rows, BENCH_SEED, BENCH_SCALE)
+    chars = sum(len(text) for text in texts if text)
+    print(f"Opisy: {rows}, znaki: {chars:,}, powtórzenia: {repeat} (najlepszy czas)")
+    print(f"Opcje w kolejności: {', '.join(DEFAULT_OPTIONS)}")
+    print(f"{'opcje':<7} {'wiersze/s':>11} {'MB/s':>7} {'pamięć MB':>10} {'potok wiersze/s':>16}")
+    
+    for options in option_combinations():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in texts:
+                text_to_html(text, options)
+            best = min(best, time.perf_counter() - start)
+        
+        # Potok strony (ścieżka szybka dla zwykłych akapitów, jeden proces)
+        pipeline_best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            convert_series(texts, options, workers=1)
+            pipeline_best = min(pipeline_best, time.perf_counter() - start)
+        
+        # Osobny przebieg pod tracemalloc - śledzenie alokacji spowalnia pomiar czasu
+        tracemalloc.start()
+        results = [text_to_html(text, options) for text in texts]
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del results
+        
+        print(f"{combination_label(options):<7} {rows / best:>11,.0f} {chars / best / 1e6:>7.2f} {peak / 1e6:>10.1f} {rows / pipeline_best:>16,.0f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark i korpus wzorcowy text_to_html")
+    parser.add_argument('--rows', type=int, default=BENCH_ROWS, help="liczba opisów w pomiarze")
+    parser.add_argument('--repeat', type=int, default=3, help="liczba powtórzeń pomiaru czasu")
+    parser.add_argument('--check', action='store_true', help="tylko porównanie z korpusem wzorcowym")
+    parser.add_argument('--update-golden', action='store_true', help="zapisz korpus wzorcowy z bieżącego kodu")
+    args = parser.parse_args()
+    
+    if args.update_golden:
+        GOLDEN_PATH.write_text(json.dumps(build_golden(), ensure_ascii=False, indent=0), encoding='utf-8')
+        print(f"💾 Zapisano korpus wzorcowy: {GOLDEN_PATH}")
+        return 0
+    
+    mismatches = check_golden()
+    if not args.check:
+        benchmark(args.rows, args.repeat)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
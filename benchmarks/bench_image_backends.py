@@ -0,0 +1,176 @@
+"""Benchmark backendów obrazów (Pillow, opcjonalnie libvips).
+
+Uruchomienie z katalogu głównego repozytorium:
+
+    python benchmarks/bench_image_backends.py                    # pomiar na korpusie syntetycznym
+    python benchmarks/bench_image_backends.py --corpus okladki/  # własny katalog z obrazami
+
+Każda operacja jest wykonywana przez wszystkie dostępne backendy na tym samym korpusie.
+Zgodność backendów (wymiary, kanał alfa, średnia różnica pikseli względem Pillow) i niezmienniki
+operacji sprawdza pytest na tym samym korpusie i operacjach: tests/test_image_ops.py.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.image_convert import convert_image_sizes  # noqa: E402
+from utils.image_ops import add_white_background, available_backends, convert_to_png, normalize_image  # noqa: E402
+
+CORPUS_SEED = 11
+CORPUS_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff')
+
+# ============================================
+# KORPUS
+# ============================================
+
+
+def photo(rng: random.Random, size: tuple) -> Image.Image:
+    """Obraz przypominający zdjęcie okładki: gradient, szum i kilka kształtów"""
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    image = Image.merge('RGB', (gradient, gradient.rotate(90).resize(size), Image.new('L', size, 128)))
+    image = Image.blend(image, Image.effect_noise(size, 40).convert('RGB'), 0.3)
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x, y, x + rng.randrange(20, width // 3), y + rng.randrange(20, height // 3)), fill=color)
+    return image
+
+
+def with_alpha(image: Image.Image, opaque_margin: int) -> Image.Image:
+    """Przezroczysta ramka i półprzezroczyste przejście wokół obrazu"""
+    alpha = Image.new('L', image.size, 0)
+    draw = ImageDraw.Draw(alpha)
+    for step in range(0, 255, 15):
+        inset = opaque_margin - step * opaque_margin // 255
+        draw.rectangle((inset, inset, image.width - inset, image.height - inset), fill=step)
+    image = image.convert('RGBA')
+    image.putalpha(alpha)
+    return image
+
+
+def encode(image: Image.Image, save_format: str, **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=save_format, **options)
+    return output.getvalue()
+
+
+def synthetic_corpus() -> list:
+    """Typowe przypadki z pobierania okładek i konwertera - (nazwa, bajty)"""
+    rng = random.Random(CORPUS_SEED)
+    cover = photo(rng, (1600, 2400))
+    small = photo(rng, (600, 900))
+    transparent = with_alpha(small, 120)
+    opaque_alpha = small.convert('RGBA')  # Kanał alfa zapisany, ale nieużywany
+    palette = transparent.convert('P', palette=Image.Palette.ADAPTIVE)
+    palette.info['transparency'] = 0
+    return [
+        ('okladka_duza.jpg', encode(cover, 'JPEG', quality=90)),
+        ('okladka.jpg', encode(small, 'JPEG', quality=90)),
+        ('szarosc.jpg', encode(small.convert('L'), 'JPEG', quality=90)),
+        ('okladka.png', encode(small, 'PNG')),
+        ('przezroczysta.png', encode(transparent, 'PNG')),
+        ('alfa_nieuzywana.png', encode(opaque_alpha, 'PNG')),
+        ('paleta_przezroczysta.png', encode(palette, 'PNG')),
+        ('przezroczysta.webp', encode(transparent, 'WEBP', quality=85)),
+        ('okladka_duza.webp', encode(cover, 'WEBP', quality=85)),
+    ]
+
+
+def load_corpus(directory: str) -> list:
+    return [
+        (path.name, path.read_bytes())
+        for path in sorted(Path(directory).iterdir())
+        if path.suffix.lower() in CORPUS_EXTENSIONS
+    ]
+
+# ============================================
+# OPERACJE
+# ============================================
+
+SIZES = (('800', 800, 800), ('300', 300, 300))
+NORMALIZE_SPEC = {'max_width': 1000, 'max_height': 1000, 'mode': None}
+
+# Nazwa: (funkcja bajty -> {etykieta: bajty}, czy stratna, czy wynik może mieć przezroczystość)
+OPERATIONS = {
+    'białe tło': (lambda data: {'wynik': add_white_background(data)}, False, False),
+    'PNG bez przezroczystości': (lambda data: {'wynik': convert_to_png(data, remove_transparency=True)[0]}, False, False),
+    'PNG z przezroczystością': (lambda data: {'wynik': convert_to_png(data)[0]}, False, True),
+    'JPG q85 800/300 px': (lambda data: convert_image_sizes(data, 'JPG', 85, SIZES), True, False),
+    'WEBP q80 800/300 px wypełnij': (
+        lambda data: convert_image_sizes(data, 'WEBP', 80, SIZES, fill=True, effort=4), True, True
+    ),
+    'normalizacja JPG 1000 px': (
+        lambda data: {'wynik': normalize_image(data, NORMALIZE_SPEC, '.jpg')[0]}, True, False
+    ),
+}
+
+
+@contextmanager
+def forced_backend(name: str):
+    """Wymusza backend przez IMAGE_BACKEND - ta sama ścieżka wyboru co w aplikacji"""
+    previous = os.environ.get('IMAGE_BACKEND')
+    os.environ['IMAGE_BACKEND'] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('IMAGE_BACKEND', None)
+        else:
+            os.environ['IMAGE_BACKEND'] = previous
+
+
+def run_operation(backend: str, operation: str, corpus: list) -> dict:
+    function = OPERATIONS[operation][0]
+    with forced_backend(backend):
+        return {name: function(data) for name, data in corpus}
+
+# ============================================
+# POMIAR
+# ============================================
+
+
+def benchmark(corpus: list, repeat: int) -> None:
+    input_mb = sum(len(data) for _, data in corpus) / (1024 * 1024)
+    print(f"\nKorpus: {len(corpus)} plików, {input_mb:.1f} MB, powtórzenia: {repeat}")
+    for operation in OPERATIONS:
+        timings = {}
+        for backend in available_backends():
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run_operation(backend.name, operation, corpus)
+                best = min(best, time.perf_counter() - start)
+            timings[backend.name] = best
+        line = ' | '.join(
+            f"{name}: {seconds * 1000:8.1f} ms ({len(corpus) / seconds:6.1f} plików/s, {input_mb / seconds:5.1f} MB/s)"
+            for name, seconds in timings.items()
+        )
+        if len(timings) > 1:
+            line += f" | vips/pillow ×{timings['pillow'] / timings['vips']:.2f}"
+        print(f"{operation:<30} | {line}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Wydajność backendów obrazów")
+    parser.add_argument('--corpus', help="katalog z obrazami zamiast korpusu syntetycznego")
+    parser.add_argument('--repeat', type=int, default=3, help="liczba powtórzeń pomiaru czasu")
+    args = parser.parse_args()
+    
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    benchmark(corpus, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,10 +5,22 @@ import os
 from pathlib import Path
 from urllib.parse import urlparse
 import time
-from PIL import Image
-import io
+import random
+import json
+import statistics
+import threading
+import tempfile
+import shutil
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import zipfile
 from datetime import datetime
+from utils.image_guard import ImageRejectedError
+from utils.image_ops import add_white_background, convert_to_png, normalize_image
+from utils.profiler import profile_run, show_profile
+from utils.governor import GOVERNOR, BUFFER_WAIT_TIMEOUT, AdmissionCancelledError, AdmissionTimeoutError, queue_notice
 
 st.set_page_config(
     page_title="Pobieranie okładek",
@@ -39,109 +51,699 @@ st.markdown("""
 
 # STAŁE KONFIGURACYJNE
 DELAY_BETWEEN_DOWNLOADS = 1.0
-TIMEOUT = 30
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+ITEM_DEADLINE = 120
+HEDGE_PERCENTILE = 90
+HEDGE_MIN_SAMPLES = 10
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 120.0
+CIRCUIT_MAX_PROBES = 3  # Po tylu nieudanych próbach half-open pozostałe wiersze hosta są pomijane
+MAX_WORKERS = 8
+MAX_HOST_CONCURRENCY = 4
+HOST_HISTORY_SIZE = 200
+DEFAULT_HOST_LATENCY = 2.0
+HOST_PROFILE_PATH = Path(__file__).resolve().parent.parent / '.cache' / 'host_profiles.json'
+PREFLIGHT_TIMEOUT = 10
+PREFLIGHT_WORKERS = 32
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
 ALLOWED_FORMATS = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
 DEFAULT_FORMAT = '.jpg'
+NORMALIZE_FORMATS = {'JPG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+NORMALIZE_MODES = {'RGB': 'RGB', 'Skala szarości': 'L'}
 
-def has_transparency(image):
-    """Sprawdza czy obraz ma przezroczystość"""
-    if image.mode in ('RGBA', 'LA'):
-        # Sprawdź czy faktycznie używa przezroczystości
-        if image.mode == 'RGBA':
-            alpha = image.split()[-1]
-            if alpha.getextrema() != (255, 255):
+class DeadlineExceededError(Exception):
+    """Przekroczono łączny limit czasu pobierania pojedynczego pliku"""
+
+class DownloadCancelledError(Exception):
+    """Pobieranie przerwane (limit czasu zadania lub wygrało równoległe żądanie)"""
+
+def pobierz_obraz(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), deadline=None, cancel_events=(), buffer=None):
+    """Pobiera obraz z URL (osobne limity połączenia i odczytu, łączny deadline, możliwość przerwania).
+    
+    buffer (rezerwacja z GOVERNOR.buffers.hold()) - przed odczytem treści rezerwuje rozmiar
+    z Content-Length, a bajty ponad niego dolicza w trakcie odczytu; przy błędzie je oddaje.
+    """
+    with requests.get(url, headers=REQUEST_HEADERS, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        counted = 0
+        if buffer is not None:
+            content_length = response.headers.get('Content-Length', '')
+            counted = int(content_length) if content_length.isdigit() else 0
+            # Oczekiwanie na miejsce nie może przekroczyć limitu czasu pliku i kończy się z przerwaniem zadania
+            wait_limit = BUFFER_WAIT_TIMEOUT
+            if deadline is not None:
+                wait_limit = min(wait_limit, max(0.0, deadline - time.monotonic()))
+            try:
+                buffer.reserve(counted, timeout=wait_limit, cancel_events=cancel_events)
+            except AdmissionCancelledError:
+                raise DownloadCancelledError("Pobieranie przerwane")
+        return odczytaj_tresc(response, url, deadline, cancel_events, buffer, counted)
+
+def odczytaj_tresc(response, url, deadline, cancel_events, buffer=None, counted=0):
+    """Czyta treść odpowiedzi fragmentami, doliczając do bufora bajty ponad zarezerwowane (counted)"""
+    received = 0
+    try:
+        # Limit odczytu dotyczy pojedynczego odczytu z gniazda - wolno sączącą się odpowiedź
+        # ogranicza dopiero deadline sprawdzany po każdym fragmencie. read1 zwraca dane, gdy tylko
+        # nadejdą, zamiast czekać na zapełnienie całego fragmentu
+        read1 = getattr(response.raw, 'read1', None)
+        if read1 is not None:
+            stream = iter(lambda: read1(DOWNLOAD_CHUNK_SIZE, decode_content=True), b'')
+        else:
+            stream = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+        
+        chunks = []
+        for chunk in stream:
+            if any(event.is_set() for event in cancel_events):
+                raise DownloadCancelledError("Pobieranie przerwane")
+            if deadline is not None and time.monotonic() > deadline:
+                raise DeadlineExceededError(f"Przekroczono limit czasu pobierania pliku ({url})")
+            chunks.append(chunk)
+            received += len(chunk)
+            if buffer is not None and received > counted:
+                buffer.add(received - counted)
+                counted = received
+        return b''.join(chunks)
+    except BaseException:
+        if buffer is not None and counted > 0:
+            buffer.release(counted)
+        raise
+
+def pobierz_obraz_z_hedgingiem(url, executor, hedge_after, hedge_info, timeout, deadline=None, cancel_event=None,
+                               buffer=None):
+    """Gdy żądanie trwa dłużej niż hedge_after sekund, wysyła drugie - wygrywa pierwsza poprawna odpowiedź"""
+    loser_event = threading.Event()
+    cancel_events = (loser_event, cancel_event) if cancel_event else (loser_event,)
+    futures = {executor.submit(pobierz_obraz, url, timeout, deadline, cancel_events, buffer)}
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done:
+        hedge_info['fired'] = True
+        hedge_future = executor.submit(pobierz_obraz, url, timeout, deadline, cancel_events, buffer)
+        futures.add(hedge_future)
+    
+    last_error = None
+    while futures:
+        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                loser_event.set()
+                hedge_info['won'] = hedge_info['fired'] and future is hedge_future
+                return future.result()
+            last_error = future.exception()
+    raise last_error
+
+class HostUnavailableError(Exception):
+    """Host wyłączony przez circuit breaker - wiersz pominięty bez próby pobrania"""
+    def __init__(self, host):
+        super().__init__(f"Host {host} niedostępny (circuit breaker otwarty)")
+        self.host = host
+
+class CircuitBreaker:
+    """Circuit breaker per host: po serii błędów przejściowych odcina host, a po czasie wpuszcza próbę"""
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 max_probes=CIRCUIT_MAX_PROBES):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_probes = max_probes
+        self.failures = {}
+        self.opened_at = {}
+        self.probes = {}
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        """Sprawdza czy można wysłać żądanie do hosta"""
+        with self.lock:
+            opened = self.opened_at.get(host)
+            if opened is None:
                 return True
-        elif image.mode == 'LA':
-            alpha = image.split()[-1]
-            if alpha.getextrema() != (255, 255):
+            if self.probes.get(host, 0) >= self.max_probes:
+                return False
+            if time.monotonic() - opened >= self.reset_timeout:
+                # Half-open: przepuść jedną próbę, kolejne czekają na jej wynik
+                self.opened_at[host] = time.monotonic()
+                self.probes[host] = self.probes.get(host, 0) + 1
                 return True
-    elif image.mode == 'P':
-        # Sprawdź czy paleta ma przezroczystość
-        if 'transparency' in image.info:
-            return True
-    return False
-
-def add_white_background(image_bytes):
-    """Dodaje białe tło do obrazu z przezroczystością"""
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
+            return False
+
+    def retry_at(self, host):
+        """Moment (time.monotonic), od którego host przyjmie próbę half-open; None - host dostępny"""
+        with self.lock:
+            opened = self.opened_at.get(host)
+            return None if opened is None else opened + self.reset_timeout
+
+    def gave_up(self, host):
+        """Czy wyczerpano próby half-open - host pozostaje wyłączony do końca zadania"""
+        with self.lock:
+            return host in self.opened_at and self.probes.get(host, 0) >= self.max_probes
+
+    def record_success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened_at.pop(host, None)
+            self.probes.pop(host, None)
+
+    def record_failure(self, host):
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.failure_threshold:
+                self.opened_at[host] = time.monotonic()
+
+def is_transient_error(error):
+    """Sprawdza czy błąd jest przejściowy (warto ponowić)"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    ))
+
+def backoff_delay(attempt, error=None):
+    """Czas oczekiwania przed kolejną próbą (wykładniczy z pełnym jitterem, respektuje Retry-After)"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        retry_after = error.response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def pobierz_obraz_z_ponowieniami(url, breaker, max_retries=MAX_RETRIES, fetch=None, deadline=None):
+    """Pobiera obraz z ponowieniami dla błędów przejściowych. Zwraca (dane, liczba_ponowień)"""
+    host = get_host(url)
+    fetch = fetch or pobierz_obraz
+    attempt = 0
+    last_error = None
+    while True:
+        if not breaker.allow(host):
+            # Wiersz, który już próbował (np. jako próba half-open), kończy się własnym błędem
+            raise last_error or HostUnavailableError(host)
+        try:
+            data = fetch(url)
+        except DeadlineExceededError:
+            # Wolny host też świadczy o problemie, ale na ponowienie nie ma już czasu
+            breaker.record_failure(host)
+            raise
+        except Exception as e:
+            if not is_transient_error(e):
+                if isinstance(e, requests.HTTPError) and e.response is not None:
+                    # Host odpowiada (np. 404 dla brakującej okładki) - próba half-open zamyka breaker
+                    breaker.record_success(host)
+                raise
+            breaker.record_failure(host)
+            delay = backoff_delay(attempt, e)
+            if attempt >= max_retries or (deadline is not None and time.monotonic() + delay > deadline):
+                raise
+            last_error = e
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success(host)
+        return data, attempt
+
+def get_host(url):
+    """Zwraca nazwę hosta z URL (klucz dla statystyk i circuit breakera)"""
+    return urlparse(str(url)).netloc.lower()
+
+_host_profile_lock = threading.Lock()
+
+@contextmanager
+def locked_file(path):
+    """Blokada pliku wspólna dla wątków (sesji) i procesów - na czas odczytu, scalenia i zapisu"""
+    with _host_profile_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a+b') as lock_file:
+            try:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except ImportError:
+                # Windows - blokada pierwszego bajtu pliku
+                import msvcrt
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            yield
+
+def empty_host_entry():
+    return {
+        'latency': [],
+        'throughput': [],
+        'outcomes': [],
+        'concurrency': 1
+    }
+
+class HostProfileStore:
+    """Lokalna baza statystyk hostów z poprzednich uruchomień: opóźnienie, przepustowość, błędy, współbieżność"""
+    def __init__(self, path=HOST_PROFILE_PATH):
+        self.path = Path(path)
+        self.run_counters = {}
+        self.run_samples = {}  # Próbki bieżącego przebiegu - dopisywane do bazy przy zapisie
+        self.hosts = self._read()
+
+    def _read(self):
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _entry(self, host):
+        return self.hosts.setdefault(host, empty_host_entry())
+
+    @staticmethod
+    def _append(entry, samples):
+        for key, values in samples.items():
+            entry[key] = (entry[key] + values)[-HOST_HISTORY_SIZE:]
+
+    def record(self, host, ok, latency=None, size=None, throttled=False):
+        """Zapisuje wynik pojedynczego pobrania"""
+        samples = {'latency': [], 'throughput': [], 'outcomes': [1 if ok else 0]}
+        if ok and latency is not None:
+            samples['latency'].append(round(latency, 3))
+            if size and latency > 0:
+                samples['throughput'].append(round(size / latency))
+        self._append(self._entry(host), samples)
+        self._append(self.run_samples.setdefault(host, {'latency': [], 'throughput': [], 'outcomes': []}), samples)
+        
+        run = self.run_counters.setdefault(host, {'requests': 0, 'errors': 0, 'throttled': 0})
+        run['requests'] += 1
+        run['errors'] += 0 if ok else 1
+        run['throttled'] += 1 if throttled else 0
+
+    def summary(self, host):
+        """Zwraca podsumowanie statystyk hosta lub None jeśli host jest nieznany"""
+        entry = self.hosts.get(host)
+        if not entry or not entry['outcomes']:
+            return None
+        return {
+            'median_latency': statistics.median(entry['latency']) if entry['latency'] else None,
+            'throughput': statistics.median(entry['throughput']) if entry['throughput'] else None,
+            'error_rate': 1 - sum(entry['outcomes']) / len(entry['outcomes']),
+            'concurrency': entry['concurrency'],
+            'samples': len(entry['outcomes'])
+        }
+
+    def expected_latency(self, host):
+        entry = self.hosts.get(host)
+        if entry and entry['latency']:
+            return statistics.median(entry['latency'])
+        return DEFAULT_HOST_LATENCY
+
+    def latency_percentile(self, host, percentile=HEDGE_PERCENTILE):
+        """Percentyl czasu pobrania hosta lub None, gdy historia jest zbyt krótka"""
+        entry = self.hosts.get(host)
+        if not entry or len(entry['latency']) < HEDGE_MIN_SAMPLES:
+            return None
+        return statistics.quantiles(entry['latency'], n=100)[percentile - 1]
+
+    def concurrency(self, host):
+        entry = self.hosts.get(host)
+        return entry['concurrency'] if entry else 1
+
+    def save(self):
+        """Dopisuje próbki bieżącego przebiegu do aktualnej bazy, dostosowuje współbieżność i zapisuje.
+        
+        Inne sesje mogły w tym czasie zapisać własne statystyki - baza jest czytana ponownie
+        i scalana pod blokadą pliku, a nie nadpisywana stanem z chwili otwarcia strony.
+        """
+        try:
+            with locked_file(self.path.with_name(self.path.name + '.lock')):
+                hosts = self._read()
+                for host, samples in self.run_samples.items():
+                    self._append(hosts.setdefault(host, empty_host_entry()), samples)
+                for host, run in self.run_counters.items():
+                    entry = hosts.setdefault(host, empty_host_entry())
+                    if run['throttled']:
+                        entry['concurrency'] = max(1, entry['concurrency'] - 1)
+                    elif run['requests'] >= 10 and run['errors'] / run['requests'] < 0.05:
+                        entry['concurrency'] = min(MAX_HOST_CONCURRENCY, entry['concurrency'] + 1)
+                
+                # Unikalny plik tymczasowy w tym samym katalogu - os.replace jest wtedy atomowe
+                handle, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.stem, suffix='.tmp')
+                try:
+                    with os.fdopen(handle, 'w', encoding='utf-8') as tmp_file:
+                        json.dump(hosts, tmp_file)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    Path(tmp_path).unlink(missing_ok=True)
+                    raise
+        except OSError:
+            # Brak możliwości zapisu nie może przerwać pobierania
+            return
+        self.hosts = hosts
+        self.run_counters = {}
+        self.run_samples = {}
+
+class HostScheduler:
+    """Kolejki zadań per host - najpierw hosty o najdłuższym przewidywanym czasie, szybkie hosty przeplatane.
+    
+    Host wyłączony przez circuit breaker czeka z całą kolejką do upływu reset_timeout, po czym
+    dostaje jedno zadanie jako próbę half-open - kolejne ruszają dopiero po jej powodzeniu.
+    """
+    def __init__(self, tasks, profiles, delay=DELAY_BETWEEN_DOWNLOADS, breaker=None):
+        self.profiles = profiles
+        self.delay = delay
+        self.breaker = breaker
+        self.queues = {}
+        self.in_flight = {}
+        self.next_allowed = {}
+        for task in tasks:
+            self.queues.setdefault(task['host'], deque()).append(task)
+
+    def remaining_time(self, host):
+        """Przewidywany czas potrzebny na pozostałe zadania hosta"""
+        per_item = self.profiles.expected_latency(host) + self.delay
+        return len(self.queues[host]) * per_item / self.profiles.concurrency(host)
+
+    def has_pending(self):
+        return any(self.queues.values())
+
+    def _slots(self, host):
+        """Ile zadań hosta może trwać równocześnie - przy otwartym breakerze tylko jedna próba"""
+        if self.breaker is not None and self.breaker.retry_at(host) is not None and not self.breaker.gave_up(host):
+            return 1
+        return self.profiles.concurrency(host)
+
+    def _available_at(self, host):
+        available = self.next_allowed.get(host, 0)
+        if self.breaker is not None and not self.breaker.gave_up(host):
+            available = max(available, self.breaker.retry_at(host) or 0)
+        return available
+
+    def _ready_hosts(self, now):
+        return [
+            host for host, queue in self.queues.items()
+            if queue
+            and self.in_flight.get(host, 0) < self._slots(host)
+            and self._available_at(host) <= now
+        ]
+
+    def next_ready(self, free_slots):
+        """Zwraca do free_slots zadań gotowych do uruchomienia"""
+        now = time.monotonic()
+        ready = []
+        while len(ready) < free_slots:
+            hosts = self._ready_hosts(now)
+            if not hosts:
+                break
+            host = max(hosts, key=self.remaining_time)
+            ready.append(self.queues[host].popleft())
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+        return ready
+
+    def drain(self):
+        """Usuwa z kolejek wszystkie nierozpoczęte zadania i je zwraca"""
+        remaining = [task for queue in self.queues.values() for task in queue]
+        for queue in self.queues.values():
+            queue.clear()
+        return remaining
+
+    def task_done(self, task, success):
+        host = task['host']
+        self.in_flight[host] -= 1
+        if success:
+            self.next_allowed[host] = time.monotonic() + self.delay
+
+    def requeue(self, task):
+        """Zwraca nierozpoczęte zadanie na początek kolejki hosta (np. host chwilowo wyłączony)"""
+        self.queues[task['host']].appendleft(task)
+
+    def wait_time(self):
+        """Czas do momentu, w którym któryś host znów będzie mógł przyjąć żądanie (None - tylko po zakończeniu zadania)"""
+        now = time.monotonic()
+        pending = [
+            self._available_at(host) - now
+            for host, queue in self.queues.items()
+            if queue and self.in_flight.get(host, 0) < self._slots(host)
+        ]
+        return max(0.05, min(pending)) if pending else None
+
+def estimate_job_duration(tasks, profiles, workers=MAX_WORKERS, delay=DELAY_BETWEEN_DOWNLOADS):
+    """Szacuje czas pobierania (s) na podstawie historycznych statystyk hostów"""
+    counts = {}
+    for task in tasks:
+        counts[task['host']] = counts.get(task['host'], 0) + 1
+    if not counts:
+        return 0.0
+    
+    host_work = {host: n * (profiles.expected_latency(host) + delay) for host, n in counts.items()}
+    slowest_host = max(work / profiles.concurrency(host) for host, work in host_work.items())
+    return max(slowest_host, sum(host_work.values()) / workers)
+
+def format_duration(seconds):
+    """Formatuje czas w sekundach jako czytelny tekst"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} s"
+    if seconds < 3600:
+        return f"{seconds // 60} min {seconds % 60} s"
+    return f"{seconds // 3600} h {seconds % 3600 // 60} min"
+
+def plan_downloads(df, ean_column, link_column, ean_filter_set, convert_webp, overwrite, normalize_spec=None):
+    """Przygotowuje listę zadań pobierania i wyniki wstępnej filtracji wierszy (bez pobierania)"""
+    plan = {
+        'tasks': [],
+        'puste_wiersze': 0,
+        'nieznalezione_ean': 0,
+        'istnieje': 0,
+        'pdf_eans': [],
+        'found_eans': set(),
+        'errors': []
+    }
+    planned_files = set()
+    
+    for row_idx, (ean, link) in enumerate(zip(df[ean_column], df[link_column])):
+        if pd.isna(link) or pd.isna(ean):
+            plan['puste_wiersze'] += 1
+            continue
         
-        # Sprawdź czy obraz ma przezroczystość
-        if not has_transparency(image):
-            # Obraz nie ma przezroczystości, zwróć oryginalny
-            return image_bytes
+        try:
+            ean = str(int(float(ean))).strip().replace(' ', '')
+        except (ValueError, OverflowError):
+            ean = str(ean).strip().replace(' ', '')
         
-        # Konwertuj do RGBA jeśli potrzeba
-        if image.mode != 'RGBA':
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            elif image.mode == 'LA':
-                image = image.convert('RGBA')
+        if ean_filter_set:
+            if ean not in ean_filter_set:
+                plan['nieznalezione_ean'] += 1
+                continue
+            plan['found_eans'].add(ean)
         
-        # Utwórz białe tło
-        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        if '.pdf' in str(link).lower():
+            plan['pdf_eans'].append(ean)
+            continue
         
-        # Złącz obraz z tłem
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        try:
+            extension = os.path.splitext(urlparse(str(link)).path)[1].lower()
+        except ValueError as e:
+            plan['errors'].append(f"EAN: {ean} | Błąd: {str(e)}")
+            continue
         
-        # Konwertuj do RGB (usuń kanał alpha)
-        final_image = background.convert('RGB')
+        if not extension or extension not in ALLOWED_FORMATS:
+            extension = DEFAULT_FORMAT
         
-        # Zapisz do bytes
-        output = io.BytesIO()
-        # Zachowaj format oryginalny jeśli to możliwe
-        format_to_save = 'JPEG' if image.format in ['JPEG', 'JPG'] else 'PNG'
-        final_image.save(output, format=format_to_save, quality=95, optimize=True)
-        return output.getvalue()
+        if normalize_spec and normalize_spec.get('extension'):
+            output_extension = normalize_spec['extension']
+        elif convert_webp and extension == '.webp':
+            output_extension = '.png'
+        else:
+            output_extension = extension
+        filename = f"{ean}{output_extension}"
         
-    except Exception as e:
-        # W razie błędu zwróć oryginalny obraz
-        return image_bytes
-
-def convert_webp_to_png(image_bytes, remove_transparency=False):
-    """Konwertuje obraz WebP na PNG z opcjonalnym usunięciem przezroczystości"""
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
+        if filename in planned_files and not overwrite:
+            plan['istnieje'] += 1
+            continue
+        planned_files.add(filename)
         
-        # Jeśli ma usunąć przezroczystość i obraz ją ma
-        if remove_transparency and has_transparency(image):
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-            
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[-1])
-            image = background
-        elif image.mode in ('RGBA', 'LA'):
-            # Zachowaj przezroczystość ale konwertuj format
-            pass
+        plan['tasks'].append({
+            'row': row_idx,
+            'ean': ean,
+            'link': link,
+            'host': get_host(link),
+            'extension': extension,
+            'output_extension': output_extension,
+            'filename': filename
+        })
+    
+    return plan
+
+def pobierz_i_przetworz(task, breaker, max_retries, handle_transparency, convert_webp, normalize_spec=None,
+                        limits=None, hedge_executor=None, cancel_event=None):
+    """Pobiera i przetwarza jeden obraz (uruchamiane w wątku roboczym, bez wywołań Streamlit)"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise DownloadCancelledError("Pobieranie przerwane")
+    
+    limits = limits or {}
+    timeout = (limits.get('connect_timeout', CONNECT_TIMEOUT), limits.get('read_timeout', READ_TIMEOUT))
+    started = time.monotonic()
+    deadline = started + limits.get('item_deadline', ITEM_DEADLINE)
+    cancel_events = (cancel_event,) if cancel_event else ()
+    hedge_info = {'fired': False, 'won': False}
+    attempt = {}
+    
+    # Wspólny dla wszystkich sesji limit pobranych danych - miejsce rezerwowane przed odczytem
+    # treści i zwalniane po przetworzeniu (wynik trafia od razu na dysk, DownloadedFiles)
+    with GOVERNOR.buffers.hold() as buffer:
+        if hedge_executor is not None and task.get('hedge_after'):
+            def download(url):
+                return pobierz_obraz_z_hedgingiem(
+                    url, hedge_executor, task['hedge_after'], hedge_info, timeout, deadline, cancel_event, buffer
+                )
         else:
-            # Konwertuj do RGB jeśli nie ma przezroczystości
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            def download(url):
+                return pobierz_obraz(url, timeout, deadline, cancel_events, buffer)
         
-        output = io.BytesIO()
-        image.save(output, format='PNG', optimize=True)
-        return output.getvalue()
-    except Exception as e:
-        raise Exception(f"Błąd konwersji WebP: {e}")
+        def fetch(url):
+            # Do historii hosta trafia czas jednej udanej próby - bez ponowień i przerw między nimi
+            attempt_started = time.monotonic()
+            data = download(url)
+            attempt['latency'] = time.monotonic() - attempt_started
+            return data
+        
+        image_data, retries = pobierz_obraz_z_ponowieniami(
+            task['link'], breaker, max_retries=max_retries, fetch=fetch, deadline=deadline
+        )
+        result = {
+            'retries': retries,
+            'hedged': hedge_info['fired'],
+            'hedge_won': hedge_info['won'],
+            'latency': attempt['latency'],
+            'size': len(image_data),
+            'transparency_fixed': False,
+            'converted': False,
+            'normalized': False
+        }
+        return przetworz_obraz(task, image_data, result, handle_transparency, convert_webp, normalize_spec)
 
-def pobierz_obraz(url, timeout=TIMEOUT):
-    """Pobiera obraz z URL"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+def przetworz_obraz(task, image_data, result, handle_transparency, convert_webp, normalize_spec=None):
+    """Przetwarza pobrany obraz (normalizacja, białe tło, konwersja WebP) i uzupełnia wynik"""
+    extension = task['extension']
+    
+    # Normalizacja do specyfikacji katalogu - jedno dekodowanie zamiast osobnych kroków
+    if normalize_spec:
+        image_data, result['normalized'], result['transparency_fixed'] = normalize_image(
+            image_data,
+            normalize_spec,
+            task['output_extension'],
+            remove_transparency=handle_transparency
+        )
+        result['converted'] = extension == '.webp' and task['output_extension'] != '.webp'
+        result['image_data'] = image_data
+        return result
+    
+    # Obsługa przezroczystości (przed konwersją WebP)
+    if handle_transparency and extension != '.webp':
+        processed_data = add_white_background(image_data)
+        
+        # Sprawdź czy obraz został przetworzony
+        if len(processed_data) != len(image_data) or processed_data != image_data:
+            image_data = processed_data
+            result['transparency_fixed'] = True
+    
+    # Konwersja WebP (jedno dekodowanie - przy okazji wiadomo, czy usunięto przezroczystość)
+    if convert_webp and extension == '.webp':
+        image_data, removed_transparency = convert_to_png(
+            image_data,
+            remove_transparency=handle_transparency
+        )
+        result['converted'] = True
+        
+        # Jeśli WebP miał przezroczystość i została usunięta
+        if removed_transparency:
+            result['transparency_fixed'] = True
+    
+    result['image_data'] = image_data
+    return result
+
+def sprawdz_url(url, timeout=PREFLIGHT_TIMEOUT):
+    """Sprawdza URL bez pobierania treści: HEAD, a gdy serwer go nie obsługuje - GET z Range na 1 bajt"""
+    result = {
+        'status': None,
+        'content_type': '',
+        'content_length': None,
+        'latency': None,
+        'error': None
     }
-    response = requests.get(url, headers=headers, timeout=timeout, stream=True)
-    response.raise_for_status()
-    return response.content
-
-def create_zip_from_memory(files_dict):
-    """Tworzy archiwum ZIP z plików w pamięci"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, file_data in files_dict.items():
-            zip_file.writestr(filename, file_data)
-    zip_buffer.seek(0)
-    return zip_buffer
+    started = time.monotonic()
+    try:
+        response = requests.head(url, headers=REQUEST_HEADERS, timeout=timeout, allow_redirects=True)
+        if response.status_code in (403, 405, 501) or not response.headers.get('Content-Type'):
+            response.close()
+            response = requests.get(
+                url,
+                headers={**REQUEST_HEADERS, 'Range': 'bytes=0-0'},
+                timeout=timeout,
+                stream=True
+            )
+        with response:
+            result['status'] = response.status_code
+            result['content_type'] = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                result['content_length'] = int(total) if total.isdigit() else None
+            elif response.headers.get('Content-Length', '').isdigit():
+                result['content_length'] = int(response.headers['Content-Length'])
+    except requests.RequestException as e:
+        result['error'] = str(e)
+    result['latency'] = time.monotonic() - started
+    return result
+
+def classify_probe(probe):
+    """Klasyfikuje wynik sprawdzenia URL: ok, martwy, pdf lub nie_obraz"""
+    if probe['error'] or probe['status'] is None or probe['status'] >= 400:
+        return 'martwy'
+    if probe['content_type'] == 'application/pdf':
+        return 'pdf'
+    if probe['content_type'] and not probe['content_type'].startswith(('image/', 'application/octet-stream')):
+        return 'nie_obraz'
+    return 'ok'
+
+class DownloadedFiles:
+    """Pobrane pliki w katalogu tymczasowym - w sesji zostaje tylko indeks nazw.
+    
+    Katalog jest usuwany przy kolejnym pobieraniu, wyczyszczeniu raportu lub końcu sesji.
+    """
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='okladki_')
+        self.paths = {}
+        self.archive_path = None
+        # Streamlit nie zgłasza końca sesji - katalog znika, gdy zwolniony zostanie jej session_state
+        # (albo przy zamknięciu procesu)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def names(self):
+        return sorted(self.paths)
+
+    def put(self, filename, data):
+        """Zapisuje plik (ta sama nazwa nadpisuje poprzedni plik)"""
+        path = self.paths.get(filename) or os.path.join(self.directory, f"{len(self.paths)}.bin")
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.paths[filename] = path
+        self.archive_path = None
+
+    def archive(self):
+        """Ścieżka archiwum ZIP - tworzonego raz, przy pierwszym wyświetleniu raportu"""
+        if self.archive_path is None:
+            path = os.path.join(self.directory, 'archiwum.zip')
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                for filename, file_path in self.paths.items():
+                    zip_file.write(file_path, filename)
+            self.archive_path = path
+        return self.archive_path
+
+    def read_archive(self):
+        """Całe archiwum - wywoływane dopiero po kliknięciu pobierania"""
+        return Path(self.archive()).read_bytes()
+
+    def remove(self):
+        self._finalizer()
 
 def parse_ean_list(ean_text):
     """Parsuje listę kodów EAN z tekstu"""
@@ -163,6 +765,8 @@ def parse_ean_list(ean_text):
 # Inicjalizacja session_state
 if 'download_results' not in st.session_state:
     st.session_state.download_results = None
+if 'preflight_results' not in st.session_state:
+    st.session_state.preflight_results = None
 
 # Nagłówek
 st.markdown("<div class='main-header'>📥 Pobieranie okładek z Excel</div>", unsafe_allow_html=True)
@@ -193,6 +797,97 @@ with st.sidebar:
         help="Pobierz ponownie pliki, które już istnieją"
     )
     
+    # Sekcja normalizacji
+    st.markdown("---")
+    st.markdown("### 📐 Normalizacja okładek")
+    normalize_spec = None
+    if st.checkbox(
+        "Dopasuj okładki do specyfikacji",
+        value=False,
+        help="Zmniejsza duże skany już podczas pobierania (szybkie dekodowanie w zmniejszonej rozdzielczości)"
+    ):
+        col1, col2 = st.columns(2)
+        with col1:
+            max_width = st.number_input("Maks. szerokość [px]", min_value=100, max_value=10000, value=1200, step=100)
+        with col2:
+            max_height = st.number_input("Maks. wysokość [px]", min_value=100, max_value=10000, value=1200, step=100)
+        normalize_mode = st.selectbox("Tryb koloru", ["Bez zmian"] + list(NORMALIZE_MODES))
+        normalize_format = st.selectbox("Format docelowy", ["Bez zmian"] + list(NORMALIZE_FORMATS))
+        normalize_spec = {
+            'max_width': int(max_width),
+            'max_height': int(max_height),
+            'mode': NORMALIZE_MODES.get(normalize_mode),
+            'extension': NORMALIZE_FORMATS.get(normalize_format)
+        }
+    
+    # Sekcja ponowień
+    st.markdown("---")
+    st.markdown("### 🔁 Ponowienia")
+    max_retries = st.number_input(
+        "Liczba ponowień",
+        min_value=0,
+        max_value=10,
+        value=MAX_RETRIES,
+        help="Ile razy ponowić pobieranie po błędzie przejściowym (timeout, zerwane połączenie, 5xx, 429)"
+    )
+    circuit_threshold = st.number_input(
+        "Błędy do wyłączenia hosta",
+        min_value=1,
+        max_value=50,
+        value=CIRCUIT_FAILURE_THRESHOLD,
+        help="Po tylu kolejnych błędach przejściowych host jest pomijany, a po "
+             f"{int(CIRCUIT_RESET_TIMEOUT)} s sprawdzany ponownie"
+    )
+    
+    # Sekcja limitów czasu
+    st.markdown("---")
+    st.markdown("### ⏱️ Limity czasu")
+    col1, col2 = st.columns(2)
+    with col1:
+        connect_timeout = st.number_input("Połączenie [s]", min_value=1, max_value=60, value=CONNECT_TIMEOUT)
+    with col2:
+        read_timeout = st.number_input("Odczyt [s]", min_value=1, max_value=300, value=READ_TIMEOUT)
+    item_deadline = st.number_input(
+        "Maks. czas na plik [s]",
+        min_value=5,
+        max_value=1800,
+        value=ITEM_DEADLINE,
+        help="Łączny czas pobierania jednego pliku razem z ponowieniami - chroni przed bardzo wolnymi odpowiedziami"
+    )
+    job_deadline_min = st.number_input(
+        "Limit czasu zadania [min]",
+        min_value=0,
+        max_value=24 * 60,
+        value=0,
+        help="Po tym czasie pobieranie zostanie przerwane z częściowym raportem. 0 = bez limitu"
+    )
+    use_hedging = st.checkbox(
+        "Równoległe żądanie dla wolnych odpowiedzi",
+        value=True,
+        help="Gdy pobieranie trwa dłużej niż zwykle dla danego hosta, wysyłane jest drugie żądanie - wygrywa szybsze"
+    )
+    hedge_percentile = HEDGE_PERCENTILE
+    if use_hedging:
+        hedge_percentile = st.slider(
+            "Percentyl opóźnienia",
+            min_value=50,
+            max_value=99,
+            value=HEDGE_PERCENTILE,
+            help="Drugie żądanie startuje po czasie, w którym zwykle kończy się ten procent pobrań z hosta"
+        )
+    
+    # Sekcja wydajności
+    st.markdown("---")
+    st.markdown("### ⚡ Wydajność")
+    max_workers = st.slider(
+        "Równoległe pobieranie",
+        min_value=1,
+        max_value=32,
+        value=MAX_WORKERS,
+        help="Maksymalna liczba jednoczesnych pobrań. Współbieżność dla pojedynczego hosta "
+             "jest dobierana automatycznie na podstawie poprzednich uruchomień."
+    )
+    
     st.markdown("---")
     st.markdown("### 📋 Instrukcja")
     st.markdown("""
@@ -210,6 +905,7 @@ with st.sidebar:
     if st.session_state.download_results:
         st.markdown("---")
         if st.button("🗑️ Wyczyść raport", type="secondary"):
+            st.session_state.download_results['downloaded_files'].remove()
             st.session_state.download_results = None
             st.rerun()
 
@@ -291,10 +987,132 @@ if uploaded_file is not None:
             else:
                 st.info("🔓 Filtr nieaktywny\n\nPobrane zostaną wszystkie produkty")
         
+        # Plan pobierania i szacowany czas
+        ean_filter_set = parse_ean_list(ean_filter_text) if ean_filter_text else None
+        plan = plan_downloads(
+            df, ean_column, link_column, ean_filter_set, convert_webp, overwrite, normalize_spec
+        )
+        host_profiles = HostProfileStore()
+        
+        # Preflight - sprawdzenie linków bez pobierania
+        st.markdown("---")
+        st.markdown("### 🔎 Sprawdzenie linków (opcjonalne)")
+        st.caption(
+            "Szybko sprawdza wszystkie zaplanowane linki (HEAD lub 1 bajt przez Range) - "
+            "wykrywa martwe linki i pliki PDF, zanim zaczniesz wielogodzinne pobieranie."
+        )
+        
+        preflight_key = (uploaded_file.name, uploaded_file.size, link_column)
+        if st.button("🔎 SPRAWDŹ LINKI", type="secondary"):
+            urls = sorted({str(task['link']) for task in plan['tasks']})
+            probes = {}
+            preflight_progress = st.progress(0)
+            preflight_status = st.empty()
+            
+            # Żądania sprawdzające liczą się do wspólnego limitu połączeń wszystkich sesji
+            with GOVERNOR.network.admit(PREFLIGHT_WORKERS, on_wait=queue_notice(preflight_status)) as network_grant, \
+                    ThreadPoolExecutor(max_workers=network_grant.units) as executor:
+                preflight_status.empty()
+                futures = {executor.submit(sprawdz_url, url): url for url in urls}
+                for done_count, future in enumerate(as_completed(futures), 1):
+                    probes[futures[future]] = future.result()
+                    preflight_progress.progress(done_count / len(urls))
+                    preflight_status.text(f"Sprawdzono: {done_count}/{len(urls)}")
+            
+            preflight_status.text("✅ Sprawdzanie zakończone!")
+            st.session_state.preflight_results = {'key': preflight_key, 'probes': probes}
+        
+        preflight = st.session_state.preflight_results
+        if preflight and preflight['key'] != preflight_key:
+            preflight = None
+        
+        skip_rejected = False
+        if preflight:
+            probes = preflight['probes']
+            preflight_rows = []
+            for task in plan['tasks']:
+                probe = probes.get(str(task['link']))
+                if probe is None:
+                    continue
+                preflight_rows.append({
+                    'EAN': task['ean'],
+                    'Host': task['host'],
+                    'Wynik': classify_probe(probe),
+                    'Status': probe['status'],
+                    'Typ': probe['content_type'],
+                    'Rozmiar [KB]': round(probe['content_length'] / 1024, 1) if probe['content_length'] else None,
+                    'Błąd': probe['error'] or '',
+                    'Link': str(task['link'])
+                })
+            preflight_df = pd.DataFrame(preflight_rows, columns=[
+                'EAN', 'Host', 'Wynik', 'Status', 'Typ', 'Rozmiar [KB]', 'Błąd', 'Link'
+            ])
+            verdicts = preflight_df['Wynik'].value_counts()
+            ok_links = set(preflight_df.loc[preflight_df['Wynik'] == 'ok', 'Link'])
+            ok_tasks = [task for task in plan['tasks'] if str(task['link']) in ok_links]
+            total_bytes = preflight_df.loc[preflight_df['Wynik'] == 'ok', 'Rozmiar [KB]'].sum() * 1024
+            
+            cols = st.columns(5)
+            cols[0].metric("✅ Dostępne", int(verdicts.get('ok', 0)))
+            cols[1].metric("💀 Martwe", int(verdicts.get('martwy', 0)))
+            cols[2].metric("📄 PDF", int(verdicts.get('pdf', 0)))
+            cols[3].metric("❓ Nie obraz", int(verdicts.get('nie_obraz', 0)))
+            cols[4].metric("📦 Do pobrania", f"{total_bytes / (1024*1024):.1f} MB")
+            
+            st.info(
+                f"⏱️ Szacowany czas pobierania dostępnych plików: "
+                f"**~{format_duration(estimate_job_duration(ok_tasks, host_profiles, workers=max_workers))}**"
+            )
+            
+            rejected_df = preflight_df[preflight_df['Wynik'] != 'ok']
+            if not rejected_df.empty:
+                with st.expander(f"⚠️ Odrzucone linki ({len(rejected_df)})"):
+                    st.dataframe(rejected_df, width="stretch", hide_index=True)
+                skip_rejected = st.checkbox(
+                    "Pomiń odrzucone linki przy pobieraniu",
+                    value=True,
+                    help="Wiersze z martwymi linkami, PDF i plikami niebędącymi obrazami nie będą pobierane"
+                )
+        
+        preflight_skipped = []
+        if skip_rejected:
+            rejected_links = set(rejected_df['Link'])
+            preflight_skipped = [task['ean'] for task in plan['tasks'] if str(task['link']) in rejected_links]
+            plan['tasks'] = [task for task in plan['tasks'] if str(task['link']) not in rejected_links]
+        
         # Przycisk pobierania
         st.markdown("---")
         st.markdown("### 🚀 Rozpocznij pobieranie")
         
+        planned_hosts = {task['host'] for task in plan['tasks']}
+        known_hosts = sum(1 for host in planned_hosts if host_profiles.summary(host))
+        estimate = estimate_job_duration(plan['tasks'], host_profiles, workers=max_workers)
+        st.info(
+            f"⏱️ Do pobrania: **{len(plan['tasks'])}** plików z **{len(planned_hosts)}** hostów | "
+            f"Szacowany czas: **~{format_duration(estimate)}** "
+            f"(historia dla {known_hosts}/{len(planned_hosts)} hostów)"
+        )
+        
+        if known_hosts:
+            with st.expander("📈 Statystyki hostów z poprzednich uruchomień"):
+                host_counts = {}
+                for task in plan['tasks']:
+                    host_counts[task['host']] = host_counts.get(task['host'], 0) + 1
+                host_rows = []
+                for host in sorted(planned_hosts):
+                    summary = host_profiles.summary(host)
+                    if not summary:
+                        continue
+                    host_rows.append({
+                        'Host': host,
+                        'Plików': host_counts[host],
+                        'Mediana czasu [s]': round(summary['median_latency'], 2) if summary['median_latency'] else None,
+                        'Przepustowość [KB/s]': round(summary['throughput'] / 1024) if summary['throughput'] else None,
+                        'Błędy [%]': round(summary['error_rate'] * 100, 1),
+                        'Współbieżność': summary['concurrency']
+                    })
+                st.dataframe(pd.DataFrame(host_rows), width="stretch", hide_index=True)
+        
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             start_download = st.button(
@@ -304,148 +1122,212 @@ if uploaded_file is not None:
             )
         
         if start_download:
-            downloaded_files = {}
-            ean_filter_set = parse_ean_list(ean_filter_text) if ean_filter_text else None
-            found_eans = set()
-            
-            # Statystyki
-            stats = {
-                'sukces': 0,
-                'blad': 0,
-                'istnieje': 0,  
-                'konwersje': 0,
-                'transparency_fixed': 0,  # Licznik obrazów z dodanym tłem
-                'nieznalezione_ean': 0,
-                'pdf_pominięte': 0,
-                'puste_wiersze': 0
-            }
-            
-            errors_log = []
-            pdf_eans = []
-            transparency_processed = []  # Lista EAN z usuniętą przezroczystością
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            log_expander = st.expander("⚠️ Błędy i ostrzeżenia", expanded=False)
-            log_container = log_expander.container()
-            
-            total_rows = len(df)
-            
-            for idx, row in df.iterrows():
-                progress = (idx + 1) / total_rows
-                progress_bar.progress(progress)
-                status_text.text(f"Przetwarzanie: {idx + 1}/{total_rows} ({progress*100:.1f}%)")
+            if st.session_state.download_results:
+                st.session_state.download_results['downloaded_files'].remove()
+                st.session_state.download_results = None
+            downloaded_files = DownloadedFiles()
+            # Błąd lub przerwanie (np. zamknięcie karty) - pobrane pliki nie trafiają do sesji
+            try:
+                file_rows = {}  # nazwa pliku -> numer wiersza (przy nadpisywaniu wygrywa późniejszy wiersz)
+                found_eans = plan['found_eans']
                 
-                link = row[link_column]
-                ean = row[ean_column]
+                # Statystyki
+                stats = {
+                    'sukces': 0,
+                    'blad': len(plan['errors']),
+                    'istnieje': plan['istnieje'],  
+                    'konwersje': 0,
+                    'transparency_fixed': 0,  # Licznik obrazów z dodanym tłem
+                    'nieznalezione_ean': plan['nieznalezione_ean'],
+                    'pdf_pominięte': len(plan['pdf_eans']),
+                    'puste_wiersze': plan['puste_wiersze'],
+                    'ponowienia': 0,
+                    'host_niedostepny': 0,
+                    'preflight_pominięte': len(preflight_skipped),
+                    'znormalizowane': 0,
+                    'hedging': 0,
+                    'hedging_wygrane': 0,
+                    'przerwane': 0,
+                    'odrzucone_obrazy': 0
+                }
                 
-                if pd.isna(link) or pd.isna(ean):
-                    stats['puste_wiersze'] += 1
-                    continue
+                errors_log = list(plan['errors'])
+                pdf_eans = list(plan['pdf_eans'])
+                breaker = CircuitBreaker(failure_threshold=circuit_threshold)
+                unavailable_hosts = {}  # host -> lista EAN pominiętych przez circuit breaker
+                transparency_processed = []  # Lista EAN z usuniętą przezroczystością
                 
-                try:
-                    ean = str(int(float(ean))).strip().replace(' ', '')
-                except (ValueError, OverflowError):
-                    ean = str(ean).strip().replace(' ', '')
+                progress_bar = st.progress(0)
+                status_text = st.empty()
                 
-                if ean_filter_set:
-                    if ean not in ean_filter_set:
-                        stats['nieznalezione_ean'] += 1
-                        continue
-                    else:
-                        found_eans.add(ean)
+                log_expander = st.expander("⚠️ Błędy i ostrzeżenia", expanded=False)
+                log_container = log_expander.container()
                 
-                link_lower = str(link).lower()
-                if '.pdf' in link_lower:
-                    with log_container:
+                with log_container:
+                    for ean in pdf_eans:
                         st.warning(f"EAN {ean}: Pominięto - link prowadzi do pliku PDF")
-                    stats['pdf_pominięte'] += 1
-                    pdf_eans.append(ean)
-                    continue
+                    for error_msg in errors_log:
+                        st.error(error_msg)
                 
-                try:
-                    parsed_url = urlparse(str(link))
-                    extension = os.path.splitext(parsed_url.path)[1].lower()
-                    
-                    if extension == '.pdf':
-                        with log_container:
-                            st.warning(f"EAN {ean}: Pominięto - link prowadzi do pliku PDF")
-                        stats['pdf_pominięte'] += 1
-                        pdf_eans.append(ean)
-                        continue
-                    
-                    if not extension or extension not in ALLOWED_FORMATS:
-                        extension = DEFAULT_FORMAT
-                    
-                    original_extension = extension
-                    
-                    # Pobierz obraz
-                    image_data = pobierz_obraz(link)
-                    
-                    # Obsługa przezroczystości (przed konwersją WebP)
-                    if handle_transparency and extension != '.webp':
-                        original_size = len(image_data)
-                        processed_data = add_white_background(image_data)
+                tasks = plan['tasks']
+                total_tasks = len(tasks)
+                completed = 0
+                scheduler = HostScheduler(tasks, host_profiles, breaker=breaker)
+                limits = {
+                    'connect_timeout': connect_timeout,
+                    'read_timeout': read_timeout,
+                    'item_deadline': item_deadline
+                }
+                cancel_event = threading.Event()
+                job_deadline = time.monotonic() + job_deadline_min * 60 if job_deadline_min else None
+                interrupted_eans = []
+                
+                # Profil (?profile=1) obejmuje wątek skryptu - pobieranie w wątkach widać jako oczekiwanie
+                # Przydział połączeń dzielony z innymi sesjami - maleje, gdy ktoś czeka w kolejce
+                # Przy hedgingu plik może zajmować dwa połączenia (żądanie i hedge) - oba liczą się do przydziału
+                requests_per_task = 2 if use_hedging else 1
+                with profile_run("Pobieranie okładek"), \
+                        GOVERNOR.network.admit(max_workers * requests_per_task, on_wait=queue_notice(status_text)) as network_grant, \
+                        ThreadPoolExecutor(max_workers=max_workers) as executor, \
+                        ThreadPoolExecutor(max_workers=max_workers * 2) as hedge_executor:
+                    status_text.empty()
+                    running = {}
+                    while scheduler.has_pending() or running:
+                        if job_deadline and time.monotonic() > job_deadline and not cancel_event.is_set():
+                            # Limit czasu zadania - nie startuj nowych pobrań, przerwij trwające
+                            cancel_event.set()
+                            interrupted_eans.extend(task['ean'] for task in scheduler.drain())
                         
-                        # Sprawdź czy obraz został przetworzony
-                        if len(processed_data) != original_size or processed_data != image_data:
-                            image_data = processed_data
-                            stats['transparency_fixed'] += 1
-                            transparency_processed.append(ean)
-                    
-                    # Konwersja WebP
-                    if convert_webp and original_extension == '.webp':
-                        # Sprawdź czy WebP ma przezroczystość przed konwersją
-                        if handle_transparency:
-                            temp_img = Image.open(io.BytesIO(image_data))
-                            had_transparency = has_transparency(temp_img)
+                        in_use = sum(2 if running_task.get('hedge_after') else 1 for running_task in running.values())
+                        free_slots = network_grant.allowed() - in_use
+                        while free_slots > 0 and len(running) < max_workers:
+                            ready = scheduler.next_ready(1)
+                            if not ready:
+                                break
+                            task = ready[0]
+                            # Dwa połączenia tylko dla pliku, który może wysłać hedge (host z historią)
+                            # i gdy przydział je mieści - pozostałe zajmują jedno
+                            task['hedge_after'] = None
+                            if use_hedging and free_slots >= 2:
+                                task['hedge_after'] = host_profiles.latency_percentile(task['host'], hedge_percentile)
+                            free_slots -= 2 if task['hedge_after'] else 1
+                            future = executor.submit(
+                                pobierz_i_przetworz, task, breaker, max_retries,
+                                handle_transparency, convert_webp, normalize_spec,
+                                limits, hedge_executor if use_hedging else None, cancel_event
+                            )
+                            running[future] = task
                         
-                        image_data = convert_webp_to_png(
-                            image_data, 
-                            remove_transparency=handle_transparency
-                        )
-                        extension = '.png'
-                        stats['konwersje'] += 1
+                        wait_time = scheduler.wait_time()
+                        if job_deadline and not cancel_event.is_set():
+                            remaining = job_deadline - time.monotonic()
+                            wait_time = max(0.05, remaining if wait_time is None else min(wait_time, remaining))
                         
-                        # Jeśli WebP miał przezroczystość i została usunięta
-                        if handle_transparency and had_transparency:
-                            stats['transparency_fixed'] += 1
-                            transparency_processed.append(ean)
-                    
-                    filename = f"{ean}{extension}"
-                    
-                    if filename in downloaded_files and not overwrite:
-                        stats['istnieje'] += 1  
-                        continue
-                    
-                    downloaded_files[filename] = image_data
-                    stats['sukces'] += 1
-                    time.sleep(DELAY_BETWEEN_DOWNLOADS)
-                    
-                except Exception as e:
-                    error_msg = f"EAN: {ean} | Błąd: {str(e)}"
-                    errors_log.append(error_msg)
-                    with log_container:
-                        st.error(error_msg)
-                    stats['blad'] += 1
-            
-            progress_bar.progress(1.0)
-            status_text.text("✅ Pobieranie zakończone!")
-            
-            missing_eans = None
-            if ean_filter_set:
-                missing_eans = ean_filter_set - found_eans
-            
-            st.session_state.download_results = {
-                'stats': stats,
-                'errors_log': errors_log,
-                'pdf_eans': pdf_eans,
-                'downloaded_files': downloaded_files,
-                'missing_eans': missing_eans,
-                'ean_filter_set': ean_filter_set,
-                'transparency_processed': transparency_processed
-            }
+                        if not running:
+                            time.sleep(wait_time or 0.05)
+                            continue
+                        
+                        done, _ = wait(running, timeout=wait_time, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            task = running.pop(future)
+                            ean = task['ean']
+                            completed += 1
+                            
+                            try:
+                                result = future.result()
+                            except DownloadCancelledError:
+                                scheduler.task_done(task, success=False)
+                                interrupted_eans.append(ean)
+                            except ImageRejectedError as e:
+                                # Pobieranie się udało, obraz przekroczył limity pamięci
+                                scheduler.task_done(task, success=True)
+                                error_msg = f"EAN: {ean} | Błąd: {str(e)}"
+                                errors_log.append(error_msg)
+                                with log_container:
+                                    st.error(error_msg)
+                                stats['blad'] += 1
+                                stats['odrzucone_obrazy'] += 1
+                            except HostUnavailableError as e:
+                                scheduler.task_done(task, success=False)
+                                if breaker.gave_up(e.host):
+                                    unavailable_hosts.setdefault(e.host, []).append(ean)
+                                    stats['host_niedostepny'] += 1
+                                else:
+                                    # Host chwilowo wyłączony - wiersz wraca do kolejki i czeka na próbę half-open
+                                    scheduler.requeue(task)
+                                    completed -= 1
+                            except Exception as e:
+                                scheduler.task_done(task, success=False)
+                                throttled = (
+                                    isinstance(e, requests.HTTPError)
+                                    and e.response is not None
+                                    and e.response.status_code in (429, 503)
+                                )
+                                if not isinstance(e, AdmissionTimeoutError):
+                                    # Brak miejsca w buforze to nie błąd hosta
+                                    host_profiles.record(task['host'], ok=False, throttled=throttled)
+                                error_msg = f"EAN: {ean} | Błąd: {str(e)}"
+                                errors_log.append(error_msg)
+                                with log_container:
+                                    st.error(error_msg)
+                                stats['blad'] += 1
+                            else:
+                                scheduler.task_done(task, success=True)
+                                host_profiles.record(
+                                    task['host'], ok=True, latency=result['latency'], size=result['size']
+                                )
+                                stats['ponowienia'] += result['retries']
+                                stats['hedging'] += result['hedged']
+                                stats['hedging_wygrane'] += result['hedge_won']
+                                if result['converted']:
+                                    stats['konwersje'] += 1
+                                if result['normalized']:
+                                    stats['znormalizowane'] += 1
+                                if result['transparency_fixed']:
+                                    stats['transparency_fixed'] += 1
+                                    transparency_processed.append(ean)
+                                
+                                filename = task['filename']
+                                if task['row'] >= file_rows.get(filename, -1):
+                                    downloaded_files.put(filename, result['image_data'])
+                                    file_rows[filename] = task['row']
+                                stats['sukces'] += 1
+                        
+                        if total_tasks:
+                            progress = completed / total_tasks
+                            progress_bar.progress(progress)
+                            status_text.text(
+                                f"Pobieranie: {completed}/{total_tasks} ({progress*100:.1f}%) | "
+                                f"W toku: {len(running)}"
+                            )
+                
+                host_profiles.save()
+                stats['przerwane'] = len(interrupted_eans)
+                progress_bar.progress(1.0)
+                if interrupted_eans:
+                    status_text.text("⏹️ Osiągnięto limit czasu zadania - raport częściowy")
+                else:
+                    status_text.text("✅ Pobieranie zakończone!")
+                
+                missing_eans = None
+                if ean_filter_set:
+                    missing_eans = ean_filter_set - found_eans
+                
+                st.session_state.download_results = {
+                    'stats': stats,
+                    'errors_log': errors_log,
+                    'pdf_eans': pdf_eans,
+                    'downloaded_files': downloaded_files,
+                    'missing_eans': missing_eans,
+                    'ean_filter_set': ean_filter_set,
+                    'transparency_processed': transparency_processed,
+                    'unavailable_hosts': unavailable_hosts,
+                    'preflight_skipped': preflight_skipped,
+                    'interrupted_eans': interrupted_eans
+                }
+            except BaseException:
+                downloaded_files.remove()
+                raise
         
         # Wyświetl wyniki
         if st.session_state.download_results:
@@ -457,6 +1339,9 @@ if uploaded_file is not None:
             missing_eans = results['missing_eans']
             ean_filter_set = results['ean_filter_set']
             transparency_processed = results.get('transparency_processed', [])
+            unavailable_hosts = results.get('unavailable_hosts', {})
+            preflight_skipped = results.get('preflight_skipped', [])
+            interrupted_eans = results.get('interrupted_eans', [])
             
             st.markdown("---")
             st.markdown("## 📊 Raport końcowy")
@@ -469,14 +1354,28 @@ if uploaded_file is not None:
                 cols_data.append(("🎨 Dodano białe tło", stats['transparency_fixed']))
             if stats['konwersje'] > 0:
                 cols_data.append(("🔄 Konwersje WebP", stats['konwersje']))
+            if stats.get('znormalizowane', 0) > 0:
+                cols_data.append(("📐 Znormalizowane", stats['znormalizowane']))
             if stats['blad'] > 0:
                 cols_data.append(("❌ Błędy", stats['blad']))
+            if stats.get('host_niedostepny', 0) > 0:
+                cols_data.append(("🔌 Host niedostępny", stats['host_niedostepny']))
+            if stats.get('ponowienia', 0) > 0:
+                cols_data.append(("🔁 Ponowienia", stats['ponowienia']))
+            if stats.get('hedging', 0) > 0:
+                cols_data.append(("⚡ Drugie żądania (wygrane)", f"{stats['hedging']} ({stats['hedging_wygrane']})"))
+            if stats.get('przerwane', 0) > 0:
+                cols_data.append(("⏹️ Przerwane (limit)", stats['przerwane']))
+            if stats.get('odrzucone_obrazy', 0) > 0:
+                cols_data.append(("🧱 Odrzucone (limit pamięci)", stats['odrzucone_obrazy']))
             if stats['istnieje'] > 0:
                 cols_data.append(("📁 Już istnieje", stats['istnieje']))
             if ean_filter_set and stats['nieznalezione_ean'] > 0:
                 cols_data.append(("🔍 Poza filtrem", stats['nieznalezione_ean']))
             if stats['pdf_pominięte'] > 0:
                 cols_data.append(("📄 Pliki PDF", stats['pdf_pominięte']))
+            if stats.get('preflight_pominięte', 0) > 0:
+                cols_data.append(("🔎 Pominięte (preflight)", stats['preflight_pominięte']))
             
             if cols_data:
                 cols = st.columns(len(cols_data))
@@ -503,6 +1402,45 @@ if uploaded_file is not None:
                     for error in errors_log:
                         st.text(error)
             
+            # Niedostępne hosty (circuit breaker)
+            if unavailable_hosts:
+                total_skipped = sum(len(eans) for eans in unavailable_hosts.values())
+                with st.expander(f"🔌 Niedostępne hosty ({len(unavailable_hosts)} hostów, {total_skipped} wierszy)"):
+                    st.info(
+                        "Te hosty zwracały serię błędów przejściowych, a kolejne próby po "
+                        f"{int(CIRCUIT_RESET_TIMEOUT)} s też się nie powiodły - pozostałe wiersze pominięto"
+                    )
+                    for host, eans in sorted(unavailable_hosts.items(), key=lambda item: -len(item[1])):
+                        st.markdown(f"**{host}** - {len(eans)} wierszy")
+                        st.text_area(
+                            f"Kody EAN ({host}):",
+                            value='\n'.join(eans),
+                            height=min(150, max(68, len(eans) * 20)),
+                            key=f"unavailable_{host}"
+                        )
+            
+            # Wiersze przerwane przez limit czasu zadania
+            if interrupted_eans:
+                with st.expander(f"⏹️ Nie pobrano - osiągnięto limit czasu zadania ({len(interrupted_eans)})"):
+                    st.info("Te produkty nie zostały pobrane, bo skończył się czas przeznaczony na zadanie")
+                    st.text_area(
+                        "Lista kodów EAN:",
+                        value='\n'.join(interrupted_eans),
+                        height=150,
+                        key="interrupted_eans"
+                    )
+            
+            # Wiersze pominięte na podstawie preflight
+            if preflight_skipped:
+                with st.expander(f"🔎 Pominięte po sprawdzeniu linków ({len(preflight_skipped)})"):
+                    st.info("Linki tych produktów zostały odrzucone podczas sprawdzania (martwe, PDF lub nie obraz)")
+                    st.text_area(
+                        "Lista kodów EAN:",
+                        value='\n'.join(preflight_skipped),
+                        height=150,
+                        key="preflight_skipped_eans"
+                    )
+            
             # Lista pominiętych PDF
             if pdf_eans:
                 with st.expander(f"📄 Pominięte pliki PDF ({len(pdf_eans)})"):
@@ -534,13 +1472,14 @@ if uploaded_file is not None:
                 st.markdown("### 💾 Pobierz archiwum")
                 
                 with st.spinner("Tworzenie archiwum ZIP..."):
-                    zip_buffer = create_zip_from_memory(downloaded_files)
+                    downloaded_files.archive()
                 
                 zip_filename = f"okladki_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
                 
+                # Archiwum czytane z dysku dopiero po kliknięciu, nie przy każdym odświeżeniu strony
                 st.download_button(
                     label=f"⬇️ Pobierz {stats['sukces']} plików (ZIP)",
-                    data=zip_buffer,
+                    data=downloaded_files.read_archive,
                     file_name=zip_filename,
                     mime="application/zip",
                     width="stretch",
@@ -548,11 +1487,16 @@ if uploaded_file is not None:
                 )
                 
                 with st.expander(f"📋 Lista pobranych plików ({stats['sukces']})"):
-                    for i, filename in enumerate(sorted(downloaded_files.keys()), 1):
+                    for i, filename in enumerate(downloaded_files.names(), 1):
                         st.text(f"{i}. {filename}")
             else:
                 st.warning("Nie pobrano żadnych plików")
+            
+            show_profile("Pobieranie okładek")
     
+    except AdmissionTimeoutError as e:
+        # Serwer zajęty przez inne sesje - komunikat bez śladu stosu
+        st.error(f"❌ {e}. Spróbuj ponownie za chwilę.")
     except Exception as e:
         st.error(f"❌ Błąd: {str(e)}")
         st.exception(e)
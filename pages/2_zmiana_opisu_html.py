@@ -1,8 +1,14 @@
+import os
+import time
 import streamlit as st
 import pandas as pd
-import re
-from io import BytesIO
-from typing import Optional
+from utils.html_converter import (
+    iter_converted_columns, ConversionCache, IncrementalConverter, DISK_CACHE_PATH, DEFAULT_OPTIONS,
+    PARALLEL_MIN_ROWS
+)
+from utils.html_export import EXPORT_FORMATS, export_rows, parquet_available
+from utils.profiler import profile_run, show_profile
+from utils.governor import GOVERNOR, AdmissionTimeoutError, queue_notice
 
 # ============================================
 # KONFIGURACJA STRONY
@@ -31,6 +37,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+PREVIEW_ROWS = 3  # Liczba losowych opisów w podglądzie na żywo
+PREVIEW_CANDIDATES = 50  # Losowane wiersze, spośród których wybierane są niepuste opisy do podglądu
+DEFAULT_OUTPUT_COLUMN = 'description-B2B'  # Nazwa wyniku dla pierwszej kolumny z opisami
+OPTION_LABELS = {
+    'add_paragraphs': "Tagi <p>",
+    'convert_lists': "Listy",
+    'convert_headings': "Nagłówki",
+    'convert_formatting': "Pogrubienie/kursywa",
+    'wrap_in_div': "<div>",
+}
+
 # ============================================
 # FUNKCJE POMOCNICZE
 # ============================================
@@ -49,121 +66,40 @@ def parse_ean_list(ean_text):
     
     return set(ean_list)
 
-# ============================================
-# FUNKCJE KONWERSJI TEKSTU NA HTML
-# ============================================
-
-def convert_inline_formatting(text: str) -> str:
-    """Konwertuje formatowanie inline (pogrubienie, kursywa)."""
-    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
-    text = re.sub(r'__(.+?)__', r'<strong>\1</strong>', text)
-    text = re.sub(r'\*([^*]+)\*', r'<em>\1</em>', text)
-    text = re.sub(r'_([^_]+)_', r'<em>\1</em>', text)
-    return text
-
-
-def detect_heading(line: str) -> Optional[tuple[int, str]]:
-    """Wykrywa nagłówki w różnych formatach."""
-    match = re.match(r'^(#{1,6})\s+(.+)$', line)
-    if match:
-        level = len(match.group(1))
-        return (level, match.group(2))
-    
-    if line.endswith(':') and len(line) < 60 and not line.startswith('-'):
-        return (3, line[:-1])
-    
-    return None
-
-
-def text_to_html(text: str, options: dict) -> str:
-    """Główna funkcja konwertująca tekst na HTML."""
-    if not text or pd.isna(text):
-        return ""
-    
-    text = str(text).strip()
-    lines = text.split('\n')
-    html_parts = []
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        if not line:
-            i += 1
-            continue
-        
-        # Nagłówki
-        if options.get('convert_headings', True):
-            heading = detect_heading(line)
-            if heading:
-                level, heading_text = heading
-                if options.get('convert_formatting', True):
-                    heading_text = convert_inline_formatting(heading_text)
-                html_parts.append(f"<h{level}>{heading_text}</h{level}>")
-                i += 1
-                continue
-        
-        # Listy
-        if options.get('convert_lists', True):
-            # Lista punktowana
-            if re.match(r'^[-*•]\s+', line):
-                list_items = []
-                while i < len(lines) and re.match(r'^[-*•]\s+', lines[i].strip()):
-                    item_text = re.sub(r'^[-*•]\s+', '', lines[i].strip())
-                    if options.get('convert_formatting', True):
-                        item_text = convert_inline_formatting(item_text)
-                    list_items.append(f"  <li>{item_text}</li>")
-                    i += 1
-                html_parts.append("<ul>\n" + "\n".join(list_items) + "\n</ul>")
-                continue
-            
-            # Lista numerowana
-            if re.match(r'^\d+[.)]\s+', line):
-                list_items = []
-                while i < len(lines) and re.match(r'^\d+[.)]\s+', lines[i].strip()):
-                    item_text = re.sub(r'^\d+[.)]\s+', '', lines[i].strip())
-                    if options.get('convert_formatting', True):
-                        item_text = convert_inline_formatting(item_text)
-                    list_items.append(f"  <li>{item_text}</li>")
-                    i += 1
-                html_parts.append("<ol>\n" + "\n".join(list_items) + "\n</ol>")
-                continue
-        
-        # Zwykły paragraf
-        paragraph_lines = []
-        while i < len(lines) and lines[i].strip():
-            current_line = lines[i].strip()
-            
-            if options.get('convert_lists', True):
-                if re.match(r'^[-*•]\s+', current_line) or re.match(r'^\d+[.)]\s+', current_line):
-                    break
-            if options.get('convert_headings', True) and detect_heading(current_line):
-                break
-                
-            paragraph_lines.append(current_line)
-            i += 1
-        
-        if paragraph_lines:
-            paragraph_text = ' '.join(paragraph_lines)
-            if options.get('convert_formatting', True):
-                paragraph_text = convert_inline_formatting(paragraph_text)
-            if options.get('add_paragraphs', True):
-                html_parts.append(f"<p>{paragraph_text}</p>")
-            else:
-                html_parts.append(paragraph_text)
-    
-    html = '\n\n'.join(html_parts)
-    
-    if options.get('wrap_in_div', False):
-        html = f'<div class="product-description">\n{html}\n</div>'
-    
-    return html
+def validate_mapping(mapping):
+    """Sprawdza nazwy kolumn wynikowych - zwraca listę błędów"""
+    errors = []
+    output_names = [str(name).strip() for name in mapping['Kolumna wynikowa']]
+    if any(not name for name in output_names):
+        errors.append("Każda kolumna z opisami musi mieć nazwę kolumny wynikowej")
+    duplicates = sorted({name for name in output_names if name and output_names.count(name) > 1})
+    if duplicates:
+        errors.append(f"Powtórzone nazwy kolumn wynikowych: {', '.join(duplicates)}")
+    if 'sku' in output_names:
+        errors.append("Nazwa 'sku' jest zarezerwowana dla kolumny z kodami EAN")
+    return errors
 
+def column_options(mapping_row, default_options):
+    """Opcje konwersji dla jednej kolumny - własne albo z panelu bocznego"""
+    if not mapping_row['Własne opcje']:
+        return default_options
+    return {name: bool(mapping_row[label]) for name, label in OPTION_LABELS.items()}
 
 # ============================================
 # INTERFEJS UŻYTKOWNIKA
 # ============================================
 
+# Pamięć podręczna konwersji na czas sesji
+if 'html_cache' not in st.session_state:
+    st.session_state.html_cache = ConversionCache()
+# Sparsowane opisy - zmiana opcji przelicza tylko zależne od niej etapy (HTML trzyma html_cache)
+if 'html_incremental' not in st.session_state:
+    st.session_state.html_incremental = IncrementalConverter(st.session_state.html_cache)
+if 'html_export' not in st.session_state:
+    st.session_state.html_export = None
+if 'preview_seed' not in st.session_state:
+    st.session_state.preview_seed = 0
+
 # Nagłówek
 st.markdown("<div class='main-header'>📝 Konwerter opisów na HTML</div>", unsafe_allow_html=True)
 st.markdown("---")
@@ -171,6 +107,7 @@ st.markdown("---")
 # Sidebar z opcjami
 with st.sidebar:
     st.header("⚙️ Opcje konwersji")
+    st.caption("Domyślne dla wszystkich kolumn z opisami - każda kolumna może mieć własne opcje")
     
     options = {
         'add_paragraphs': st.checkbox("Dodaj tagi <p>", value=True),
@@ -179,6 +116,48 @@ with st.sidebar:
         'convert_formatting': st.checkbox("Pogrubienie/kursywa", value=True),
         'wrap_in_div': st.checkbox("Opakuj w <div>", value=False),
     }
+    
+    st.markdown("---")
+    st.markdown("### 📄 Plik wynikowy")
+    available_formats = [
+        name for name, (extension, _) in EXPORT_FORMATS.items()
+        if extension != '.parquet' or parquet_available()
+    ]
+    export_format = st.radio(
+        "Format eksportu",
+        available_formats,
+        help="CSV i Parquet dla systemów, które nie potrzebują Excela (Parquet wymaga pakietu pyarrow)"
+    )
+    
+    st.markdown("---")
+    st.markdown("### ⚡ Wydajność")
+    workers = st.number_input(
+        "Procesy konwersji",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=os.cpu_count() or 1,
+        help="Duże pliki są dzielone na fragmenty i konwertowane równolegle. Małe pliki zawsze w jednym procesie. "
+             "Procesy są dzielone z zadaniami innych użytkowników."
+    )
+    use_disk_cache = st.checkbox(
+        "Zapamiętuj wyniki na dysku",
+        value=False,
+        help="Wyniki konwersji są zapisywane i wykorzystywane ponownie przy kolejnych uruchomieniach "
+             "(po przekroczeniu limitu rozmiaru usuwane są najdawniej używane). "
+             "Powtarzające się opisy w sesji są zawsze konwertowane tylko raz."
+    )
+    
+    cache_totals = st.session_state.html_cache.totals
+    if cache_totals['rows']:
+        st.caption(
+            f"Pamięć podręczna w tej sesji: {ConversionCache.hit_rate(cache_totals) * 100:.0f}% trafień "
+            f"({cache_totals['rows'] - cache_totals['converted']}/{cache_totals['rows']} wierszy)"
+        )
+    if st.button("🗑️ Wyczyść pamięć podręczną", type="secondary"):
+        st.session_state.html_cache = ConversionCache()
+        st.session_state.html_incremental = IncrementalConverter(st.session_state.html_cache)
+        DISK_CACHE_PATH.unlink(missing_ok=True)
+        st.rerun()
 
 # Główna część aplikacji
 uploaded_file = st.file_uploader(
@@ -206,18 +185,104 @@ if uploaded_file is not None:
             )
         
         with col2:
-            default_desc_index = 1 if len(columns) > 1 else 0
-            for i, col in enumerate(columns):
+            default_description = columns[1] if len(columns) > 1 else columns[0]
+            for col in columns:
                 if 'opis' in col.lower() or 'desc' in col.lower():
-                    default_desc_index = i
+                    default_description = col
                     break
                     
-            description_column = st.selectbox(
-                "Kolumna z opisami:",
+            description_columns = st.multiselect(
+                "Kolumny z opisami:",
                 columns,
-                index=default_desc_index
+                default=[default_description],
+                help="Wszystkie wybrane kolumny są konwertowane w jednym przebiegu do jednego pliku"
             )
         
+        if not description_columns:
+            st.warning("⚠️ Wybierz co najmniej jedną kolumnę z opisami")
+            mapping = None
+            mapping_errors = ["Brak kolumn z opisami"]
+        else:
+            # Przypisanie kolumn wynikowych - opcje własne domyślnie wyłączone (obowiązuje panel boczny)
+            st.markdown("#### 🗂️ Kolumny wynikowe")
+            mapping = st.data_editor(
+                pd.DataFrame({
+                    'Kolumna źródłowa': description_columns,
+                    'Kolumna wynikowa': [
+                        DEFAULT_OUTPUT_COLUMN if i == 0 else f"{col}-HTML"
+                        for i, col in enumerate(description_columns)
+                    ],
+                    'Własne opcje': False,
+                    **{label: DEFAULT_OPTIONS[name] for name, label in OPTION_LABELS.items()},
+                }),
+                column_config={
+                    'Kolumna wynikowa': st.column_config.TextColumn(required=True),
+                    'Własne opcje': st.column_config.CheckboxColumn(
+                        help="Zaznacz, aby ta kolumna używała opcji z tabeli zamiast z panelu bocznego"
+                    ),
+                },
+                disabled=['Kolumna źródłowa'],
+                hide_index=True,
+                width="stretch",
+                key=f"mapping_{'|'.join(description_columns)}"
+            )
+            mapping_errors = validate_mapping(mapping)
+            for error in mapping_errors:
+                st.error(f"❌ {error}")
+        
+        # Podgląd na żywo - każda zmiana opcji w panelu bocznym odświeża stronę,
+        # a losowe opisy są przeliczane przyrostowo bez dotykania całego pliku
+        st.markdown("---")
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown("### 👁️ Podgląd na żywo")
+        with col2:
+            if st.button("🎲 Losuj inne opisy", width="stretch"):
+                st.session_state.preview_seed += 1
+        
+        if mapping is not None and len(mapping) > 1:
+            preview_index = st.selectbox(
+                "Kolumna w podglądzie:",
+                range(len(mapping)),
+                format_func=lambda i: f"{mapping.iloc[i]['Kolumna źródłowa']} → {mapping.iloc[i]['Kolumna wynikowa']}"
+            )
+        else:
+            preview_index = 0
+        
+        descriptions = (
+            df[mapping.iloc[preview_index]['Kolumna źródłowa']].dropna()
+            if mapping is not None else pd.Series(dtype=str)
+        )
+        # Najpierw losowanie, potem odrzucenie pustych - bez przetwarzania całej kolumny przy każdym odświeżeniu
+        candidates = descriptions.sample(
+            min(PREVIEW_CANDIDATES, len(descriptions)),
+            random_state=st.session_state.preview_seed
+        )
+        candidates = candidates[candidates.str.strip() != '']
+        if candidates.empty and len(descriptions) > PREVIEW_CANDIDATES:
+            # Prawie same puste komórki - rzadki przypadek, w którym sprawdzana jest cała kolumna
+            candidates = descriptions[descriptions.str.strip() != '']
+        if candidates.empty:
+            st.info("Brak opisów w wybranej kolumnie")
+        else:
+            sample = candidates.head(PREVIEW_ROWS)
+            start_time = time.perf_counter()
+            preview_html = st.session_state.html_incremental.convert(
+                sample, column_options(mapping.iloc[preview_index], options)
+            )
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            st.caption(f"Przeliczono {len(sample)} opisów w {elapsed_ms:.1f} ms")
+            
+            for row_index, html in zip(sample.index, preview_html):
+                with st.expander(f"EAN: {df.at[row_index, ean_column]}", expanded=True):
+                    tab_preview, tab_code, tab_source = st.tabs(["Podgląd", "Kod HTML", "Tekst źródłowy"])
+                    with tab_preview:
+                        st.markdown(html, unsafe_allow_html=True)
+                    with tab_code:
+                        st.code(html, language='html')
+                    with tab_source:
+                        st.text(sample[row_index])
+        
         # Sekcja filtrowania EAN
         st.markdown("---")
         st.markdown("### 🔍 Filtrowanie po kodach EAN (opcjonalne)")
@@ -244,10 +309,15 @@ if uploaded_file is not None:
         # Przycisk konwersji
         st.markdown("---")
         
-        if st.button("🚀 KONWERTUJ NA HTML", type="primary", width="stretch"):
+        if st.button("🚀 KONWERTUJ NA HTML", type="primary", width="stretch", disabled=bool(mapping_errors)):
             with st.spinner("Konwertuję..."):
+                # Poprzedni plik wynikowy nie jest już potrzebny
+                if st.session_state.html_export:
+                    st.session_state.html_export['file'].remove()
+                    st.session_state.html_export = None
+                
                 # Przygotuj dane do konwersji
-                working_df = df.copy()
+                working_df = df
                 missing_eans = None
                 
                 # Zastosuj filtr EAN jeśli podany
@@ -257,14 +327,6 @@ if uploaded_file is not None:
                     found_eans = set(working_df[ean_column].dropna())
                     missing_eans = ean_filter_set - found_eans
                 
-                # Konwersja
-                export_df = pd.DataFrame({
-                    'sku': working_df[ean_column].fillna(''),
-                    'description-B2B': working_df[description_column].apply(
-                        lambda x: text_to_html(x, options)
-                    )
-                })
-                
                 # Raport brakujących EAN
                 if missing_eans:
                     st.warning(f"⚠️ Nie znaleziono {len(missing_eans)} kodów EAN")
@@ -275,47 +337,107 @@ if uploaded_file is not None:
                             height=200
                         )
                 
-                # Przygotuj plik Excel
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    export_df.to_excel(
-                        writer, 
-                        index=False, 
-                        sheet_name='Produkty_HTML'
-                    )
+                # Konwersja i zapis strumieniowy - wiersze trafiają do pliku partiami,
+                # bez budowania pełnej tabeli wynikowej w pamięci
+                progress_bar = st.progress(0)
+                status_text = st.empty()
+                
+                def show_progress(done, total):
+                    progress_bar.progress(done / total)
+                    status_text.text(f"Skonwertowano partii: {done}/{total}")
+                
+                html_cache = st.session_state.html_cache
+                html_cache.disk_path = DISK_CACHE_PATH if use_disk_cache else None
+                html_cache.begin_run()
+                html_incremental = st.session_state.html_incremental
+                html_incremental.begin_run()
+                
+                # Procesy robocze dzielone z innymi sesjami - przy zajętym serwerze zadanie czeka w kolejce
+                parallel = len(working_df) * len(mapping) >= PARALLEL_MIN_ROWS
+                with GOVERNOR.workers.admit(
+                    workers if parallel else 1, on_wait=queue_notice(status_text)
+                ) as worker_grant:
+                    status_text.empty()
                     
-                    workbook = writer.book
-                    worksheet = writer.sheets['Produkty_HTML']
+                    # Wszystkie kolumny w jednym przebiegu i jednej puli procesów
+                    path_stats = {}
+                    html_batches = iter_converted_columns(
+                        [
+                            (working_df[row['Kolumna źródłowa']], column_options(row, options))
+                            for _, row in mapping.iterrows()
+                        ],
+                        workers=worker_grant.units,
+                        progress_callback=show_progress,
+                        cache=html_cache,
+                        incremental=html_incremental,
+                        path_stats=path_stats
+                    )
                     
-                    text_format = workbook.add_format({'num_format': '@'})
-                    worksheet.set_column(0, 0, 20, text_format)
-                    worksheet.set_column(1, 1, 100)
+                    def iter_rows():
+                        eans = iter(working_df[ean_column].fillna(''))
+                        for column_batches in html_batches:
+                            # EAN na końcu zip - zip kończy na krótszej partii, zanim pobierze kolejny EAN
+                            for *htmls, ean in zip(*column_batches, eans):
+                                yield (ean, *htmls)
                     
-                    header_format = workbook.add_format({
-                        'bold': True,
-                        'bg_color': '#D7E4BD',
-                        'border': 1
-                    })
-                    for col_num, value in enumerate(export_df.columns.values):
-                        worksheet.write(0, col_num, value, header_format)
-                
-                output.seek(0)
+                    header = ['sku'] + [str(name).strip() for name in mapping['Kolumna wynikowa']]
+                    extension, mime = EXPORT_FORMATS[export_format]
+                    # Konwersja odbywa się w trakcie zapisu - profil (?profile=1) obejmuje obie części
+                    with profile_run("Konwersja HTML"):
+                        export_file, row_count = export_rows(extension, header, iter_rows())
                 
-                # Nazwa pliku
-                original_name = uploaded_file.name.rsplit('.', 1)[0]
-                output_filename = f"{original_name}_HTML.xlsx"
+                progress_bar.progress(1.0)
+                status_text.text(f"✅ Skonwertowano {row_count} produktów × {len(mapping)} kolumn z opisami")
                 
-                # Pobieranie
-                st.markdown("---")
-                st.download_button(
-                    label=f"⬇️ POBIERZ EXCEL ({len(export_df)} produktów)",
-                    data=output,
-                    file_name=output_filename,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    width="stretch",
-                    type="primary"
+                st.caption(
+                    f"Ścieżka szybka (zwykły akapit): {path_stats['plain']} opisów, "
+                    f"pełny parser: {path_stats['structured']} opisów"
                 )
+                cache_stats = html_cache.run_stats
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Trafienia (pamięć)", cache_stats['memory_hits'])
+                col2.metric("Trafienia (dysk)", cache_stats['disk_hits'])
+                col3.metric("Powtórzone opisy", cache_stats['duplicates'])
+                col4.metric(
+                    "Nowe konwersje",
+                    cache_stats['converted'],
+                    help=f"Trafienia łącznie: {ConversionCache.hit_rate(cache_stats) * 100:.1f}%"
+                )
+                incremental_stats = html_incremental.run_stats
+                if incremental_stats['rendered']:
+                    st.caption(
+                        f"Z nowych konwersji: {incremental_stats['parsed']} sparsowano od nowa, "
+                        f"{incremental_stats['rendered']} tylko przerenderowano"
+                    )
+                
+                # Plik zostaje na dysku - w sesji tylko jego opis
+                original_name = uploaded_file.name.rsplit('.', 1)[0]
+                st.session_state.html_export = {
+                    'file': export_file,
+                    'file_name': f"{original_name}_HTML{extension}",
+                    'mime': mime,
+                    'label': f"⬇️ POBIERZ {extension[1:].upper()} ({row_count} produktów)",
+                }
+        
+        # Pobieranie poza przyciskiem konwersji - zostaje po odświeżeniu strony (np. kliknięciu pobierania),
+        # a plik czytany jest z dysku dopiero po kliknięciu
+        html_export = st.session_state.html_export
+        if html_export:
+            st.markdown("---")
+            st.download_button(
+                label=html_export['label'],
+                data=html_export['file'].read_bytes,
+                file_name=html_export['file_name'],
+                mime=html_export['mime'],
+                width="stretch",
+                type="primary"
+            )
+        
+        # Profil ostatniej konwersji (?profile=1) - widoczny także po kolejnych odświeżeniach strony
+        show_profile("Konwersja HTML")
                     
+    except AdmissionTimeoutError as e:
+        st.error(f"❌ {e}. Spróbuj ponownie za chwilę.")
     except Exception as e:
         st.error(f"❌ Błąd: {str(e)}")
 
@@ -1,8 +1,16 @@
+import os
 import streamlit as st
+import pandas as pd
 from PIL import Image
 import io
+import tempfile
+import weakref
 import zipfile
 from datetime import datetime
+from pathlib import Path
+from utils.image_convert import iter_convert_batch, avif_available, get_result_cache, PARALLEL_MIN_FILES, FULL_SIZE
+from utils.profiler import profile_run, show_profile
+from utils.governor import GOVERNOR, AdmissionTimeoutError, queue_notice
 
 # ============================================
 # KONFIGURACJA STRONY
@@ -34,46 +42,104 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+IMAGE_EXTENSIONS = ('webp', 'jpg', 'jpeg', 'png', 'bmp', 'gif', 'tiff')
+
 # ============================================
 # FUNKCJE POMOCNICZE
 # ============================================
 
-def convert_image(image_bytes, input_format, output_format, quality=95):
-    """Konwertuje obraz do wybranego formatu"""
-    try:
-        # Otwórz obraz
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Konwersja RGBA na RGB jeśli potrzeba (dla JPEG)
-        if output_format.upper() in ['JPEG', 'JPG'] and image.mode in ('RGBA', 'LA', 'P'):
-            # Utwórz białe tło
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        
-        # Konwertuj
-        output = io.BytesIO()
-        save_format = 'JPEG' if output_format.upper() == 'JPG' else output_format.upper()
-        
-        if save_format == 'JPEG':
-            image.save(output, format=save_format, quality=quality, optimize=True)
+def parse_sizes(sizes_text):
+    """Parsuje listę rozmiarów: 'oryginał', '600' (ramka 600×600), '800x600', '800x' lub 'x600'"""
+    sizes = []
+    errors = []
+    for token in sizes_text.replace(';', ',').split(','):
+        token = token.strip().lower().replace('×', 'x').replace(' ', '')
+        if not token:
+            continue
+        if token in ('oryginał', 'oryginal', 'pełny', 'pelny'):
+            size = FULL_SIZE
         else:
-            image.save(output, format=save_format, optimize=True)
-        
-        return output.getvalue()
+            width_text, separator, height_text = token.removesuffix('px').partition('x')
+            if not separator:
+                height_text = width_text
+            if not (width_text or height_text) or not all(
+                part.isdigit() and int(part) > 0 for part in (width_text, height_text) if part
+            ):
+                errors.append(token)
+                continue
+            width = int(width_text) if width_text else None
+            height = int(height_text) if height_text else None
+            label = f"{width}px" if not separator else f"{width or ''}x{height or ''}"
+            size = (label, width, height)
+        if size not in sizes:
+            sizes.append(size)
+    return sizes, errors
+
+def safe_archive_path(name):
+    """Ścieżka z archiwum bez katalogów wychodzących poza archiwum ('..', '/' na początku)"""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return '/'.join(parts)
+
+def archive_image_entries(zip_file):
+    """Wpisy archiwum ZIP będące obrazami (bez katalogów i plików systemowych macOS)"""
+    return [
+        info for info in zip_file.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith('__MACOSX/')
+        and not info.filename.rsplit('/', 1)[-1].startswith('._')
+        and info.filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+    ]
+
+def count_input_files(uploaded_files):
+    """Liczba obrazów do konwersji - pliki ZIP liczone z indeksu archiwum"""
+    count = 0
+    for uploaded_file in uploaded_files:
+        if uploaded_file.name.lower().endswith('.zip'):
+            with zipfile.ZipFile(uploaded_file) as zip_file:
+                count += len(archive_image_entries(zip_file))
+        else:
+            count += 1
+    return count
+
+def read_archive_entry(zip_file, info):
+    """Bajty wpisu ZIP albo wyjątek (zła suma CRC, szyfrowanie, nieobsługiwana kompresja) - raportowany dla tego pliku"""
+    try:
+        return zip_file.read(info)
     except Exception as e:
-        raise Exception(f"Błąd konwersji: {str(e)}")
+        return ValueError(f"Nie udało się odczytać pliku z archiwum: {e}")
+
+def iter_input_files(uploaded_files):
+    """Zwraca kolejno (nazwa, bajty) - wpisy ZIP są odczytywane pojedynczo, ze ścieżką z archiwum"""
+    for uploaded_file in uploaded_files:
+        if uploaded_file.name.lower().endswith('.zip'):
+            with zipfile.ZipFile(uploaded_file) as zip_file:
+                for info in archive_image_entries(zip_file):
+                    yield safe_archive_path(info.filename), read_archive_entry(zip_file, info)
+        else:
+            yield uploaded_file.name, uploaded_file.getvalue()
+
+def remove_file(path):
+    Path(path).unlink(missing_ok=True)
 
-def create_zip(files_dict):
-    """Tworzy archiwum ZIP z plików"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, file_data in files_dict.items():
-            zip_file.writestr(filename, file_data)
-    zip_buffer.seek(0)
-    return zip_buffer
+class ResultArchive:
+    """Archiwum ZIP z wynikami w pliku tymczasowym - usuwane przy kolejnej konwersji, błędzie lub końcu sesji"""
+    def __init__(self):
+        handle, self.path = tempfile.mkstemp(suffix='.zip')
+        os.close(handle)
+        # Streamlit nie zgłasza końca sesji - plik znika, gdy zwolniony zostanie jej session_state
+        # (albo przy zamknięciu procesu)
+        self._finalizer = weakref.finalize(self, remove_file, self.path)
+
+    def remove(self):
+        self._finalizer()
+
+    def read_bytes(self):
+        """Całe archiwum - wywoływane dopiero po kliknięciu pobierania"""
+        return Path(self.path).read_bytes()
+
+    def read_member(self, name):
+        with zipfile.ZipFile(self.path) as zip_file:
+            return zip_file.read(name)
 
 def get_image_info(image_bytes):
     """Zwraca informacje o obrazie"""
@@ -101,25 +167,106 @@ with st.sidebar:
     st.header("⚙️ Ustawienia konwersji")
     
     # Format wyjściowy
+    output_formats = ["PNG", "JPG", "WEBP", "BMP", "TIFF"]
+    if avif_available():
+        output_formats.insert(3, "AVIF")
     output_format = st.selectbox(
         "Format wyjściowy:",
-        ["PNG", "JPG", "BMP", "TIFF"],
+        output_formats,
         index=0,
-        help="Wybierz format docelowy"
+        help="Wybierz format docelowy. WebP i AVIF dają najmniejsze pliki (AVIF - jeśli obsługuje go instalacja Pillow)"
     )
     
-    # Jakość (tylko dla JPEG)
+    # Jakość i wysiłek kompresji (JPEG, WebP, AVIF)
     quality = 95
-    if output_format == "JPG":
+    lossless = False
+    effort = None
+    if output_format == "WEBP":
+        lossless = st.checkbox(
+            "WebP bezstratny",
+            value=False,
+            help="Bez utraty jakości - zwykle większy plik niż stratny, mniejszy niż PNG"
+        )
+    if output_format in ("JPG", "WEBP", "AVIF") and not lossless:
         quality = st.slider(
-            "Jakość JPEG:",
+            f"Jakość {output_format}:",
             min_value=10,
             max_value=100,
-            value=95,
+            value=95 if output_format == "JPG" else 80,
             step=5,
             help="Wyższa wartość = lepsza jakość, większy plik"
         )
     
+    # Docelowy rozmiar pliku - jakość dobierana osobno dla każdego obrazu
+    target_kb = None
+    min_quality = 10
+    allow_downscale = False
+    if output_format in ("JPG", "WEBP", "AVIF") and not lossless:
+        if st.checkbox(
+            "🎯 Docelowy rozmiar pliku",
+            value=False,
+            help="Dla każdego obrazu wyszukiwana jest najwyższa jakość (nie wyższa niż z suwaka powyżej), "
+                 "przy której plik mieści się w limicie - np. limicie marketplace."
+        ):
+            target_kb = st.number_input("Maksymalny rozmiar pliku (KB):", min_value=10, value=500, step=50)
+            min_quality = min(st.slider(
+                "Minimalna jakość:",
+                min_value=10,
+                max_value=100,
+                value=40,
+                step=5,
+                help="Poniżej tej jakości plik nie jest już kompresowany mocniej"
+            ), quality)
+            allow_downscale = st.checkbox(
+                "Zmniejszaj wymiary, jeśli trzeba",
+                value=False,
+                help="Gdy nawet minimalna jakość daje za duży plik - obraz jest stopniowo zmniejszany"
+            )
+    
+    if output_format in ("WEBP", "AVIF"):
+        effort = st.slider(
+            "Wysiłek kompresji:",
+            min_value=0,
+            max_value=6 if output_format == "WEBP" else 10,
+            value=4,
+            help="Wyższa wartość = mniejszy plik, dłuższe kodowanie"
+        )
+    
+    pass_through = st.checkbox(
+        "Kopiuj pliki już zgodne",
+        value=True,
+        help="Pliki, które już mają format docelowy (rozpoznany z nagłówka, nie z rozszerzenia) i mieszczą się "
+             "w rozmiarze, trafiają do wyniku bez zmian - bez ponownej kompresji i utraty jakości. "
+             "Odznacz, aby wymusić ponowne zapisanie z wybraną jakością."
+    )
+    
+    # Rozmiary
+    st.markdown("---")
+    st.markdown("### 📐 Rozmiar")
+    
+    sizes_text = st.text_input(
+        "Rozmiary wyjściowe:",
+        value="oryginał",
+        help="Rozdzielone przecinkami: 'oryginał' - bez zmiany, '600' - ramka 600×600 px, "
+             "'800x600', '800x' - tylko szerokość, 'x600' - tylko wysokość. "
+             "Wszystkie rozmiary powstają z jednego dekodowania obrazu."
+    )
+    sizes, size_errors = parse_sizes(sizes_text)
+    if size_errors:
+        st.error(f"❌ Nieprawidłowe rozmiary: {', '.join(size_errors)}")
+    if not sizes:
+        sizes = [FULL_SIZE]
+    
+    fill = st.radio(
+        "Dopasowanie:",
+        ["Zmieść w ramce", "Wypełnij ramkę (przycięcie)"],
+        help="Zmieść - zachowuje cały obraz, nie powiększa. Wypełnij - wynik ma dokładnie wymiary ramki, "
+             "nadmiar jest przycinany ze środka (dotyczy rozmiarów z szerokością i wysokością)."
+    ) == "Wypełnij ramkę (przycięcie)"
+    
+    if len(sizes) > 1:
+        st.caption("W archiwum ZIP każdy rozmiar trafia do osobnego folderu")
+    
     # Opcje nazewnictwa
     st.markdown("---")
     st.markdown("### 📝 Nazewnictwo")
@@ -134,21 +281,57 @@ with st.sidebar:
         prefix = st.text_input("Prefiks:", value="converted_")
     else:
         prefix = ""
+    
+    st.markdown("---")
+    st.markdown("### ⚡ Wydajność")
+    workers = st.number_input(
+        "Procesy konwersji",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=os.cpu_count() or 1,
+        help=f"Od {PARALLEL_MIN_FILES} plików konwersja odbywa się równolegle w wielu procesach. "
+             "Wartość 1 wymusza konwersję po kolei. Procesy są dzielone z zadaniami innych użytkowników."
+    )
+    use_cache = st.checkbox(
+        "Zapamiętuj wyniki konwersji",
+        value=True,
+        help="Ponowna konwersja tych samych plików z tymi samymi ustawieniami korzysta z zapisanych wyników. "
+             "Przy kilku rozmiarach konwertowane są tylko te, których jeszcze nie ma."
+    )
+    
+    result_cache = get_result_cache()
+    if result_cache.entries:
+        st.caption(
+            f"Zapisane wyniki: {len(result_cache.entries)} "
+            f"({result_cache.total_bytes / (1024 * 1024):.1f} MB)"
+        )
+    if st.button("🗑️ Wyczyść zapisane wyniki", type="secondary"):
+        result_cache.clear()
+        st.rerun()
+
+# Inicjalizacja session_state
+if 'converter_results' not in st.session_state:
+    st.session_state.converter_results = None
 
 # Główna część aplikacji
 st.markdown("### 📤 Wybierz pliki do konwersji")
 
 # Upload plików
 uploaded_files = st.file_uploader(
-    "Wybierz obrazy WebP",
-    type=['webp', 'jpg', 'jpeg', 'png', 'bmp', 'gif', 'tiff'],
+    "Wybierz obrazy WebP lub archiwa ZIP",
+    type=[*IMAGE_EXTENSIONS, 'zip'],
     accept_multiple_files=True,
     help="Możesz wybrać wiele plików jednocześnie. Obsługiwane formaty: WebP, JPG, PNG, BMP, GIF, TIFF"
 )
 
 if uploaded_files:
     # Pokaż informacje o wgranych plikach
-    st.info(f"📁 Wybrano **{len(uploaded_files)}** plików")
+    try:
+        input_count = count_input_files(uploaded_files)
+    except zipfile.BadZipFile as e:
+        st.error(f"❌ Nieprawidłowe archiwum ZIP: {str(e)}")
+        st.stop()
+    st.info(f"📁 Wybrano **{len(uploaded_files)}** plików ({input_count} obrazów do konwersji)")
     
     # Tabela z informacjami o plikach
     with st.expander("📋 Lista plików"):
@@ -165,49 +348,139 @@ if uploaded_files:
     st.markdown("---")
     
     if st.button(f"🚀 KONWERTUJ DO {output_format}", type="primary", width="stretch"):
-        converted_files = {}
         errors = []
         
         # Progress bar
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        # Konwertuj każdy plik
-        for idx, uploaded_file in enumerate(uploaded_files):
-            progress = (idx + 1) / len(uploaded_files)
-            progress_bar.progress(progress)
-            status_text.text(f"Konwertuję: {uploaded_file.name} ({idx + 1}/{len(uploaded_files)})")
-            
-            try:
-                # Odczytaj plik
-                file_bytes = uploaded_file.read()
-                
-                # Pobierz format wejściowy
-                input_format = uploaded_file.name.split('.')[-1].upper()
-                
-                # Konwertuj
-                if output_format == "JPG":
-                    converted_bytes = convert_image(file_bytes, input_format, output_format, quality)
-                else:
-                    converted_bytes = convert_image(file_bytes, input_format, output_format)
-                
-                # Ustal nazwę pliku wyjściowego
-                if keep_original_name:
-                    base_name = uploaded_file.name.rsplit('.', 1)[0]
-                    output_filename = f"{base_name}.{output_format.lower()}"
-                else:
-                    base_name = uploaded_file.name.rsplit('.', 1)[0]
-                    output_filename = f"{prefix}{base_name}.{output_format.lower()}"
+        def show_progress(done, total, name):
+            progress_bar.progress(done / total)
+            status_text.text(f"Konwertuję: {name} ({done}/{total})")
+        
+        # Pliki (i wpisy archiwów ZIP) są odczytywane dopiero, gdy konwersja ich potrzebuje
+        settings = {
+            'output_format': output_format,
+            'quality': quality,
+            'lossless': lossless,
+            'effort': effort,
+            'sizes': tuple(sizes),
+            'fill': fill,
+            'pass_through': pass_through,
+            'target_bytes': target_kb * 1024 if target_kb else None,
+            'min_quality': min_quality,
+            'allow_downscale': allow_downscale,
+        }
+        batch_stats = []
+        target_rows = []
+        
+        # Procesy robocze dzielone z innymi sesjami - przy zajętym serwerze zadanie czeka w kolejce
+        parallel = workers > 1 and input_count >= PARALLEL_MIN_FILES
+        
+        # Wyniki trafiają od razu do archiwum na dysku - w pamięci jest tylko bieżący plik
+        archive = ResultArchive()
+        try:
+            with GOVERNOR.workers.admit(workers if parallel else 1, on_wait=queue_notice(status_text)) as worker_grant, \
+                    profile_run("Konwersja obrazów"), \
+                    zipfile.ZipFile(archive.path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                status_text.empty()
+                results = iter_convert_batch(
+                    iter_input_files(uploaded_files),
+                    settings,
+                    workers=worker_grant.units,
+                    total=input_count,
+                    progress_callback=show_progress,
+                    cache=get_result_cache() if use_cache else None
+                )
+                archive_names = set()
                 
-                converted_files[output_filename] = converted_bytes
+                # Wyniki wracają w kolejności wgrania plików
+                for file_name, converted_sizes, error, file_stats in results:
+                    if error:
+                        errors.append(f"❌ {file_name}: {error}")
+                        continue
+                    
+                    batch_stats.append(file_stats)
+                    
+                    # Ustal nazwę pliku wyjściowego (katalogi z archiwum ZIP zostają zachowane)
+                    directory, _, file_base = file_name.rpartition('/')
+                    base_name = file_base.rsplit('.', 1)[0]
+                    if keep_original_name:
+                        output_filename = f"{base_name}.{output_format.lower()}"
+                    else:
+                        output_filename = f"{prefix}{base_name}.{output_format.lower()}"
+                    if directory:
+                        output_filename = f"{directory}/{output_filename}"
+                    
+                    # Przy kilku rozmiarach - osobny folder dla każdego
+                    for label, converted_bytes in converted_sizes.items():
+                        archive_name = f"{label}/{output_filename}" if len(sizes) > 1 else output_filename
+                        if archive_name in archive_names:
+                            errors.append(f"⚠️ {file_name}: pominięto - {archive_name} już jest w archiwum")
+                            continue
+                        archive_names.add(archive_name)
+                        zip_file.writestr(archive_name, converted_bytes)
+                        
+                        if target_kb:
+                            # Wyniki z pamięci podręcznej nie mają zapisanej jakości
+                            target = file_stats.get('targets', {}).get(label)
+                            target_rows.append({
+                                'Plik': archive_name,
+                                'Rozmiar (KB)': round(len(converted_bytes) / 1024, 1),
+                                'Jakość': str(target['quality'] or 'bez zmian') if target else 'z pamięci',
+                                'Wymiary': f"{target['size'][0]}×{target['size'][1]}" if target else '',
+                                'Mieści się': len(converted_bytes) <= target_kb * 1024,
+                            })
+                    del converted_sizes
                 
-            except Exception as e:
-                errors.append(f"❌ {uploaded_file.name}: {str(e)}")
+                # Statystyki z indeksu archiwum, bez trzymania wyników w pamięci
+                archive_index = [(info.filename, info.file_size) for info in zip_file.infolist()]
+        except AdmissionTimeoutError as e:
+            # Serwer zajęty przez inne sesje - komunikat zamiast błędu aplikacji
+            archive.remove()
+            status_text.empty()
+            st.error(f"❌ {e}. Spróbuj ponownie za chwilę.")
+            st.stop()
+        except BaseException:
+            # Błąd lub przerwanie (np. zamknięcie karty) - niepełne archiwum nie trafia do sesji
+            archive.remove()
+            raise
         
         # Zakończenie
         progress_bar.progress(1.0)
         status_text.text("✅ Konwersja zakończona!")
         
+        settings_text = f"{output_format}"
+        if output_format in ("JPG", "WEBP", "AVIF"):
+            settings_text += ", bezstratny" if lossless else f", jakość {quality}"
+        if effort is not None:
+            settings_text += f", wysiłek {effort}"
+        if target_kb:
+            settings_text += f", cel {target_kb} KB (jakość {min_quality}-{quality})"
+            if allow_downscale:
+                settings_text += ", ze zmniejszaniem"
+        
+        # Poprzednie archiwum nie będzie już pobierane
+        if st.session_state.converter_results:
+            st.session_state.converter_results['archive'].remove()
+        st.session_state.converter_results = {
+            'archive': archive,
+            'archive_index': archive_index,
+            'errors': errors,
+            'batch_stats': batch_stats,
+            'target_rows': target_rows,
+            'output_format': output_format,
+            'settings_text': settings_text,
+        }
+    
+    # Wyniki zostają w sesji - np. kliknięcie pobierania nie wymaga ponownej konwersji
+    if st.session_state.converter_results:
+        results = st.session_state.converter_results
+        archive_index = results['archive_index']
+        errors = results['errors']
+        batch_stats = results['batch_stats']
+        output_format = results['output_format']
+        
         # Pokaż błędy jeśli wystąpiły
         if errors:
             st.warning(f"⚠️ Wystąpiły błędy w {len(errors)} plikach")
@@ -216,15 +489,15 @@ if uploaded_files:
                     st.text(error)
         
         # Statystyki konwersji
-        if converted_files:
+        if archive_index:
             st.markdown("---")
             
             # Pokaż statystyki
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Skonwertowano", len(converted_files))
+                st.metric("Skonwertowano", len(archive_index))
             with col2:
-                total_size = sum(len(data) for data in converted_files.values())
+                total_size = sum(size for _, size in archive_index)
                 st.metric("Całkowity rozmiar", f"{total_size / (1024*1024):.1f} MB")
             with col3:
                 st.metric("Format wyjściowy", output_format)
@@ -233,43 +506,78 @@ if uploaded_files:
             st.markdown("---")
             st.markdown("### 💾 Pobierz skonwertowane pliki")
             
-            if len(converted_files) == 1:
-                # Pojedynczy plik - bezpośrednie pobieranie
-                filename = list(converted_files.keys())[0]
-                file_data = list(converted_files.values())[0]
-                
+            if len(archive_index) == 1:
+                # Pojedynczy plik - bezpośrednie pobieranie (odczyt z archiwum dopiero po kliknięciu)
+                filename = archive_index[0][0]
                 st.download_button(
                     label=f"⬇️ POBIERZ {filename}",
-                    data=file_data,
-                    file_name=filename,
+                    data=lambda: results['archive'].read_member(filename),
+                    file_name=filename.rsplit('/', 1)[-1],
                     mime=f"image/{output_format.lower()}",
                     width="stretch",
                     type="primary"
                 )
             else:
-                # Wiele plików - tworzenie ZIP
-                zip_buffer = create_zip(converted_files)
+                # Wiele plików - gotowe archiwum ZIP z dysku, odczytywane dopiero po kliknięciu
                 zip_filename = f"converted_images_{output_format.lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
                 
                 st.download_button(
-                    label=f"⬇️ POBIERZ ZIP ({len(converted_files)} plików)",
-                    data=zip_buffer,
+                    label=f"⬇️ POBIERZ ZIP ({len(archive_index)} plików)",
+                    data=results['archive'].read_bytes,
                     file_name=zip_filename,
                     mime="application/zip",
                     width="stretch",
                     type="primary"
                 )
             
+            # Raport: rozmiar wejścia i wyniku oraz czas kodowania według formatu wejściowego
+            with st.expander("📊 Raport partii - rozmiar i czas kodowania"):
+                st.caption(f"Ustawienia: {results['settings_text']}")
+                
+                report = pd.DataFrame(batch_stats).groupby('input_format').agg(
+                    pliki=('input_bytes', 'size'),
+                    wejscie=('input_bytes', 'sum'),
+                    wynik=('output_bytes', 'sum'),
+                    kodowanie=('encode_seconds', 'sum'),
+                    skopiowane=('passed_through', 'sum'),
+                    z_cache=('cached', 'sum'),
+                )
+                report.loc['RAZEM'] = report.sum()
+                st.dataframe(
+                    pd.DataFrame({
+                        'Pliki': report['pliki'].astype(int),
+                        'Wejście (MB)': (report['wejscie'] / (1024 * 1024)).round(2),
+                        'Wynik (MB)': (report['wynik'] / (1024 * 1024)).round(2),
+                        'Wynik / wejście': (report['wynik'] / report['wejscie'] * 100).round(1).astype(str) + '%',
+                        'Kodowanie (s)': report['kodowanie'].round(2),
+                        'ms / plik': (report['kodowanie'] / report['pliki'] * 1000).round(1),
+                        'Skopiowane bez zmian': report['skopiowane'].astype(int),
+                        'Z pamięci podręcznej': report['z_cache'].astype(int),
+                    }).rename_axis('Format wejściowy'),
+                    width="stretch"
+                )
+            
+            # Docelowy rozmiar: uzyskana jakość i rozmiar każdego pliku
+            if results['target_rows']:
+                target_report = pd.DataFrame(results['target_rows'])
+                too_large = int((~target_report['Mieści się']).sum())
+                if too_large:
+                    st.warning(f"⚠️ {too_large} plików nie zmieściło się w limicie nawet przy minimalnej jakości")
+                with st.expander("🎯 Docelowy rozmiar - uzyskana jakość i rozmiar plików"):
+                    st.dataframe(target_report, width="stretch", hide_index=True)
+            
+            show_profile("Konwersja obrazów")
+            
             # Lista skonwertowanych plików
-            with st.expander(f"📋 Skonwertowane pliki ({len(converted_files)})"):
-                for i, (filename, file_data) in enumerate(converted_files.items(), 1):
+            with st.expander(f"📋 Skonwertowane pliki ({len(archive_index)})"):
+                for i, (filename, file_size) in enumerate(archive_index, 1):
                     col1, col2, col3 = st.columns([1, 4, 2])
                     with col1:
                         st.text(f"{i}.")
                     with col2:
                         st.text(filename)
                     with col3:
-                        st.text(f"{len(file_data) / 1024:.1f} KB")
+                        st.text(f"{file_size / 1024:.1f} KB")
 
 else:
     # Ekran powitalny
@@ -285,18 +593,25 @@ else:
         - **BMP** - format bitmap
         - **GIF** - format z animacjami
         - **TIFF** - format wysokiej jakości
+        - **ZIP** - archiwa z obrazami (struktura katalogów zostaje zachowana)
         
         ### Formaty wyjściowe:
         - **PNG** - najlepsza jakość, przezroczystość
         - **JPG** - mniejsze pliki, regulowana jakość
+        - **WebP** - stratny lub bezstratny, regulowana jakość i wysiłek kompresji
+        - **AVIF** - najmniejsze pliki (jeśli obsługuje go instalacja Pillow)
         - **BMP** - format bez kompresji
         - **TIFF** - profesjonalna jakość
         
         ### Funkcje:
         - ✅ Konwersja wielu plików jednocześnie
+        - ✅ Równoległa konwersja dużych partii w wielu procesach
         - ✅ Automatyczna konwersja RGBA → RGB dla JPEG
+        - ✅ Pliki już zgodne z formatem docelowym kopiowane bez ponownej kompresji
         - ✅ Zachowanie oryginalnych nazw plików
         - ✅ Regulacja jakości dla JPEG
+        - ✅ Docelowy rozmiar pliku - jakość dobierana osobno dla każdego obrazu
+        - ✅ Zmniejszanie i miniatury w wielu rozmiarach z jednego dekodowania
         - ✅ Automatyczne pakowanie do ZIP przy wielu plikach
         """)
 
@@ -0,0 +1,46 @@
+"""Zgodność konwertera opisów z korpusem wzorcowym (benchmarks/golden_html.json).
+
+Korpus zapisuje wejścia i oczekiwany HTML dla każdej kombinacji opcji. Po zamierzonej
+zmianie wyniku należy go odświeżyć: python benchmarks/bench_html_converter.py --update-golden
+"""
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+from utils.html_converter import DEFAULT_OPTIONS, convert_series, text_to_html
+
+GOLDEN_PATH = Path(__file__).resolve().parent.parent / 'benchmarks' / 'golden_html.json'
+GOLDEN = json.loads(GOLDEN_PATH.read_text(encoding='utf-8'))
+COMBINATIONS = [
+    dict(zip(DEFAULT_OPTIONS, values))
+    for values in itertools.product((True, False), repeat=len(DEFAULT_OPTIONS))
+]
+
+
+def label(options: dict) -> str:
+    """Zapis kombinacji jak w korpusie, np. '10110' - kolejność jak w DEFAULT_OPTIONS."""
+    return ''.join('1' if options[name] else '0' for name in DEFAULT_OPTIONS)
+
+
+def expected_outputs(options: dict) -> list[str]:
+    key = label(options)
+    return [case['outputs'][case['combinations'][key]] for case in GOLDEN['cases']]
+
+
+def test_golden_covers_current_options():
+    assert GOLDEN['options'] == list(DEFAULT_OPTIONS)
+
+
+@pytest.mark.parametrize('options', COMBINATIONS, ids=label)
+def test_text_to_html_matches_golden(options):
+    actual = [text_to_html(case['text'], options) for case in GOLDEN['cases']]
+    assert actual == expected_outputs(options)
+
+
+@pytest.mark.parametrize('options', COMBINATIONS, ids=label)
+def test_convert_series_matches_golden(options):
+    # Pełny potok - razem ze ścieżką szybką dla zwykłych akapitów
+    texts = [case['text'] for case in GOLDEN['cases']]
+    assert list(convert_series(texts, options, workers=1)) == expected_outputs(options)
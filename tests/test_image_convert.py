@@ -0,0 +1,34 @@
+"""Kopiowanie plików już zgodnych z wynikiem (pass_through) w utils/image_convert.py."""
+import io
+
+import pytest
+from PIL import Image
+
+from utils.image_convert import convert_image_sizes, webp_compression
+
+
+def webp_bytes(**options):
+    output = io.BytesIO()
+    Image.new('RGBA', (40, 30), (255, 0, 0, 100)).save(output, 'WEBP', **options)
+    return output.getvalue()
+
+
+LOSSY = webp_bytes(quality=80)
+LOSSLESS = webp_bytes(lossless=True)
+
+
+def test_webp_compression_from_header():
+    assert webp_compression(LOSSY) == 'lossy'
+    assert webp_compression(LOSSLESS) == 'lossless'
+    assert webp_compression(b'\x89PNG\r\n\x1a\n') is None
+
+
+@pytest.mark.parametrize('image_bytes, lossless, copied', [
+    (LOSSY, False, True),
+    (LOSSY, True, False),
+    (LOSSLESS, False, False),
+    (LOSSLESS, True, True),
+], ids=['stratny->stratny', 'stratny->bezstratny', 'bezstratny->stratny', 'bezstratny->bezstratny'])
+def test_webp_pass_through_respects_lossless(image_bytes, lossless, copied):
+    results = convert_image_sizes(image_bytes, 'WEBP', quality=80, lossless=lossless, pass_through=True)
+    assert (results['oryginal'] is image_bytes) == copied
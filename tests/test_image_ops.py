@@ -0,0 +1,96 @@
+"""Zgodność backendów obrazów (utils/image_ops.py) na korpusie z benchmarks/bench_image_backends.py.
+
+Niezmienniki operacji (np. brak przezroczystości po nałożeniu białego tła) są sprawdzane zawsze,
+na backendzie Pillow. Porównanie libvips z Pillow wymaga zainstalowanego pyvips.
+"""
+import io
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+import bench_image_backends as bench
+from utils.image_ops import normalize_image
+
+LOSSLESS_TOLERANCE = 2.0  # Średnia różnica na kanał (0-255) - różnice zaokrągleń przy skalowaniu i mieszaniu alfy
+LOSSY_TOLERANCE = 6.0  # Różne kodery JPEG/WebP przy tej samej jakości
+
+CORPUS = bench.synthetic_corpus()
+SIZE_LIMITS = {label: (width, height) for label, width, height in bench.SIZES}
+
+
+def decoded(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def is_transparent(image: Image.Image) -> bool:
+    if image.mode == 'P':
+        return 'transparency' in image.info
+    return 'A' in image.getbands() and image.getchannel('A').getextrema() != (255, 255)
+
+
+def mean_difference(first: Image.Image, second: Image.Image) -> float:
+    """Średnia różnica na kanał po sprowadzeniu obu obrazów do RGBA"""
+    difference = ImageChops.difference(first.convert('RGBA'), second.convert('RGBA'))
+    return sum(ImageStat.Stat(difference).mean) / 4
+
+
+@pytest.fixture(scope='module')
+def pillow_results():
+    return {operation: bench.run_operation('pillow', operation, CORPUS) for operation in bench.OPERATIONS}
+
+
+@pytest.mark.parametrize('operation', list(bench.OPERATIONS))
+def test_operation_invariants(operation, pillow_results):
+    _, _, may_keep_alpha = bench.OPERATIONS[operation]
+    sources = dict(CORPUS)
+    for name, outputs in pillow_results[operation].items():
+        source_size = decoded(sources[name]).size
+        for label, data in outputs.items():
+            image = decoded(data)
+            if not may_keep_alpha:
+                assert not is_transparent(image), f"{name} [{label}]: wynik ma przezroczystość"
+            max_width, max_height = SIZE_LIMITS.get(label, source_size)
+            assert image.width <= max_width and image.height <= max_height, f"{name} [{label}]: {image.size}"
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+@pytest.mark.parametrize('extension, save_format', [('.jpg', 'JPEG'), ('.png', 'PNG'), ('.webp', 'WEBP')])
+def test_normalize_image_matches_spec(mode, extension, save_format):
+    spec = {'max_width': 500, 'max_height': 400, 'mode': mode}
+    for name, data in CORPUS:
+        result, changed, _ = normalize_image(data, spec, extension)
+        image = decoded(result)
+        assert image.format == save_format, name
+        assert image.width <= 500 and image.height <= 400, name
+        assert not is_transparent(image), name
+        if save_format != 'WEBP':  # WebP zapisuje skalę szarości jako RGB
+            assert image.mode == mode, name
+        assert changed or result is data
+
+
+def test_normalize_image_keeps_matching_file():
+    name, data = next(item for item in CORPUS if item[0] == 'okladka.jpg')
+    spec = {'max_width': 2000, 'max_height': 2000, 'mode': None}
+    assert normalize_image(data, spec, '.jpg') == (data, False, False)
+
+
+@pytest.mark.parametrize('operation', list(bench.OPERATIONS))
+def test_vips_matches_pillow(operation, pillow_results):
+    pytest.importorskip('pyvips')
+    from utils.image_ops import vips_available
+    if not vips_available():
+        pytest.skip("libvips niedostępny")
+
+    _, lossy, may_keep_alpha = bench.OPERATIONS[operation]
+    tolerance = LOSSY_TOLERANCE if lossy else LOSSLESS_TOLERANCE
+    reference = pillow_results[operation]
+    for name, outputs in bench.run_operation('vips', operation, CORPUS).items():
+        for label, data in outputs.items():
+            image = decoded(data)
+            expected = decoded(reference[name][label])
+            assert image.size == expected.size, f"{name} [{label}]"
+            assert mean_difference(image, expected) <= tolerance, f"{name} [{label}]"
+            if not may_keep_alpha:
+                assert not is_transparent(image), f"{name} [{label}]"
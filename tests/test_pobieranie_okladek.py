@@ -0,0 +1,61 @@
+"""Circuit breaker strony pobierania okładek (pages/1_pobieranie_okladek.py).
+
+Strona jest skryptem Streamlit - test wykonuje tylko jej część z definicjami (do inicjalizacji
+session_state), bez interfejsu.
+"""
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+PAGE_PATH = Path(__file__).resolve().parent.parent / 'pages' / '1_pobieranie_okladek.py'
+
+
+@pytest.fixture(scope='module')
+def page():
+    source = PAGE_PATH.read_text(encoding='utf-8').split('# Inicjalizacja session_state')[0]
+    namespace = {'__name__': 'pobieranie_okladek', '__file__': str(PAGE_PATH)}
+    exec(compile(source, str(PAGE_PATH), 'exec'), namespace)
+    return namespace
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} Error", response=response)
+
+
+def open_breaker(page, host):
+    breaker = page['CircuitBreaker'](failure_threshold=1, reset_timeout=0.01, max_probes=1)
+    breaker.record_failure(host)
+    assert not breaker.allow(host)
+    time.sleep(0.02)
+    return breaker
+
+
+def test_half_open_probe_with_404_closes_breaker(page):
+    breaker = open_breaker(page, 'example.com')
+
+    def fetch(url):
+        raise http_error(404)
+
+    with pytest.raises(requests.HTTPError):
+        page['pobierz_obraz_z_ponowieniami']('http://example.com/brak.jpg', breaker, max_retries=0, fetch=fetch)
+
+    assert not breaker.gave_up('example.com')
+    assert breaker.retry_at('example.com') is None
+    assert breaker.allow('example.com')
+
+
+def test_half_open_probe_with_transient_error_keeps_breaker_open(page):
+    breaker = open_breaker(page, 'example.com')
+
+    def fetch(url):
+        raise http_error(503)
+
+    with pytest.raises(requests.HTTPError):
+        page['pobierz_obraz_z_ponowieniami']('http://example.com/okladka.jpg', breaker, max_retries=0, fetch=fetch)
+
+    assert breaker.gave_up('example.com')
+    assert not breaker.allow('example.com')
@@ -0,0 +1 @@
+"""Wspólne moduły pomocnicze dla stron aplikacji"""
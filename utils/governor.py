@@ -0,0 +1,246 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# ============================================
+# WSPÓLNE LIMITY ZASOBÓW DLA WSZYSTKICH SESJI
+# ============================================
+# Każda sesja Streamlit uruchamia własne pobieranie lub konwersję. Zadania zgłaszają się po
+# zasoby (żądania sieciowe, procesy robocze, bufor pobranych danych) do wspólnego dla procesu
+# zarządcy - gdy zasobów brakuje, czekają w kolejce zamiast spowalniać wszystkie zadania naraz.
+
+GLOBAL_NETWORK_SLOTS = 48  # Równoczesne żądania HTTP we wszystkich sesjach
+GLOBAL_WORKER_SLOTS = os.cpu_count() or 1  # Procesy robocze konwersji (obrazy i HTML) we wszystkich sesjach
+GLOBAL_BUFFER_BYTES = 512 * 1024 * 1024  # Pobrane dane czekające na przetworzenie
+ADMISSION_POLL_INTERVAL = 0.5  # Co tyle sekund czekające zadanie odświeża swoją pozycję w kolejce
+ADMISSION_TIMEOUT = 30 * 60
+BUFFER_WAIT_TIMEOUT = 300
+BUFFER_WAIT_SLICE = 0.25  # Co tyle sekund czekająca rezerwacja sprawdza, czy zadanie nie zostało przerwane
+
+
+class AdmissionTimeoutError(Exception):
+    """Zadanie zbyt długo czekało w kolejce na zasoby"""
+
+
+class AdmissionCancelledError(Exception):
+    """Zadanie przerwane w trakcie oczekiwania na zasoby"""
+
+
+def current_session_id():
+    """Identyfikator sesji Streamlit (poza sesją - wątku), według którego dzielone są zasoby"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else f"thread-{threading.get_ident()}"
+
+
+def queue_notice(placeholder):
+    """Callback on_wait pokazujący pozycję w kolejce w elemencie strony (np. st.empty())"""
+    def show(position):
+        placeholder.info(
+            f"⏳ W kolejce, pozycja {position} - serwer wykonuje teraz zadania innych użytkowników. "
+            "Zadanie ruszy automatycznie."
+        )
+    return show
+
+
+class Grant:
+    """Przydział jednostek zasobu dla jednego zadania"""
+
+    def __init__(self, pool, session_id, want):
+        self.pool = pool
+        self.session_id = session_id
+        self.want = want
+        self.units = 0
+
+    def allowed(self):
+        """Aktualny przydział - maleje do sprawiedliwego udziału, gdy inne sesje czekają lub pracują"""
+        return self.pool.rebalance(self)
+
+
+class SlotPool:
+    """Pula jednostek zasobu z kolejką zgłoszeń i sprawiedliwym podziałem między sesje.
+    
+    Zadanie dostaje najwyżej równy udział (pojemność / liczba sesji korzystających lub czekających).
+    Z kolejki jako pierwsze wychodzą zgłoszenia sesji, które mają najmniej przydziałów, a wśród
+    nich - najstarsze. Zadania, które mogą zmieniać liczbę równoległych operacji w trakcie pracy
+    (np. pobieranie), wywołują Grant.allowed() i oddają nadmiar, gdy pojawi się ktoś nowy.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.in_use = 0
+        self.grants = []
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def _sessions(self):
+        return {grant.session_id for grant in self.grants} | {grant.session_id for _, grant in self.queue}
+
+    def fair_share(self):
+        return max(1, self.capacity // max(1, len(self._sessions())))
+
+    def _ordered_queue(self):
+        holdings = {}
+        for grant in self.grants:
+            holdings[grant.session_id] = holdings.get(grant.session_id, 0) + 1
+        return sorted(self.queue, key=lambda entry: (holdings.get(entry[1].session_id, 0), entry[0]))
+
+    @contextmanager
+    def admit(self, want, on_wait: Optional[Callable[[int], None]] = None, timeout=ADMISSION_TIMEOUT):
+        """Czeka w kolejce na co najmniej jedną jednostkę i zwraca Grant (zwalniany po wyjściu z bloku).
+        
+        on_wait(pozycja) jest wywoływany w wątku zgłaszającym co ADMISSION_POLL_INTERVAL s oczekiwania.
+        """
+        grant = Grant(self, current_session_id(), max(1, want))
+        entry = (next(self.sequence), grant)
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.queue.append(entry)
+        try:
+            while True:
+                with self.condition:
+                    ordered = self._ordered_queue()
+                    if ordered[0] is entry and self.in_use < self.capacity:
+                        self.queue.remove(entry)
+                        self.grants.append(grant)
+                        grant.units = min(grant.want, self.fair_share(), self.capacity - self.in_use)
+                        self.in_use += grant.units
+                        self.condition.notify_all()
+                        break
+                    position = ordered.index(entry) + 1
+                    if time.monotonic() > deadline:
+                        raise AdmissionTimeoutError(
+                            f"Zasoby ({self.name}) zajęte przez inne zadania - "
+                            f"przekroczono czas oczekiwania ({timeout / 60:.0f} min)"
+                        )
+                # Poza blokadą - wywołanie Streamlit może przerwać skrypt (np. zamknięcie karty)
+                if on_wait is not None:
+                    on_wait(position)
+                with self.condition:
+                    self.condition.wait(ADMISSION_POLL_INTERVAL)
+        except BaseException:
+            with self.condition:
+                if entry in self.queue:
+                    self.queue.remove(entry)
+                    self.condition.notify_all()
+            raise
+        
+        try:
+            yield grant
+        finally:
+            with self.condition:
+                self.grants.remove(grant)
+                self.in_use -= grant.units
+                grant.units = 0
+                self.condition.notify_all()
+
+    def rebalance(self, grant):
+        """Dopasowuje przydział do sprawiedliwego udziału: oddaje nadmiar lub bierze wolne jednostki"""
+        with self.condition:
+            target = min(grant.want, self.fair_share())
+            if grant.units > target:
+                self.in_use -= grant.units - target
+                grant.units = target
+                self.condition.notify_all()
+            elif grant.units < target and not self.queue:
+                extra = min(target - grant.units, self.capacity - self.in_use)
+                if extra > 0:
+                    grant.units += extra
+                    self.in_use += extra
+            return grant.units
+
+    def usage(self):
+        with self.condition:
+            return {'in_use': self.in_use, 'capacity': self.capacity, 'queued': len(self.queue)}
+
+
+class BufferReservation:
+    """Bajty jednego zadania w buforze - rezerwowane przed odczytem danych i zwalniane razem z nimi.
+    
+    Z jednej rezerwacji może korzystać kilka wątków (np. żądanie i jego hedge).
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.nbytes = 0
+
+    def reserve(self, nbytes, timeout=BUFFER_WAIT_TIMEOUT, cancel_events=()):
+        """Czeka na miejsce dla nbytes (np. z Content-Length) - wywoływane przed odczytem treści.
+        
+        Ustawienie któregoś z cancel_events (threading.Event) przerywa oczekiwanie (AdmissionCancelledError).
+        """
+        self.budget._acquire(self, nbytes, timeout, cancel_events)
+
+    def add(self, nbytes):
+        """Dolicza bajty już odczytywanej odpowiedzi bez czekania - rozpoczęte pobieranie nie jest
+        wstrzymywane w połowie, więc zadania trzymające część danych nie blokują się nawzajem"""
+        with self.budget.condition:
+            self.budget.in_use += nbytes
+            self.nbytes += nbytes
+
+    def release(self, nbytes):
+        with self.budget.condition:
+            nbytes = min(nbytes, self.nbytes)
+            self.budget.in_use -= nbytes
+            self.nbytes -= nbytes
+            self.budget.condition.notify_all()
+
+
+class BufferBudget:
+    """Wspólny limit bajtów pobranych danych trzymanych w pamięci przed przetworzeniem"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+    def _acquire(self, reservation, nbytes, timeout, cancel_events=()):
+        # Plik większy niż cały limit czeka, aż bufor będzie pusty
+        needed = min(nbytes, self.capacity)
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            # Oczekiwanie w krótkich odcinkach - przerwanie zadania nie budzi warunku
+            while self.in_use + needed > self.capacity:
+                if any(event.is_set() for event in cancel_events):
+                    raise AdmissionCancelledError("Oczekiwanie na miejsce w buforze przerwane")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AdmissionTimeoutError(
+                        f"Brak miejsca w buforze pobranych danych ({nbytes / (1024*1024):.1f} MB) "
+                        f"po {timeout:.1f} s oczekiwania"
+                    )
+                self.condition.wait(min(remaining, BUFFER_WAIT_SLICE))
+            self.in_use += nbytes
+            reservation.nbytes += nbytes
+
+    @contextmanager
+    def hold(self):
+        """Rezerwacja na czas bloku (BufferReservation) - wszystko, co zarezerwowano, jest zwalniane po wyjściu"""
+        reservation = BufferReservation(self)
+        try:
+            yield reservation
+        finally:
+            reservation.release(reservation.nbytes)
+
+    def usage(self):
+        with self.condition:
+            return {'in_use': self.in_use, 'capacity': self.capacity}
+
+
+class ResourceGovernor:
+    """Limity całego procesu: żądania sieciowe, procesy robocze i bufor pobranych danych"""
+
+    def __init__(self, network_slots=GLOBAL_NETWORK_SLOTS, worker_slots=GLOBAL_WORKER_SLOTS,
+                 buffer_bytes=GLOBAL_BUFFER_BYTES):
+        self.network = SlotPool('sieć', network_slots)
+        self.workers = SlotPool('procesy robocze', worker_slots)
+        self.buffers = BufferBudget(buffer_bytes)
+
+
+GOVERNOR = ResourceGovernor()
@@ -0,0 +1,651 @@
+import hashlib
+import itertools
+import multiprocessing
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import pandas as pd
+
+# ============================================
+# FUNKCJE KONWERSJI TEKSTU NA HTML
+# ============================================
+
+# Wzorce kompilowane raz - wywoływane dla każdej linii każdego opisu
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+)$')
+BULLET_PATTERN = re.compile(r'^[-*•]\s+')
+NUMBERED_PATTERN = re.compile(r'^\d+[.)]\s+')
+BOLD_STARS_PATTERN = re.compile(r'\*\*(.+?)\*\*')
+BOLD_UNDERSCORES_PATTERN = re.compile(r'__(.+?)__')
+ITALIC_STAR_PATTERN = re.compile(r'\*([^*]+)\*')
+ITALIC_UNDERSCORE_PATTERN = re.compile(r'_([^_]+)_')
+
+
+def convert_inline_formatting(text: str) -> str:
+    """Konwertuje formatowanie inline (pogrubienie, kursywa)."""
+    # Kolejność przebiegów ma znaczenie (kolejny działa na wyniku poprzedniego),
+    # więc pomijane są tylko przebiegi, dla których w tekście brak znacznika
+    if '**' in text:
+        text = BOLD_STARS_PATTERN.sub(r'<strong>\1</strong>', text)
+    if '__' in text:
+        text = BOLD_UNDERSCORES_PATTERN.sub(r'<strong>\1</strong>', text)
+    if '*' in text:
+        text = ITALIC_STAR_PATTERN.sub(r'<em>\1</em>', text)
+    if '_' in text:
+        text = ITALIC_UNDERSCORE_PATTERN.sub(r'<em>\1</em>', text)
+    return text
+
+
+def detect_heading(line: str) -> Optional[tuple[int, str]]:
+    """Wykrywa nagłówki w różnych formatach."""
+    if line.startswith('#'):
+        match = HEADING_PATTERN.match(line)
+        if match:
+            level = len(match.group(1))
+            return (level, match.group(2))
+    
+    if line.endswith(':') and len(line) < 60 and not line.startswith('-'):
+        return (3, line[:-1])
+    
+    return None
+
+
+def tokenize_lines(lines: list[str], convert_headings: bool, convert_lists: bool) -> list[tuple]:
+    """Klasyfikuje każdą linię jeden raz: (tekst, nagłówek, punkt listy, punkt listy numerowanej)."""
+    tokens = []
+    for raw_line in lines:
+        line = raw_line.strip()
+        heading = bullet_item = numbered_item = None
+        
+        if line:
+            if convert_headings:
+                heading = detect_heading(line)
+            if convert_lists:
+                match = BULLET_PATTERN.match(line)
+                if match:
+                    bullet_item = line[match.end():]
+                else:
+                    match = NUMBERED_PATTERN.match(line)
+                    if match:
+                        numbered_item = line[match.end():]
+        
+        tokens.append((line, heading, bullet_item, numbered_item))
+    return tokens
+
+
+def parse_blocks(text: str, convert_headings: bool = True, convert_lists: bool = True) -> list[tuple]:
+    """Dzieli opis na bloki: ('h', poziom, tekst), ('ul'/'ol', punkty) i ('p', tekst)."""
+    tokens = tokenize_lines(str(text).strip().split('\n'), convert_headings, convert_lists)
+    blocks = []
+    
+    i = 0
+    count = len(tokens)
+    while i < count:
+        line, heading, bullet_item, numbered_item = tokens[i]
+        
+        if not line:
+            i += 1
+            continue
+        
+        # Nagłówki
+        if heading:
+            level, heading_text = heading
+            blocks.append(('h', level, heading_text))
+            i += 1
+            continue
+        
+        # Listy (punkt listy ma indeks 2, punkt listy numerowanej - 3)
+        if bullet_item is not None or numbered_item is not None:
+            kind, tag = (2, 'ul') if bullet_item is not None else (3, 'ol')
+            list_items = []
+            while i < count and tokens[i][kind] is not None:
+                list_items.append(tokens[i][kind])
+                i += 1
+            blocks.append((tag, tuple(list_items)))
+            continue
+        
+        # Zwykły paragraf
+        paragraph_lines = []
+        while i < count:
+            current_line, heading, bullet_item, numbered_item = tokens[i]
+            if not current_line or heading or bullet_item is not None or numbered_item is not None:
+                break
+            paragraph_lines.append(current_line)
+            i += 1
+        
+        if paragraph_lines:
+            blocks.append(('p', ' '.join(paragraph_lines)))
+    
+    return blocks
+
+
+def render_blocks(blocks: list[tuple], convert_formatting: bool = True, add_paragraphs: bool = True) -> str:
+    """Składa HTML z bloków opisu (bez opakowania w <div>)."""
+    format_inline = convert_inline_formatting if convert_formatting else str
+    html_parts = []
+    for block in blocks:
+        kind = block[0]
+        if kind == 'h':
+            _, level, heading_text = block
+            html_parts.append(f"<h{level}>{format_inline(heading_text)}</h{level}>")
+        elif kind == 'p':
+            paragraph_text = format_inline(block[1])
+            html_parts.append(f"<p>{paragraph_text}</p>" if add_paragraphs else paragraph_text)
+        else:
+            list_items = "\n".join(f"  <li>{format_inline(item)}</li>" for item in block[1])
+            html_parts.append(f"<{kind}>\n{list_items}\n</{kind}>")
+    return '\n\n'.join(html_parts)
+
+
+def wrap_html(html: str, wrap_in_div: bool) -> str:
+    """Opcjonalnie opakowuje gotowy HTML w <div>."""
+    if wrap_in_div:
+        return f'<div class="product-description">\n{html}\n</div>'
+    return html
+
+
+def text_to_html(text: str, options: dict) -> str:
+    """Główna funkcja konwertująca tekst na HTML."""
+    if not text or pd.isna(text):
+        return ""
+    
+    blocks = parse_blocks(
+        text,
+        options.get('convert_headings', True),
+        options.get('convert_lists', True)
+    )
+    html = render_blocks(
+        blocks,
+        options.get('convert_formatting', True),
+        options.get('add_paragraphs', True)
+    )
+    return wrap_html(html, options.get('wrap_in_div', False))
+
+
+# ============================================
+# KONWERSJA PRZYROSTOWA
+# ============================================
+
+INCREMENTAL_CACHE_CHARS = 25_000_000  # Limit tekstu opisów, których bloki pamięta jedna sesja
+PARSE_OPTIONS = ('convert_headings', 'convert_lists')  # Zmieniają podział opisu na bloki
+RENDER_OPTIONS = ('convert_formatting', 'add_paragraphs')  # Zmieniają tylko składanie HTML z bloków
+
+
+def parse_and_render(text: str, options: dict) -> tuple[list[tuple], str]:
+    """Parsuje opis i składa z niego HTML bez opakowania w <div>."""
+    blocks = parse_blocks(
+        text,
+        options.get('convert_headings', True),
+        options.get('convert_lists', True)
+    )
+    return blocks, render_blocks(
+        blocks,
+        options.get('convert_formatting', True),
+        options.get('add_paragraphs', True)
+    )
+
+
+class _LruStore:
+    """Słownik LRU ograniczony sumaryczną długością tekstu wartości."""
+
+    def __init__(self, max_chars: int):
+        self.items: OrderedDict[str, tuple] = OrderedDict()
+        self.chars = 0
+        self.max_chars = max_chars
+
+    def get(self, key: str):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        self.items.move_to_end(key)
+        return item[0]
+
+    def put(self, key: str, value, size: int) -> None:
+        if key in self.items:
+            self.items.move_to_end(key)
+            return
+        self.items[key] = (value, size)
+        self.chars += size
+        while self.chars > self.max_chars and self.items:
+            _, (_, evicted_size) = self.items.popitem(last=False)
+            self.chars -= evicted_size
+
+
+class IncrementalConverter:
+    """Pamięta sparsowane bloki opisów - po zmianie opcji renderowania HTML powstaje bez ponownego parsowania.
+
+    Gotowy HTML przechowuje tylko ConversionCache (jeden magazyn wyników na sesję) - tutaj
+    trafiają opisy, dla których w pamięci podręcznej nie ma HTML z bieżącymi opcjami.
+    """
+
+    def __init__(self, cache: Optional['ConversionCache'] = None, max_chars: int = INCREMENTAL_CACHE_CHARS):
+        self.cache = cache
+        self.blocks = _LruStore(max_chars)  # klucz: opis + opcje parsowania
+        self.totals = {'rows': 0, 'rendered': 0, 'parsed': 0}
+        self.run_stats = dict.fromkeys(self.totals, 0)
+
+    def begin_run(self) -> None:
+        """Zeruje statystyki bieżącej konwersji."""
+        self.run_stats = dict.fromkeys(self.totals, 0)
+
+    def convert(
+        self,
+        texts: Iterable,
+        options: dict,
+        parse_render: Optional[Callable[[list], list[tuple[list[tuple], str]]]] = None,
+    ) -> list[str]:
+        """Zwraca HTML dla opisów: gotowy z pamięci podręcznej, brakujący - z zapamiętanych bloków lub po parsowaniu."""
+        if self.cache is None:
+            return self.convert_missing(texts, options, parse_render)
+        return self.cache.convert(
+            texts,
+            options,
+            lambda missing: self.convert_missing(missing, options, parse_render),
+            record_stats=False
+        )
+
+    def convert_missing(
+        self,
+        texts: Iterable,
+        options: dict,
+        parse_render: Optional[Callable[[list], list[tuple[list[tuple], str]]]] = None,
+    ) -> list[str]:
+        """Zwraca HTML dla opisów spoza pamięci podręcznej; parse_render pozwala parsować np. w puli procesów."""
+        texts = list(texts)
+        parse_part = ','.join(f"{name}={bool(options.get(name, True))}" for name in PARSE_OPTIONS)
+        convert_formatting = options.get('convert_formatting', True)
+        add_paragraphs = options.get('add_paragraphs', True)
+        wrap_in_div = options.get('wrap_in_div', False)
+        
+        results: list[Optional[str]] = [None] * len(texts)
+        to_parse = []  # (indeks, klucz bloków, opis)
+        rendered = 0
+        for index, text in enumerate(texts):
+            if not text or pd.isna(text):
+                results[index] = ""
+                continue
+            parse_key = description_key(text, parse_part)
+            blocks = self.blocks.get(parse_key)
+            if blocks is not None:
+                # Bloki znane - zmieniło się tylko renderowanie
+                results[index] = wrap_html(render_blocks(blocks, convert_formatting, add_paragraphs), wrap_in_div)
+                rendered += 1
+            else:
+                # Komórki liczbowe itp. - jak w text_to_html konwertowane jako tekst
+                to_parse.append((index, parse_key, text if isinstance(text, str) else str(text)))
+        
+        if to_parse:
+            pending_texts = [text for _, _, text in to_parse]
+            if parse_render is not None:
+                parsed = parse_render(pending_texts)
+            else:
+                parsed = [parse_and_render(text, options) for text in pending_texts]
+            for (index, parse_key, text), (blocks, html) in zip(to_parse, parsed):
+                self.blocks.put(parse_key, blocks, len(text))
+                results[index] = wrap_html(html, wrap_in_div)
+        
+        batch_stats = {'rows': len(texts), 'rendered': rendered, 'parsed': len(to_parse)}
+        for name, value in batch_stats.items():
+            self.run_stats[name] += value
+            self.totals[name] += value
+        
+        return results
+
+
+# ============================================
+# KONWERSJA RÓWNOLEGŁA
+# ============================================
+
+PARALLEL_MIN_ROWS = 50000  # Poniżej tej liczby uruchomienie puli procesów kosztuje więcej niż daje
+CHUNK_SIZE = 1000  # Fragment wysyłany do jednego procesu roboczego
+BATCH_ROWS = 20000  # Wiersze przetwarzane naraz - tyle wyników jest jednocześnie w pamięci
+
+def _convert_chunk(texts: list, options: dict) -> list[str]:
+    """Konwertuje fragment opisów w procesie roboczym."""
+    return [text_to_html(text, options) for text in texts]
+
+
+def _parse_render_chunk(texts: list, options: dict) -> list[tuple[list[tuple], str]]:
+    """Parsuje i renderuje fragment opisów w procesie roboczym (dla konwersji przyrostowej)."""
+    return [parse_and_render(text, options) for text in texts]
+
+
+class _ConversionPool:
+    """Pula procesów tworzona przy pierwszej potrzebie - jedna na konwersję, wspólna dla wszystkich kolumn."""
+
+    def __init__(self, workers: Optional[int], enabled: bool):
+        self.workers = workers
+        self.enabled = enabled
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def run(self, texts: list, options: dict, chunk_function: Callable, local_function: Callable) -> list:
+        if not self.enabled or len(texts) < 2 * CHUNK_SIZE:
+            return [local_function(text, options) for text in texts]
+        
+        if self.executor is None:
+            # spawn zamiast fork - proces Streamlit ma wiele wątków, a fork kopiuje ich blokady
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        # Opcje idą z każdym fragmentem (kilka bajtów), bo kolumny mogą mieć różne opcje
+        chunks = [texts[start:start + CHUNK_SIZE] for start in range(0, len(texts), CHUNK_SIZE)]
+        results = self.executor.map(chunk_function, chunks, itertools.repeat(options))
+        return list(itertools.chain.from_iterable(results))
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class _BatchConverter:
+    """Konwertuje listy opisów z jednym zestawem opcji, korzystając ze wspólnej puli."""
+
+    def __init__(self, options: dict, pool: _ConversionPool, incremental: Optional[IncrementalConverter] = None):
+        self.options = options
+        self.pool = pool
+        self.incremental = incremental
+
+    def __call__(self, texts: list) -> list[str]:
+        if self.incremental is not None:
+            # HTML z pamięci podręcznej obsłużył już ConversionCache - tu tylko brakujące opisy
+            return self.incremental.convert_missing(texts, self.options, self._parse_and_render)
+        return self.pool.run(texts, self.options, _convert_chunk, text_to_html)
+
+    def _parse_and_render(self, texts: list) -> list[tuple[list[tuple], str]]:
+        return self.pool.run(texts, self.options, _parse_render_chunk, parse_and_render)
+
+
+# Znaki, po których opis może nie być jednym zwykłym akapitem (celowo z zapasem - takie
+# opisy przechodzą pełną ścieżkę, więc nadmiarowe dopasowanie kosztuje tylko czas)
+STRUCTURE_MARKERS = ('\n', '*', '_')
+STRUCTURE_START_PATTERN = r'[#\-•\d]'  # \d jak w NUMBERED_PATTERN - także cyfry spoza ASCII
+
+
+def split_plain(texts: pd.Series, options: dict) -> tuple[pd.Series, pd.Series]:
+    """Wektorowo wybiera opisy będące jednym zwykłym akapitem i od razu składa dla nich HTML.
+
+    Zwraca maskę takich opisów i ich HTML (indeksowany jak wybrane wiersze).
+    """
+    stripped = texts.str.strip()  # wartości niebędące tekstem dają NaN i trafiają do pełnej ścieżki
+    structured = (
+        stripped.str.match(STRUCTURE_START_PATTERN, na=True)
+        | stripped.str.endswith(':', na=True)
+    )
+    for marker in STRUCTURE_MARKERS:
+        # Wyszukiwanie podciągu zamiast jednego wyrażenia regularnego - kilkukrotnie szybsze
+        structured |= stripped.str.contains(marker, regex=False, na=True)
+    plain = stripped.str.len().gt(0) & ~structured
+    html = stripped[plain]
+    if options.get('add_paragraphs', True):
+        html = '<p>' + html + '</p>'
+    if options.get('wrap_in_div', False):
+        html = '<div class="product-description">\n' + html + '\n</div>'
+    return plain, html
+
+
+def iter_converted_columns(
+    columns: list[tuple[Iterable, dict]],
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cache: Optional['ConversionCache'] = None,
+    batch_rows: int = BATCH_ROWS,
+    incremental: Optional[IncrementalConverter] = None,
+    path_stats: Optional[dict] = None,
+) -> Iterator[list[list[str]]]:
+    """Konwertuje kilka kolumn opisów (każdą z własnymi opcjami) jednym przebiegiem i jedną pulą procesów.
+
+    Zwraca kolejne partie wierszy jako listę wyników dla każdej kolumny (kolejność zachowana).
+    Zwykłe akapity są składane wektorowo; path_stats (jeśli podany) zlicza wiersze
+    obu ścieżek w kluczach 'plain' i 'structured'.
+    """
+    columns = [(pd.Series(list(texts), dtype=object), options) for texts, options in columns]
+    row_count = len(columns[0][0]) if columns else 0
+    total_rows = row_count * len(columns)
+    batches = range(0, row_count, batch_rows)
+    pool = _ConversionPool(workers, total_rows >= PARALLEL_MIN_ROWS and workers != 1)
+    converters = [_BatchConverter(options, pool, incremental) for _, options in columns]
+    if path_stats is not None:
+        path_stats.setdefault('plain', 0)
+        path_stats.setdefault('structured', 0)
+    try:
+        for done, start in enumerate(batches, 1):
+            batch_results = []
+            for (texts, options), converter in zip(columns, converters):
+                batch = texts.iloc[start:start + batch_rows]
+                plain, plain_html = split_plain(batch, options)
+                structured = batch[~plain].tolist()
+                converted = []
+                if structured:
+                    converted = (
+                        cache.convert(structured, options, converter) if cache is not None
+                        else converter(structured)
+                    )
+                # Scalanie w Pythonie - przypisanie listy przez maskę w pandas jest wielokrotnie wolniejsze
+                plain_iter, converted_iter = iter(plain_html.tolist()), iter(converted)
+                batch_results.append([
+                    next(plain_iter) if is_plain else next(converted_iter) for is_plain in plain.tolist()
+                ])
+                
+                if path_stats is not None:
+                    path_stats['plain'] += len(plain_html)
+                    path_stats['structured'] += len(structured)
+            yield batch_results
+            if progress_callback:
+                progress_callback(done, len(batches))
+    finally:
+        pool.close()
+
+
+def iter_converted(
+    texts: Iterable,
+    options: dict,
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cache: Optional['ConversionCache'] = None,
+    batch_rows: int = BATCH_ROWS,
+    incremental: Optional[IncrementalConverter] = None,
+) -> Iterator[list[str]]:
+    """Konwertuje opisy partiami i zwraca kolejne partie wyników (kolejność zachowana)."""
+    for batch_results in iter_converted_columns(
+        [(texts, options)], workers, progress_callback, cache, batch_rows, incremental
+    ):
+        yield batch_results[0]
+
+
+def convert_series(
+    texts: Iterable,
+    options: dict,
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cache: Optional['ConversionCache'] = None,
+    incremental: Optional[IncrementalConverter] = None,
+) -> list[str]:
+    """Konwertuje opisy na HTML, duże wejścia fragmentami w puli procesów (kolejność zachowana)."""
+    return list(itertools.chain.from_iterable(
+        iter_converted(texts, options, workers, progress_callback, cache, incremental=incremental)
+    ))
+
+
+# ============================================
+# PAMIĘĆ PODRĘCZNA KONWERSJI
+# ============================================
+
+DEFAULT_OPTIONS = {
+    'add_paragraphs': True,
+    'convert_lists': True,
+    'convert_headings': True,
+    'convert_formatting': True,
+    'wrap_in_div': False,
+}
+MEMORY_CACHE_CHARS = 50_000_000  # Limit sumarycznej długości HTML w pamięci jednej sesji
+DISK_CACHE_PATH = Path(__file__).resolve().parent.parent / '.cache' / 'html_cache.sqlite'
+DISK_BATCH_SIZE = 500
+DISK_CACHE_MAX_CHARS = 500_000_000  # Limit sumarycznej długości HTML w pliku - najdawniej używane wiersze są usuwane
+
+
+def options_key(options: dict) -> str:
+    """Zamienia opcje na stały klucz (brakujące opcje przyjmują wartości domyślne text_to_html)."""
+    return ','.join(f"{name}={bool(options.get(name, default))}" for name, default in DEFAULT_OPTIONS.items())
+
+
+def description_key(text, options_part: str) -> str:
+    """Skrót opisu po normalizacji, która nie zmienia wyniku text_to_html."""
+    if not text or pd.isna(text):
+        normalized = '\x00empty'
+    else:
+        normalized = str(text).strip().replace('\r\n', '\n')
+    return hashlib.blake2b(f"{options_part}\x00{normalized}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ConversionCache:
+    """Pamięć podręczna wyników text_to_html: LRU w pamięci sesji i opcjonalnie SQLite na dysku."""
+
+    def __init__(
+        self,
+        max_chars: int = MEMORY_CACHE_CHARS,
+        disk_path: Optional[Path] = None,
+        disk_max_chars: int = DISK_CACHE_MAX_CHARS,
+    ):
+        self.memory: OrderedDict[str, str] = OrderedDict()
+        self.memory_chars = 0
+        self.max_chars = max_chars
+        self.disk_path = Path(disk_path) if disk_path else None
+        self.disk_max_chars = disk_max_chars
+        self.totals = {'rows': 0, 'memory_hits': 0, 'disk_hits': 0, 'duplicates': 0, 'converted': 0}
+        self.run_stats = dict.fromkeys(self.totals, 0)
+
+    def begin_run(self) -> None:
+        """Zeruje statystyki bieżącej konwersji (jedna konwersja to wiele partii)."""
+        self.run_stats = dict.fromkeys(self.totals, 0)
+
+    def _remember(self, key: str, html: str) -> None:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = html
+        self.memory_chars += len(html)
+        while self.memory_chars > self.max_chars and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_chars -= len(evicted)
+
+    def _connect(self) -> sqlite3.Connection:
+        self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.disk_path)
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(html_cache)')}
+        if columns and 'used' not in columns:
+            # Plik z wersji bez limitu rozmiaru - to tylko pamięć podręczna, więc zaczyna od nowa
+            connection.execute('DROP TABLE html_cache')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS html_cache '
+            '(key TEXT PRIMARY KEY, html TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS html_cache_used ON html_cache (used)')
+        return connection
+
+    def _disk_lookup(self, keys: list[str]) -> dict[str, str]:
+        found = {}
+        with self._connect() as connection:
+            for start in range(0, len(keys), DISK_BATCH_SIZE):
+                batch = keys[start:start + DISK_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = connection.execute(
+                    f'SELECT key, html FROM html_cache WHERE key IN ({placeholders})', batch
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    # Czas użycia decyduje o kolejności usuwania (LRU jak w pamięci)
+                    used_keys = [key for key, _ in rows]
+                    connection.execute(
+                        f"UPDATE html_cache SET used = ? WHERE key IN ({','.join('?' * len(used_keys))})",
+                        [time.time(), *used_keys]
+                    )
+        connection.close()
+        return found
+
+    def _disk_store(self, items: list[tuple[str, str]]) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO html_cache (key, html, size, used) VALUES (?, ?, ?, ?)',
+                [(key, html, len(html), now) for key, html in items]
+            )
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM html_cache').fetchone()[0]
+            if total > self.disk_max_chars:
+                # Zostają najświeżej używane wiersze mieszczące się w limicie
+                connection.execute(
+                    'DELETE FROM html_cache WHERE key IN ('
+                    'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS kept FROM html_cache) '
+                    'WHERE kept > ?)',
+                    (self.disk_max_chars,)
+                )
+        connection.close()
+
+    def convert(
+        self,
+        texts: Iterable,
+        options: dict,
+        converter: Callable[[list], list[str]],
+        record_stats: bool = True,
+    ) -> list[str]:
+        """Zwraca HTML dla opisów - converter wywoływany tylko dla unikalnych opisów spoza pamięci podręcznej.
+
+        record_stats=False - np. podgląd, który nie powinien zmieniać statystyk konwersji.
+        """
+        texts = list(texts)
+        options_part = options_key(options)
+        keys = [description_key(text, options_part) for text in texts]
+        
+        results: dict[str, str] = {}
+        missing: dict[str, object] = {}  # klucz -> pierwszy opis o tym kluczu
+        memory_hits = 0
+        for key, text in zip(keys, texts):
+            if key in results or key in missing:
+                continue
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                results[key] = self.memory[key]
+                memory_hits += 1
+            else:
+                missing[key] = text
+        
+        disk_hits = 0
+        if self.disk_path and missing:
+            found = self._disk_lookup(list(missing))
+            for key, html in found.items():
+                results[key] = html
+                self._remember(key, html)
+                del missing[key]
+            disk_hits = len(found)
+        
+        if missing:
+            converted = converter(list(missing.values()))
+            new_items = list(zip(missing.keys(), converted))
+            for key, html in new_items:
+                results[key] = html
+                self._remember(key, html)
+            if self.disk_path:
+                self._disk_store(new_items)
+        
+        batch_stats = {
+            'rows': len(texts),
+            'memory_hits': memory_hits,
+            'disk_hits': disk_hits,
+            'duplicates': len(texts) - len(results),
+            'converted': len(missing),
+        }
+        if record_stats:
+            for name, value in batch_stats.items():
+                self.run_stats[name] += value
+                self.totals[name] += value
+        
+        return [results[key] for key in keys]
+
+    @staticmethod
+    def hit_rate(stats: dict) -> float:
+        """Odsetek wierszy obsłużonych bez konwersji."""
+        return 1 - stats['converted'] / stats['rows'] if stats['rows'] else 0.0
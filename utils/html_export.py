@@ -0,0 +1,137 @@
+import csv
+import os
+import tempfile
+import weakref
+from typing import Iterable, Iterator
+
+import xlsxwriter
+
+# ============================================
+# EKSPORT STRUMIENIOWY
+# ============================================
+
+EXCEL_SHEET_NAME = 'Produkty_HTML'
+PARQUET_ROW_GROUP = 20000
+
+EXPORT_FORMATS = {
+    'Excel (.xlsx)': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'CSV (.csv)': ('.csv', 'text/csv'),
+    'Parquet (.parquet)': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def parquet_available() -> bool:
+    """Sprawdza czy zainstalowano opcjonalną bibliotekę pyarrow."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def write_excel(path: str, header: list[str], rows: Iterable[tuple]) -> int:
+    """Zapisuje wiersze do xlsx w trybie constant_memory - w pamięci jest tylko bieżący wiersz."""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(EXCEL_SHEET_NAME)
+    
+    text_format = workbook.add_format({'num_format': '@'})
+    worksheet.set_column(0, 0, 20, text_format)
+    worksheet.set_column(1, max(len(header) - 1, 1), 100)
+    
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#D7E4BD',
+        'border': 1
+    })
+    for col_num, value in enumerate(header):
+        worksheet.write(0, col_num, value, header_format)
+    
+    row_count = 0
+    for row_count, row in enumerate(rows, 1):
+        for col_num, value in enumerate(row):
+            worksheet.write(row_count, col_num, value)
+    
+    workbook.close()
+    return row_count
+
+
+def write_csv(path: str, header: list[str], rows: Iterable[tuple]) -> int:
+    """Zapisuje wiersze do CSV (UTF-8 z BOM, aby Excel poprawnie odczytał polskie znaki)."""
+    row_count = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for row_count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    return row_count
+
+
+def write_parquet(path: str, header: list[str], rows: Iterable[tuple]) -> int:
+    """Zapisuje wiersze do Parquet grupami wierszy (wymaga pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema([(name, pa.string()) for name in header])
+    row_count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in _batched(rows, PARQUET_ROW_GROUP):
+            columns = list(zip(*batch))
+            writer.write_table(pa.table(
+                {name: pa.array(column, type=pa.string()) for name, column in zip(header, columns)},
+                schema=schema
+            ))
+            row_count += len(batch)
+    return row_count
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+WRITERS = {
+    '.xlsx': write_excel,
+    '.csv': write_csv,
+    '.parquet': write_parquet,
+}
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ExportFile:
+    """Wynik eksportu w pliku tymczasowym - usuwany przez remove() lub po zwolnieniu obiektu (koniec sesji)."""
+
+    def __init__(self, extension: str):
+        fd, self.path = tempfile.mkstemp(suffix=extension)
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def read_bytes(self) -> bytes:
+        """Zawartość pliku - do odroczonego pobierania (st.download_button z funkcją w data)."""
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def remove(self) -> None:
+        self._finalizer()
+
+
+def export_rows(extension: str, header: list[str], rows: Iterable[tuple]) -> tuple[ExportFile, int]:
+    """Zapisuje wiersze do pliku tymczasowego w wybranym formacie. Zwraca (ExportFile, liczba wierszy)."""
+    export = ExportFile(extension)
+    try:
+        row_count = WRITERS[extension](export.path, header, rows)
+    except BaseException:
+        export.remove()
+        raise
+    return export, row_count
@@ -0,0 +1,493 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from PIL import Image
+
+from utils import image_guard
+from utils.image_guard import read_image_header
+from utils.image_ops import PILLOW, get_backend
+
+# ============================================
+# KONWERSJA POJEDYNCZEGO OBRAZU
+# ============================================
+
+FULL_SIZE = ('oryginal', None, None)  # Rozmiar bez zmniejszania: (etykieta, szerokość, wysokość)
+
+
+def output_size(source_size, max_width, max_height, fill=False):
+    """Wymiary wyniku: fit mieści obraz w ramce (bez powiększania), fill wypełnia ramkę dokładnie."""
+    width, height = source_size
+    if max_width is None and max_height is None:
+        return source_size
+    if fill and max_width and max_height:
+        return (max_width, max_height)
+    scale = min(
+        max_width / width if max_width else 1.0,
+        max_height / height if max_height else 1.0,
+        1.0
+    )
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+def resize_image(image, size, fill=False, backend=PILLOW):
+    """Skaluje obraz do podanych wymiarów; fill najpierw przycina środek do proporcji wyniku."""
+    if size == backend.size(image):
+        return image
+    
+    box = None
+    if fill:
+        # Największy środkowy fragment o proporcjach wyniku
+        width, height = backend.size(image)
+        crop_width = min(width, height * size[0] / size[1])
+        crop_height = min(height, width * size[1] / size[0])
+        left = (width - crop_width) / 2
+        top = (height - crop_height) / 2
+        box = (left, top, left + crop_width, top + crop_height)
+    return backend.resize(image, size, box=box)
+
+
+def decode_target_size(source_size, sizes, fill=False):
+    """Najmniejszy rozmiar dekodowania, z którego da się uzyskać wszystkie wyniki (None = pełny)."""
+    target = (0, 0)
+    for _, max_width, max_height in sizes:
+        if max_width is None and max_height is None:
+            return None
+        width, height = output_size(source_size, max_width, max_height, fill)
+        if fill and max_width and max_height:
+            # Przycięty fragment musi mieć co najmniej rozmiar wyniku w obu wymiarach
+            scale = max(width / source_size[0], height / source_size[1])
+            width, height = round(source_size[0] * scale), round(source_size[1] * scale)
+        target = (max(target[0], width), max(target[1], height))
+    return target
+
+
+def avif_available():
+    """Czy Pillow potrafi zapisywać AVIF (wbudowany od Pillow 11.2 lub wtyczka pillow-avif-plugin)"""
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def save_format_for(output_format):
+    """Nazwa formatu Pillow dla formatu wyjściowego z interfejsu"""
+    return 'JPEG' if output_format.upper() == 'JPG' else output_format.upper()
+
+
+def save_options(save_format, quality=95, lossless=False, effort=None):
+    """Parametry zapisu Pillow dla formatu; effort - wysiłek kompresji (WebP 0-6, AVIF 0-10)"""
+    if save_format == 'JPEG':
+        return {'quality': quality, 'optimize': True}
+    if save_format == 'WEBP':
+        options = {'quality': quality, 'lossless': lossless}
+        if effort is not None:
+            options['method'] = effort
+        return options
+    if save_format == 'AVIF':
+        options = {'quality': quality}
+        if effort is not None:
+            options['speed'] = 10 - effort  # AVIF: większa szybkość = mniejszy wysiłek
+        return options
+    return {'optimize': True}
+
+
+def encode_image(image, output_format, quality=95, lossless=False, effort=None, backend=PILLOW):
+    """Zapisuje zdekodowany obraz do wybranego formatu (przezroczystość w JPEG - na białym tle)"""
+    save_format = save_format_for(output_format)
+    return backend.encode(image, save_format, save_options(save_format, quality, lossless, effort))
+
+
+TARGET_DOWNSCALE_STEPS = 4  # Tyle razy najwyżej zmniejszane są wymiary, gdy minimalna jakość nie wystarcza
+TARGET_MIN_SCALE_STEP = 0.5  # Jednorazowo wymiary maleją najwyżej o połowę...
+TARGET_MAX_SCALE_STEP = 0.9  # ...i co najmniej o 10%
+
+
+def encode_to_target(
+    image, size, output_format, target_bytes, quality=95, min_quality=10,
+    allow_downscale=False, fill=False, effort=None, backend=PILLOW
+):
+    """Największa jakość z zakresu min_quality..quality, przy której plik mieści się w target_bytes.
+
+    Przeszukiwanie binarne po jakości na tym samym zdekodowanym obrazie. Jeśli nawet min_quality
+    daje za duży plik, a allow_downscale jest włączone - wymiary są zmniejszane (najwyżej
+    TARGET_DOWNSCALE_STEPS razy) i jakość szukana od nowa. Zwraca (bajty, jakość, wymiary, czy_zmieszczono);
+    gdy się nie udało - najmniejszy uzyskany wynik.
+    """
+    for step in range(TARGET_DOWNSCALE_STEPS + 1):
+        resized = resize_image(image, size, fill=fill, backend=backend)
+        data = encode_image(resized, output_format, quality, effort=effort, backend=backend)
+        if len(data) <= target_bytes:
+            return data, quality, size, True
+        
+        # Najwyższa jakość, która się mieści (quality już wiadomo, że nie)
+        smallest = (data, quality)
+        low, high = min_quality, quality - 1
+        best = None
+        while low <= high:
+            middle = (low + high) // 2
+            data = encode_image(resized, output_format, middle, effort=effort, backend=backend)
+            if len(data) <= target_bytes:
+                best = (data, middle)
+                low = middle + 1
+            else:
+                smallest = (data, middle)
+                high = middle - 1
+        if best is not None:
+            return best[0], best[1], size, True
+        
+        if not allow_downscale or step == TARGET_DOWNSCALE_STEPS or min(size) == 1:
+            return smallest[0], smallest[1], size, False
+        # Rozmiar pliku rośnie mniej więcej z liczbą pikseli - skala z pierwiastka stosunku rozmiarów
+        scale = min(max((target_bytes / len(smallest[0])) ** 0.5 * 0.95, TARGET_MIN_SCALE_STEP), TARGET_MAX_SCALE_STEP)
+        size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+
+
+def webp_compression(image_bytes):
+    """Rodzaj kompresji WebP z kontenera RIFF: 'lossy' (VP8), 'lossless' (VP8L) lub None (nieznany, animacja)"""
+    if image_bytes[:4] != b'RIFF' or image_bytes[8:12] != b'WEBP':
+        return None
+    offset = 12
+    while offset + 8 <= len(image_bytes):
+        chunk = image_bytes[offset:offset + 4]
+        if chunk == b'VP8 ':
+            return 'lossy'
+        if chunk == b'VP8L':
+            return 'lossless'
+        if chunk == b'ANIM':
+            return None
+        chunk_size = int.from_bytes(image_bytes[offset + 4:offset + 8], 'little')
+        offset += 8 + chunk_size + (chunk_size & 1)  # Fragmenty wyrównane do parzystej długości
+    return None
+
+
+def already_matches(header, output_format, size, image_bytes=b'', lossless=False):
+    """Czy plik (wg nagłówka) ma już format, tryb i wymiary wyniku - wtedy można go skopiować bez zmian"""
+    save_format = save_format_for(output_format)
+    if header['format'] != save_format or tuple(header['size']) != tuple(size):
+        return False
+    if save_format == 'WEBP':
+        # Kompresja musi być tą wybraną - gdy nie da się jej ustalić z nagłówka, plik jest kodowany
+        return webp_compression(image_bytes) == ('lossless' if lossless else 'lossy')
+    # Do JPEG przezroczystość jest spłaszczana na białe tło - taki plik trzeba przetworzyć
+    return not (save_format == 'JPEG' and header['mode'] in ('RGBA', 'LA', 'P'))
+
+
+def convert_image_sizes(
+    image_bytes, output_format, quality=95, sizes=(FULL_SIZE,), fill=False,
+    lossless=False, effort=None, pass_through=False, target_bytes=None, min_quality=10,
+    allow_downscale=False, stats=None
+):
+    """Konwertuje obraz do kilku rozmiarów z jednego dekodowania - zwraca {etykieta: bajty}
+
+    pass_through kopiuje bajt w bajt wyniki, które już mają format, tryb i wymiary docelowe
+    (bez dekodowania - format i tryb pochodzą z nagłówka, nie z rozszerzenia nazwy), a w WebP
+    także wybraną kompresję (stratna lub bezstratna).
+    target_bytes (formaty stratne) włącza dobór jakości, tak by każdy wynik się w nim mieścił -
+    quality jest wtedy jakością maksymalną (zob. encode_to_target).
+    stats (jeśli podany) dostaje format wejściowy, rozmiary wejścia i wyniku oraz czas kodowania,
+    a w trybie docelowego rozmiaru - uzyskaną jakość i wymiary każdego wyniku ('targets').
+    """
+    try:
+        header = read_image_header(image_bytes)
+        if lossless or save_format_for(output_format) not in ('JPEG', 'WEBP', 'AVIF'):
+            target_bytes = None  # Rozmiar formatów bezstratnych nie zależy od jakości
+        results = {}
+        targets = {}
+        to_encode = []
+        for label, max_width, max_height in sizes:
+            # Wymiary liczone względem nagłówka - draft zmienia wymiary zdekodowanego obrazu
+            size = output_size(header['size'], max_width, max_height, fill)
+            fits = target_bytes is None or len(image_bytes) <= target_bytes
+            if pass_through and fits and already_matches(header, output_format, size, image_bytes, lossless):
+                results[label] = image_bytes
+                targets[label] = {'quality': None, 'size': size, 'met': True}
+            else:
+                to_encode.append((label, max_width, max_height, size))
+        
+        encode_seconds = 0.0
+        if to_encode:
+            target_size = decode_target_size(header['size'], [spec[:3] for spec in to_encode], fill)
+            backend = get_backend(save_format_for(output_format))
+            # JPEG jest dekodowany od razu w zmniejszonej rozdzielczości (draft), jeśli wszystkie wyniki są mniejsze
+            with backend.open(image_bytes, target_size=target_size) as image:
+                for label, max_width, max_height, size in to_encode:
+                    size_fill = fill and bool(max_width and max_height)
+                    start = time.perf_counter()
+                    if target_bytes is None:
+                        resized = resize_image(image, size, fill=size_fill, backend=backend)
+                        results[label] = encode_image(resized, output_format, quality, lossless, effort, backend)
+                    else:
+                        # Wszystkie próby jakości korzystają z tego samego zdekodowanego obrazu
+                        results[label], used_quality, used_size, met = encode_to_target(
+                            image, size, output_format, target_bytes, quality, min_quality,
+                            allow_downscale, size_fill, effort, backend
+                        )
+                        targets[label] = {'quality': used_quality, 'size': used_size, 'met': met}
+                    encode_seconds += time.perf_counter() - start
+        
+        if stats is not None:
+            stats.update({
+                'input_format': header['format'],
+                'input_bytes': len(image_bytes),
+                'output_bytes': sum(len(data) for data in results.values()),
+                'encode_seconds': encode_seconds,
+                'passed_through': len(sizes) - len(to_encode),
+            })
+            if target_bytes is not None:
+                stats['targets'] = targets
+        return {label: results[label] for label, _, _ in sizes}
+    except Exception as e:
+        raise Exception(f"Błąd konwersji: {str(e)}")
+
+
+def convert_image(image_bytes, output_format, quality=95, max_width=None, max_height=None, fill=False):
+    """Konwertuje obraz do wybranego formatu (opcjonalnie zmniejszając)"""
+    size = ('wynik', max_width, max_height)
+    return convert_image_sizes(image_bytes, output_format, quality, (size,), fill)['wynik']
+
+# ============================================
+# PAMIĘĆ PODRĘCZNA WYNIKÓW
+# ============================================
+
+RESULT_CACHE_DIR = Path(__file__).resolve().parent.parent / '.cache' / 'converted_images'
+RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Po przekroczeniu usuwane są najdawniej używane wyniki
+
+
+def content_key(image_bytes):
+    """Skrót zawartości pliku - nazwa pliku nie ma znaczenia"""
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
+def output_key(settings, size_spec):
+    """Klucz wyniku dla jednego rozmiaru - tylko ustawienia, które faktycznie wpływają na ten wynik"""
+    output_format = save_format_for(settings['output_format'])
+    _, max_width, max_height = size_spec
+    lossless = output_format == 'WEBP' and settings.get('lossless', False)
+    parts = [
+        output_format,
+        max_width,
+        max_height,
+        bool(settings.get('fill', False) and max_width and max_height),
+        bool(settings.get('pass_through', False)),
+        lossless,
+    ]
+    if output_format in ('JPEG', 'WEBP', 'AVIF') and not lossless:
+        parts.append(settings.get('quality', 95))
+    if output_format in ('WEBP', 'AVIF'):
+        parts.append(settings.get('effort'))
+    if output_format in ('JPEG', 'WEBP', 'AVIF') and not lossless and settings.get('target_bytes'):
+        parts += [settings['target_bytes'], settings.get('min_quality', 10), bool(settings.get('allow_downscale'))]
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ResultCache:
+    """Wyniki konwersji na dysku (plik na wynik), ograniczone rozmiarem - najdawniej używane są usuwane.
+
+    Klucz to skrót zawartości pliku i ustawień, więc jedna pamięć może obsługiwać wszystkie sesje.
+    """
+
+    def __init__(self, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Kolejność LRU odtwarzana z czasów modyfikacji (odczyt aktualizuje czas pliku)
+        files = sorted(self.directory.glob('*.bin'), key=lambda path: path.stat().st_mtime)
+        self.entries: OrderedDict[str, int] = OrderedDict((path.stem, path.stat().st_size) for path in files)
+        self.total_bytes = sum(self.entries.values())
+
+    def _path(self, key):
+        return self.directory / f"{key}.bin"
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        try:
+            data = self._path(key).read_bytes()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            # Plik usunięty z zewnątrz - traktowany jak brak wyniku
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+
+    def put(self, key, data):
+        # Zapis do pliku tymczasowego i podmiana - inna sesja nigdy nie odczyta połowy pliku
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, self._path(key))
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                evicted, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self._path(evicted).unlink(missing_ok=True)
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                self._path(key).unlink(missing_ok=True)
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Wspólna dla całego procesu pamięć wyników (tworzona przy pierwszym użyciu)"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+# ============================================
+# KONWERSJA WSADOWA
+# ============================================
+
+PARALLEL_MIN_FILES = 20  # Mniejsze partie szybciej skonwertować w bieżącym procesie niż uruchamiać pulę
+QUEUED_PER_WORKER = 2  # Tyle plików na proces czeka w kolejce - reszta nie jest jeszcze kopiowana do puli
+PROGRESS_INTERVAL = 0.25  # Minimalny odstęp (s) między odświeżeniami paska postępu
+
+
+def _init_worker(decode_budget_bytes: int) -> None:
+    """Każdy proces dostaje część globalnego budżetu pamięci na dekodowanie."""
+    image_guard.DECODE_BUDGET = image_guard.DecodeBudget(decode_budget_bytes)
+
+
+def _convert_job(image_bytes: bytes, settings: dict) -> tuple[Optional[dict], Optional[str], dict]:
+    """Konwertuje jeden plik w procesie roboczym - błąd wraca jako tekst, żeby nie przerywać partii."""
+    stats = {}
+    try:
+        return convert_image_sizes(image_bytes, **settings, stats=stats), None, stats
+    except Exception as e:
+        return None, str(e), stats
+
+
+def _completed(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def iter_convert_batch(
+    files: Iterable[tuple[str, bytes]],
+    settings: dict,
+    workers: Optional[int] = None,
+    total: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int, str], None]] = None,
+    cache: Optional[ResultCache] = None,
+) -> Iterator[tuple[str, Optional[dict], Optional[str], dict]]:
+    """Konwertuje pliki (nazwa, bajty) i zwraca (nazwa, {etykieta rozmiaru: wynik}, błąd, statystyki)
+    w kolejności wejścia. settings to argumenty convert_image_sizes (output_format, quality, sizes...).
+    
+    Przy co najmniej PARALLEL_MIN_FILES plikach i więcej niż jednym procesie konwersja
+    odbywa się w puli procesów; do puli trafia naraz tylko kilka plików na proces.
+    Z cache (jeśli podany) brane są gotowe rozmiary - konwertowane są tylko brakujące.
+    Zamiast bajtów plik może mieć wyjątek odczytu (np. uszkodzony wpis ZIP) - trafia on do wyniku
+    jako błąd tego pliku, a konwersja pozostałych trwa dalej.
+    progress_callback(gotowe, wszystkie, nazwa) jest wywoływany nie częściej niż co PROGRESS_INTERVAL s.
+    """
+    if total is None and hasattr(files, '__len__'):
+        total = len(files)
+    last_progress = 0.0
+
+    def report(done, name):
+        nonlocal last_progress
+        now = time.monotonic()
+        if progress_callback and (now - last_progress >= PROGRESS_INTERVAL or done == total):
+            last_progress = now
+            progress_callback(done, total, name)
+    
+    workers = workers or multiprocessing.cpu_count()
+    executor = None
+    if workers > 1 and (total or 0) >= PARALLEL_MIN_FILES:
+        # spawn zamiast fork - proces Streamlit ma wiele wątków, a fork kopiuje ich blokady
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(image_guard.MAX_DECODED_BYTES // workers,)
+        )
+    
+    def start(image_bytes):
+        """Zwraca (klucz zawartości, wyniki z cache, Future z konwersją brakujących rozmiarów)."""
+        key, cached = None, {}
+        missing = settings['sizes']
+        if cache is not None:
+            key = content_key(image_bytes)
+            for size_spec in settings['sizes']:
+                data = cache.get(f"{key}_{output_key(settings, size_spec)}")
+                if data is not None:
+                    cached[size_spec[0]] = data
+            missing = tuple(size_spec for size_spec in settings['sizes'] if size_spec[0] not in cached)
+        if not missing:
+            stats = {
+                'input_format': read_image_header(image_bytes)['format'],
+                'input_bytes': len(image_bytes),
+                'output_bytes': 0,
+                'encode_seconds': 0.0,
+                'passed_through': 0,
+            }
+            return key, cached, _completed(({}, None, stats))
+        job_settings = {**settings, 'sizes': missing}
+        if executor is None:
+            return key, cached, _completed(_convert_job(image_bytes, job_settings))
+        return key, cached, executor.submit(_convert_job, image_bytes, job_settings)
+    
+    pending = deque()
+    done = 0
+    
+    def finish(keep):
+        """Oddaje gotowe wyniki z początku kolejki, aż zostanie w niej keep plików."""
+        nonlocal done
+        while len(pending) > keep:
+            name, key, cached, future = pending.popleft()
+            converted, error, stats = future.result()
+            done += 1
+            if error:
+                yield name, None, error, stats
+            else:
+                if cache is not None:
+                    for size_spec in settings['sizes']:
+                        if size_spec[0] in converted:
+                            cache.put(f"{key}_{output_key(settings, size_spec)}", converted[size_spec[0]])
+                stats['output_bytes'] += sum(len(data) for data in cached.values())
+                stats['cached'] = len(cached)
+                merged = {**cached, **converted}
+                yield name, {size_spec[0]: merged[size_spec[0]] for size_spec in settings['sizes']}, None, stats
+            report(done, name)
+    
+    # W trybie szeregowym wynik jest gotowy od razu - okno kolejki ma wtedy jeden plik
+    window = workers * QUEUED_PER_WORKER if executor is not None else 1
+    try:
+        for name, image_bytes in files:
+            try:
+                if isinstance(image_bytes, Exception):
+                    raise image_bytes
+                pending.append((name, *start(image_bytes)))
+            except Exception as e:
+                # Np. nieczytelny nagłówek pliku w całości obsłużonego z cache lub błąd odczytu wpisu ZIP
+                pending.append((name, None, {}, _completed((None, str(e), {}))))
+            yield from finish(window - 1)
+        yield from finish(0)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,95 @@
+import io
+import math
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+# ============================================
+# LIMITY PAMIĘCI DLA DEKODOWANIA OBRAZÓW
+# ============================================
+
+MAX_IMAGE_PIXELS = 60_000_000  # Budżet pikseli pojedynczego obrazu po zdekodowaniu
+MAX_DECODED_BYTES = 1024 * 1024 * 1024  # Łączny budżet zdekodowanych danych w całym procesie
+BYTES_PER_PIXEL = 4  # Szacunek dla RGBA - najczęstszego trybu po konwersjach
+BUDGET_WAIT_TIMEOUT = 300
+
+
+class ImageRejectedError(Exception):
+    """Obraz odrzucony przez limity pamięci"""
+
+
+class DecodeBudget:
+    """Globalny budżet zdekodowanych bajtów - wątki czekają, aż zwolni się miejsce"""
+    def __init__(self, capacity=MAX_DECODED_BYTES):
+        self.capacity = capacity
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, nbytes, timeout=BUDGET_WAIT_TIMEOUT):
+        """Rezerwuje nbytes; obraz większy niż cały budżet czeka, aż nic innego nie będzie dekodowane"""
+        nbytes = min(nbytes, self.capacity)
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.in_use + nbytes <= self.capacity, timeout=timeout):
+                raise ImageRejectedError(
+                    f"Obraz odrzucony - brak pamięci na dekodowanie ({nbytes / (1024*1024):.0f} MB) "
+                    f"po {timeout} s oczekiwania"
+                )
+            self.in_use += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        with self.condition:
+            self.in_use -= nbytes
+            self.condition.notify_all()
+
+
+DECODE_BUDGET = DecodeBudget()
+
+
+def read_image_header(image_bytes):
+    """Odczytuje format, tryb i wymiary z nagłówka bez dekodowania pikseli"""
+    image = Image.open(io.BytesIO(image_bytes))
+    return {
+        'format': image.format,
+        'mode': image.mode,
+        'size': image.size
+    }
+
+
+@contextmanager
+def open_image(image_bytes, max_pixels=MAX_IMAGE_PIXELS, target_size=None, budget=None):
+    """Otwiera i dekoduje obraz w granicach budżetu pikseli i pamięci.
+
+    Wymiary są sprawdzane w nagłówku przed dekodowaniem. JPEG ponad budżet pikseli jest
+    dekodowany w zmniejszonej rozdzielczości (tryb draft: 1/2, 1/4, 1/8); pozostałe formaty
+    ponad budżet są odrzucane. target_size pozwala od razu dekodować w rozmiarze zbliżonym
+    do docelowego. Dekodowanie czeka, aż w globalnym budżecie pamięci zwolni się miejsce.
+    """
+    budget = budget or DECODE_BUDGET
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError(f"Obraz odrzucony - {e}")
+    
+    width, height = image.size
+    reduction = 1
+    while reduction < 8 and (width // reduction) * (height // reduction) > max_pixels:
+        reduction *= 2
+    draft_size = (math.ceil(width / reduction), math.ceil(height / reduction))
+    if target_size:
+        draft_size = (min(draft_size[0], target_size[0]), min(draft_size[1], target_size[1]))
+    if draft_size != image.size:
+        image.draft(None, draft_size)
+    
+    if image.width * image.height > max_pixels:
+        raise ImageRejectedError(
+            f"Obraz odrzucony - {width}×{height} px przekracza limit {max_pixels / 1_000_000:.0f} Mpx"
+        )
+    
+    reserved = budget.acquire(image.width * image.height * BYTES_PER_PIXEL)
+    try:
+        image.load()
+        yield image
+    finally:
+        budget.release(reserved)
@@ -0,0 +1,281 @@
+import io
+import os
+from contextlib import contextmanager
+
+from PIL import Image
+
+from utils import image_guard
+from utils.image_guard import ImageRejectedError, open_image, read_image_header
+
+# ============================================
+# WSPÓLNE OPERACJE NA OBRAZACH
+# ============================================
+# Strony korzystają z operacji na bajtach (add_white_background, convert_to_png, normalize_image)
+# i z backendu (open / resize / encode), nie bezpośrednio z Pillow. Domyślny backend to Pillow;
+# jeśli zainstalowano pyvips (libvips), jest wybierany automatycznie dla formatów, które obsługuje.
+# Zmienna środowiskowa IMAGE_BACKEND=pillow|vips wymusza wybór.
+
+WHITE = (255, 255, 255)
+RESAMPLE_REDUCING_GAP = 2.0  # Najpierw szybkie Image.reduce, potem LANCZOS na ostatnim etapie
+
+
+def has_transparency(image):
+    """Sprawdza czy obraz (Pillow) faktycznie używa przezroczystości"""
+    if image.mode in ('RGBA', 'LA'):
+        # Kanał alfa bywa zapisany, ale w całości nieprzezroczysty
+        return image.getchannel('A').getextrema() != (255, 255)
+    if image.mode == 'P':
+        # Sprawdź czy paleta ma przezroczystość
+        return 'transparency' in image.info
+    return False
+
+
+def flatten_image(image):
+    """Nakłada obraz (Pillow) na białe tło - wynik w trybie RGB"""
+    if image.mode == 'RGB':
+        return image
+    if image.mode not in ('RGBA', 'LA', 'PA') and 'transparency' not in image.info:
+        return image.convert('RGB')
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, WHITE)
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+class PillowBackend:
+    """Backend domyślny - obsługuje wszystkie formaty zapisu Pillow"""
+    name = 'pillow'
+
+    def supports(self, save_format):
+        Image.init()
+        return save_format in Image.SAVE
+
+    def open(self, image_bytes, target_size=None):
+        """Dekoduje w granicach budżetu pamięci (image_guard); target_size pozwala dekodować JPEG w mniejszej rozdzielczości"""
+        return open_image(image_bytes, target_size=target_size)
+
+    def size(self, image):
+        return image.size
+
+    def has_transparency(self, image):
+        return has_transparency(image)
+
+    def flatten(self, image):
+        return flatten_image(image)
+
+    def convert_mode(self, image, mode):
+        """Tryb koloru 'RGB' lub 'L' (bez kanału alfa)"""
+        return image if image.mode == mode else image.convert(mode)
+
+    def resize(self, image, size, box=None):
+        if size == image.size and box is None:
+            return image
+        return image.resize(size, Image.LANCZOS, box=box, reducing_gap=RESAMPLE_REDUCING_GAP)
+
+    def encode(self, image, save_format, options):
+        # JPEG nie ma przezroczystości - spłaszczenie na białe tło
+        if save_format == 'JPEG' and image.mode in ('RGBA', 'LA', 'P'):
+            image = flatten_image(image)
+        elif save_format == 'PNG' and image.mode not in ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGB')  # Np. CMYK z JPEG
+        output = io.BytesIO()
+        image.save(output, format=save_format, **options)
+        return output.getvalue()
+
+
+class VipsBackend:
+    """Backend libvips (pyvips) - szybsze skalowanie i kodowanie, mniej pamięci na dużych obrazach"""
+    name = 'vips'
+    SAVE_SUFFIXES = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'TIFF': '.tif', 'AVIF': '.avif'}
+
+    def __init__(self):
+        import pyvips
+        self.pyvips = pyvips
+        self.formats = {
+            save_format for save_format, suffix in self.SAVE_SUFFIXES.items()
+            if self._saver_available(suffix)
+        }
+
+    def _saver_available(self, suffix):
+        try:
+            return bool(self.pyvips.vips_lib.vips_foreign_find_save_buffer(suffix.encode()))
+        except Exception:
+            return False
+
+    def supports(self, save_format):
+        return save_format in self.formats
+
+    @contextmanager
+    def open(self, image_bytes, target_size=None):
+        """Dekoduje z tymi samymi limitami co Pillow (wymiary z nagłówka, wspólny budżet pamięci)"""
+        header = read_image_header(image_bytes)
+        width, height = header['size']
+        shrink = 1
+        if header['format'] == 'JPEG':
+            # Odpowiednik trybu draft: zmniejszenie 1/2, 1/4, 1/8 już przy dekodowaniu
+            while shrink < 8 and (width // shrink) * (height // shrink) > image_guard.MAX_IMAGE_PIXELS:
+                shrink *= 2
+            if target_size:
+                while (shrink < 8 and width // (shrink * 2) >= target_size[0]
+                        and height // (shrink * 2) >= target_size[1]):
+                    shrink *= 2
+        if (width // shrink) * (height // shrink) > image_guard.MAX_IMAGE_PIXELS:
+            raise ImageRejectedError(
+                f"Obraz odrzucony - {width}×{height} px przekracza limit "
+                f"{image_guard.MAX_IMAGE_PIXELS / 1_000_000:.0f} Mpx"
+            )
+        
+        reserved = image_guard.DECODE_BUDGET.acquire((width // shrink) * (height // shrink) * image_guard.BYTES_PER_PIXEL)
+        try:
+            options = {'shrink': shrink} if shrink > 1 else {}
+            image = self.pyvips.Image.new_from_buffer(image_bytes, '', **options)
+            # Dekodowanie teraz, w granicach rezerwacji, a nie przy pierwszym zapisie
+            yield image.copy_memory()
+        finally:
+            image_guard.DECODE_BUDGET.release(reserved)
+
+    def size(self, image):
+        return (image.width, image.height)
+
+    def has_transparency(self, image):
+        return image.hasalpha() and image[image.bands - 1].min() < 255
+
+    def flatten(self, image):
+        if not image.hasalpha():
+            return image
+        return image.flatten(background=[255] * (image.bands - 1))
+
+    def convert_mode(self, image, mode):
+        if image.hasalpha():
+            image = image.extract_band(0, n=image.bands - 1)
+        return image.colourspace('b-w' if mode == 'L' else 'srgb')
+
+    def resize(self, image, size, box=None):
+        if box is not None:
+            left, top, right, bottom = (round(value) for value in box)
+            image = image.crop(left, top, right - left, bottom - top)
+        if size == (image.width, image.height):
+            return image
+        # size='force' - dokładnie podane wymiary, jak w Pillow
+        return image.thumbnail_image(size[0], height=size[1], size='force')
+
+    def encode(self, image, save_format, options):
+        if save_format == 'JPEG':
+            image = self.flatten(image)
+            return image.write_to_buffer('.jpg', Q=options.get('quality', 95), optimize_coding=True)
+        if save_format == 'PNG':
+            return image.write_to_buffer('.png', compression=9)
+        if save_format == 'WEBP':
+            save = {'Q': options.get('quality', 80), 'lossless': options.get('lossless', False)}
+            if 'method' in options:
+                save['effort'] = options['method']
+            return image.write_to_buffer('.webp', **save)
+        if save_format == 'AVIF':
+            save = {'Q': options.get('quality', 80)}
+            if 'speed' in options:
+                save['effort'] = min(10 - options['speed'], 9)  # libvips: 0-9, większy = wolniej
+            return image.write_to_buffer('.avif', **save)
+        return image.write_to_buffer(self.SAVE_SUFFIXES[save_format])
+
+
+PILLOW = PillowBackend()
+_vips_backend = None
+
+
+def vips_available():
+    """Sprawdza czy zainstalowano opcjonalną bibliotekę pyvips (wraz z libvips)."""
+    global _vips_backend
+    if _vips_backend is None:
+        try:
+            _vips_backend = VipsBackend()
+        except (ImportError, OSError):
+            _vips_backend = False
+    return _vips_backend is not False
+
+
+def available_backends():
+    """Backendy dostępne w tej instalacji (Pillow zawsze pierwszy)"""
+    backends = [PILLOW]
+    if vips_available():
+        backends.append(_vips_backend)
+    return backends
+
+
+def get_backend(save_format=None):
+    """Backend dla formatu zapisu - libvips, jeśli jest dostępny i obsługuje format, w przeciwnym razie Pillow"""
+    preferred = os.environ.get('IMAGE_BACKEND', '').lower()
+    if preferred != 'pillow' and vips_available():
+        if save_format is None or _vips_backend.supports(save_format):
+            return _vips_backend
+    return PILLOW
+
+
+def add_white_background(image_bytes, backend=None):
+    """Dodaje białe tło do obrazu z przezroczystością (format JPEG zostaje, pozostałe zapisywane jako PNG)"""
+    try:
+        source_format = read_image_header(image_bytes)['format']
+        save_format = 'JPEG' if source_format in ['JPEG', 'JPG'] else 'PNG'
+        backend = backend or get_backend(save_format)
+        with backend.open(image_bytes) as image:
+            if not backend.has_transparency(image):
+                # Obraz nie ma przezroczystości, zwróć oryginalny
+                return image_bytes
+            return backend.encode(backend.flatten(image), save_format, {'quality': 95, 'optimize': True})
+    
+    except ImageRejectedError:
+        # Odrzucenie przez limity pamięci musi trafić do raportu błędów
+        raise
+    except Exception:
+        # W razie błędu zwróć oryginalny obraz
+        return image_bytes
+
+
+def convert_to_png(image_bytes, remove_transparency=False, backend=None):
+    """Konwertuje obraz na PNG, opcjonalnie usuwając przezroczystość - zwraca (dane, czy_usunięto_przezroczystość)"""
+    backend = backend or get_backend('PNG')
+    try:
+        with backend.open(image_bytes) as image:
+            transparent = backend.has_transparency(image)
+            if remove_transparency or not transparent:
+                # Bez przezroczystości zapis w RGB - nieużywany kanał alfa tylko powiększa plik
+                image = backend.flatten(image)
+            return backend.encode(image, 'PNG', {'optimize': True}), remove_transparency and transparent
+    except ImageRejectedError:
+        raise
+    except Exception as e:
+        raise Exception(f"Błąd konwersji do PNG: {e}")
+
+
+def normalize_image(image_bytes, spec, output_extension, remove_transparency=True, backend=None):
+    """Dopasowuje obraz do specyfikacji katalogu (maks. wymiary, tryb koloru, format). Zwraca (dane, zmieniono, usunięto_przezroczystość)"""
+    header = read_image_header(image_bytes)
+    max_size = (spec['max_width'], spec['max_height'])
+    save_format = Image.registered_extensions()[output_extension]
+    backend = backend or get_backend(save_format)
+    width, height = header['size']
+    resized = width > max_size[0] or height > max_size[1]
+    target_mode = spec.get('mode')
+    
+    # JPEG dekodowany od razu w zmniejszonej rozdzielczości (draft / shrink 1/2, 1/4, 1/8) -
+    # pełna rozdzielczość nigdy nie trafia do pamięci
+    with backend.open(image_bytes, target_size=max_size) as image:
+        if resized:
+            scale = min(max_size[0] / width, max_size[1] / height)
+            image = backend.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))))
+        
+        needs_flatten = backend.has_transparency(image) and (
+            remove_transparency or save_format == 'JPEG' or target_mode is not None
+        )
+        if needs_flatten:
+            image = backend.flatten(image)
+        if target_mode:
+            image = backend.convert_mode(image, target_mode)
+        
+        if (not resized and not needs_flatten and header['format'] == save_format
+                and target_mode in (None, header['mode'])):
+            # Obraz spełnia już specyfikację - zachowaj oryginał bez ponownej kompresji
+            return image_bytes, False, False
+        
+        options = {'quality': 95, 'optimize': True} if save_format == 'JPEG' else {'optimize': True}
+        return backend.encode(image, save_format, options), True, needs_flatten
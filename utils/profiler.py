@@ -0,0 +1,189 @@
+import cProfile
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+# ============================================
+# PROFILOWANIE DŁUGICH OPERACJI
+# ============================================
+# Włączane parametrem adresu ?profile=1 (jak ?health=check w app.py). Profilowany jest tylko wątek
+# skryptu sesji, która włączyła profilowanie - praca w wątkach (pule pobierania) i procesach
+# roboczych (konwersja HTML i obrazów) widoczna jest jako oczekiwanie na wyniki.
+# Do Pythona 3.11 cProfile mierzy pojedynczy wątek. Od 3.12 cProfile działa dla całego procesu
+# (i tylko jeden naraz), więc wątek skryptu jest wtedy próbkowany z osobnego wątku.
+
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_TOP_FUNCTIONS = 30
+SAMPLE_INTERVAL = 0.005  # Odstęp próbek stosu w trybie próbkowania
+SAMPLING = sys.version_info >= (3, 12)
+
+
+def profiling_enabled():
+    """Czy w adresie strony włączono profilowanie (?profile=1)"""
+    return st.query_params.get(PROFILE_QUERY_PARAM) == '1'
+
+
+class StackSampler:
+    """Próbkuje stos jednego wątku - bez haków profilujących, więc nie wpływa na inne wątki i sesje"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()
+        self.cumulative = Counter()
+        self.callers = defaultdict(Counter)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if not stack:
+                continue
+            self.samples += 1
+            self.own[stack[0]] += 1
+            for function in set(stack):  # Rekurencja liczona raz
+                self.cumulative[function] += 1
+            for callee, caller in zip(stack, stack[1:]):
+                self.callers[callee][caller] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def stats(self, wall_seconds):
+        """Statystyki w formacie pstats - liczba próbek zamiast liczby wywołań, czas z udziału próbek"""
+        per_sample = wall_seconds / self.samples if self.samples else 0.0
+        return {
+            function: (
+                count,
+                count,
+                self.own[function] * per_sample,
+                count * per_sample,
+                {caller: (n, n, n * per_sample, n * per_sample) for caller, n in self.callers[function].items()},
+            )
+            for function, count in self.cumulative.items()
+        }
+
+
+class RunProfiler:
+    """Profil wątku skryptu: cProfile lub (Python 3.12+) próbkowanie stosu"""
+
+    def __init__(self):
+        self.sampling = SAMPLING
+        self.wall_seconds = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.sampling:
+            self.profiler = StackSampler(threading.get_ident())
+            self.profiler.start()
+        else:
+            # Do Pythona 3.11 włącza profilowanie tylko dla bieżącego wątku
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.sampling:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        self.wall_seconds = time.perf_counter() - self.started
+
+    def stats(self):
+        """Statystyki w formacie pstats ({(plik, linia, funkcja): (cc, nc, tt, ct, wywołujący)})"""
+        if self.sampling:
+            return self.profiler.stats(self.wall_seconds)
+        try:
+            return pstats.Stats(self.profiler).stats
+        except TypeError:
+            return {}  # Nic nie zmierzono
+
+
+def top_functions(stats, sort_key, limit=PROFILE_TOP_FUNCTIONS):
+    """Najdroższe funkcje wg czasu łącznego ('cumulative') lub własnego ('tottime')"""
+    rows = []
+    for (file_name, line, function), (_, calls, own_time, cumulative_time, _) in stats.items():
+        rows.append({
+            'Funkcja': function,
+            'Miejsce': f"{'/'.join(file_name.split('/')[-2:])}:{line}",
+            'Wywołania': calls,
+            'Czas własny (s)': round(own_time, 4),
+            'Czas łączny (s)': round(cumulative_time, 4),
+        })
+    column = 'Czas łączny (s)' if sort_key == 'cumulative' else 'Czas własny (s)'
+    return sorted(rows, key=lambda row: row[column], reverse=True)[:limit]
+
+
+@contextmanager
+def profile_run(name, enabled=None):
+    """Profiluje blok kodu, jeśli profilowanie jest włączone - wynik trafia do sesji (show_profile)"""
+    if enabled is None:
+        enabled = profiling_enabled()
+    if not enabled:
+        yield
+        return
+    
+    profiler = RunProfiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        stats = profiler.stats()
+        st.session_state.setdefault('profiles', {})[name] = {
+            'wall_seconds': profiler.wall_seconds,
+            'sampling': profiler.sampling,
+            'cumulative': top_functions(stats, 'cumulative'),
+            'own': top_functions(stats, 'tottime'),
+            # Format pliku jak pstats.Stats.dump_stats - otwiera go snakeviz lub python -m pstats
+            'data': marshal.dumps(stats),
+            'created': datetime.now(),
+        }
+
+
+def show_profile(name):
+    """Panel z najdroższymi funkcjami ostatniego profilu i plikiem .prof do pobrania"""
+    profile = st.session_state.get('profiles', {}).get(name)
+    if not profile or not profiling_enabled():
+        return
+    
+    mode = "próbkowanie" if profile['sampling'] else "cProfile"
+    with st.expander(f"🔬 Profil: {name} ({profile['wall_seconds']:.1f} s, {mode})"):
+        st.caption(
+            "Czas łączny obejmuje wywołane funkcje, czas własny - tylko kod samej funkcji. "
+            "Profilowany jest wątek skryptu - praca w wątkach i procesach roboczych widoczna jest "
+            "jako oczekiwanie na wyniki."
+            + (" W trybie próbkowania kolumna Wywołania to liczba próbek." if profile['sampling'] else "")
+        )
+        tab_cumulative, tab_own = st.tabs(["Czas łączny", "Czas własny"])
+        with tab_cumulative:
+            st.dataframe(profile['cumulative'], width="stretch", hide_index=True)
+        with tab_own:
+            st.dataframe(profile['own'], width="stretch", hide_index=True)
+        
+        slug = name.lower().replace(' ', '_')
+        st.download_button(
+            label="⬇️ Pobierz profil (.prof)",
+            data=profile['data'],
+            file_name=f"profil_{slug}_{profile['created'].strftime('%Y%m%d_%H%M%S')}.prof",
+            mime="application/octet-stream",
+            key=f"profile_download_{slug}",
+            help="Do analizy offline: snakeviz plik.prof lub python -m pstats plik.prof"
+        )